@@ -0,0 +1,242 @@
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from . import sql
+from . normalize import hotel_keys
+from . delta import observation_table
+
+logger = logging.getLogger("hotels-scraper.aggregates.aggregates")
+
+# Lead time buckets (days between search and checkin), as lower bounds
+LEAD_BUCKETS = (0, 1, 3, 7, 14, 30, 60, 90, 180)
+
+DESTINATION = ("city", "state", "country")
+
+
+def lead_bucket(days):
+    """
+    Returns (label, lower bound) of the lead time buckets for a Series of `days_from_search`.
+    """
+    days = pd.to_numeric(days).clip(lower=0)
+    bounds = np.array(LEAD_BUCKETS)
+    lower = bounds[np.searchsorted(bounds, days.to_numpy(), side="right") - 1]
+    upper = np.append(bounds[1:], np.inf)[np.searchsorted(bounds, days.to_numpy(), side="right") - 1]
+    labels = [f"{lo}-{int(hi) - 1}" if hi != np.inf else f"{lo}+" for lo, hi in zip(lower, upper)]
+    return pd.Series(labels, index=days.index), pd.Series(lower, index=days.index)
+
+
+def _param(value):
+    """
+    Formats datetimes the way SQLAlchemy stores them in SQLite, so that they compare correctly.
+    """
+    if isinstance(value, (datetime, pd.Timestamp)):
+        return pd.Timestamp(value).strftime("%Y-%m-%d %H:%M:%S.%f")
+    return value
+
+
+def _group_id(df, columns):
+    return df[list(columns)].astype(str).apply("|".join, axis=1)
+
+
+class PriceAggregates(object):
+
+    """
+    Maintains precomputed price aggregates, grouped by checkin date and lead time bucket:
+
+        price_aggregates        per destination: observations, sales, min/median/max price and the cheapest hotel
+        hotel_price_aggregates  per hotel: observations, sales, min/median/max and latest observed price
+
+    Prices are the price actually charged (the sale price when a listing is on sale). Stored
+    searches are collected with `add` and `flush` recomputes every (destination, checkin date)
+    group they touched from the base tables, using the `search` (city, checkin) and hotels
+    `search_id` indexes. Medians are not decomposable, so groups are recomputed rather than merged.
+
+    Args:
+        conn (Connection): Database connection (of the thread writing the searches)
+        schema_mode (str, optional): Layout of the hotel tables, "wide" or "normalized". Defaults to "wide".
+        every (int, optional): Flush after this many added searches. Defaults to 1.
+        delta (bool, optional): Hotels are stored in delta mode (see `DeltaStore`), read the unchanged
+            observations as well. Defaults to False.
+    """
+
+    def __init__(self, conn, schema_mode="wide", every=1, delta=False):
+        self.conn = conn
+        self.schema_mode = schema_mode
+        self.delta = delta
+        self.every = every
+        self.pending = set()
+        self.n_added = 0
+
+    def add(self, df_search):
+        """
+        Marks the groups of stored searches as stale, flushing every `every` searches.
+        """
+        for _, row in df_search.iterrows():
+            checkin = pd.to_datetime(row["checkin_datetime"]).normalize().to_pydatetime()
+            self.pending.add(tuple(row[key] for key in DESTINATION) + (checkin,))
+            self.n_added += 1
+        if self.n_added >= self.every:
+            self.flush()
+
+    def observations(self, city, state, country, checkin_date):
+        """
+        Returns the hotel observations of all searches for a destination and checkin date.
+        """
+        table = observation_table(self.schema_mode, delta=self.delta)
+        query = f"SELECT s.search_datetime, s.days_from_search, h.name, h.address, h.price, h.price_sale " \
+                f"FROM search s JOIN {table} h ON h.search_id = s.id " \
+                f"WHERE s.city = ? AND s.state = ? AND s.country = ? AND s.checkin_datetime >= ? AND s.checkin_datetime < ?"
+        rows = self.conn.execute(query, city, state, country, _param(checkin_date),
+                                 _param(checkin_date + timedelta(days=1))).fetchall()
+        df = pd.DataFrame.from_records(rows, columns=["search_datetime", "days_from_search", "name", "address", "price", "price_sale"])
+        df["price"] = pd.to_numeric(df["price"]).astype(float)
+        df["price_sale"] = pd.to_numeric(df["price_sale"]).astype(float)
+        return df
+
+    def compute(self, df, city, state, country, checkin_date):
+        """
+        Computes both aggregate tables for the observations of one destination and checkin date.
+
+        Returns:
+            tuple: (price_aggregates DataFrame, hotel_price_aggregates DataFrame), indexed by id
+        """
+        df = df.assign(
+            paid=df["price_sale"].where(df["price_sale"].notna(), df["price"]),
+            on_sale=df["price_sale"].notna(),
+            search_datetime=pd.to_datetime(df["search_datetime"]),
+            hotel_key=hotel_keys(df) if not df.empty else pd.Series(dtype=int),
+        )
+        df["lead_bucket"], df["lead_days_min"] = lead_bucket(df["days_from_search"])
+        df = df[df["paid"].notna()]
+        now = datetime.now()
+        key = {"city": city, "state": state, "country": country, "checkin_date": checkin_date}
+
+        df = df.sort_values("search_datetime")
+        groups = df.groupby(["lead_bucket", "lead_days_min"])
+        df_city = groups.agg(n_observations=("paid", "size"), n_sale=("on_sale", "sum"), price_min=("paid", "min"),
+                             price_median=("paid", "median"), price_max=("paid", "max")).reset_index()
+        cheapest = df.loc[groups["paid"].idxmin().to_numpy(), ["lead_bucket", "hotel_key", "name"]]
+        cheapest = cheapest.rename(columns={"hotel_key": "cheapest_hotel_key", "name": "cheapest_name"})
+        df_city = df_city.merge(cheapest, on="lead_bucket", how="left").assign(updated_at=now, **key)
+        df_city["id"] = _group_id(df_city, DESTINATION + ("checkin_date", "lead_bucket"))
+
+        groups = df.groupby(["hotel_key", "lead_bucket", "lead_days_min"])
+        df_hotel = groups.agg(name=("name", "last"), n_observations=("paid", "size"), n_sale=("on_sale", "sum"),
+                              price_min=("paid", "min"), price_median=("paid", "median"), price_max=("paid", "max"),
+                              latest_price=("paid", "last"), latest_search_datetime=("search_datetime", "last")).reset_index()
+        df_hotel = df_hotel.assign(updated_at=now, **key)
+        df_hotel["id"] = _group_id(df_hotel, ("hotel_key", "checkin_date", "lead_bucket"))
+        return df_city.set_index("id"), df_hotel.set_index("id")
+
+    def refresh(self, city, state, country, checkin_date):
+        """
+        Recomputes the aggregates of one destination and checkin date.
+        """
+        df = self.observations(city, state, country, checkin_date)
+        df_city, df_hotel = self.compute(df, city, state, country, checkin_date)
+        # A savepoint inside a `TransactionBatch`, a failed refresh leaves the searches of the batch alone
+        with sql.begin(self.conn):
+            for table in ("price_aggregates", "hotel_price_aggregates"):
+                self.conn.execute(f"DELETE FROM {table} WHERE city = ? AND state = ? AND country = ? AND checkin_date = ?",
+                                  city, state, country, _param(checkin_date))
+            sql.to_sql(df_city, "price_aggregates", self.conn)
+            sql.to_sql(df_hotel, "hotel_price_aggregates", self.conn)
+
+    def flush(self):
+        """
+        Recomputes all stale groups.
+        """
+        for group in sorted(self.pending, key=str):
+            try:
+                self.refresh(*group)
+            except Exception as error:
+                logger.error(f"Could not update the aggregates of {group} ({error!r})")
+        self.pending.clear()
+        self.n_added = 0
+
+    def rebuild(self):
+        """
+        Recomputes the aggregates of every destination and checkin date in the database.
+        """
+        rows = self.conn.execute("SELECT DISTINCT city, state, country, date(checkin_datetime) FROM search").fetchall()
+        msg = f"[~] Rebuilding price aggregates of {len(rows)} destination/checkin dates ..."
+        logger.info(msg)
+        print(msg)
+        for city, state, country, checkin_date in rows:
+            self.pending.add((city, state, country, pd.to_datetime(checkin_date).to_pydatetime()))
+        self.flush()
+
+
+def _read(conn, table, columns, filters, order_by):
+    query = f"SELECT {', '.join(columns)} FROM {table}"
+    params = []
+    clauses = []
+    for column, op, value in filters:
+        if value is not None:
+            clauses.append(f"{column} {op} ?")
+            params.append(_param(value))
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += f" ORDER BY {order_by}"
+    return pd.DataFrame.from_records(conn.execute(query, *params).fetchall(), columns=columns)
+
+
+def price_history(conn, city, start=None, end=None, lead_bucket=None):
+    """
+    Price statistics of a city per checkin date and lead time bucket.
+
+    Args:
+        conn (Connection): Database connection
+        city (str): City
+        start (datetime, optional): First checkin date
+        end (datetime, optional): Last checkin date
+        lead_bucket (str, optional): Only this lead time bucket (e.g. "7-13")
+
+    Returns:
+        pd.DataFrame: checkin_date, lead_bucket, n_observations, n_sale, price_min, price_median, price_max,
+            cheapest_name, cheapest_hotel_key
+    """
+    columns = ["checkin_date", "lead_bucket", "n_observations", "n_sale", "price_min", "price_median", "price_max",
+               "cheapest_name", "cheapest_hotel_key"]
+    filters = [("city", "=", city), ("checkin_date", ">=", start), ("checkin_date", "<=", end), ("lead_bucket", "=", lead_bucket)]
+    df = _read(conn, "price_aggregates", columns, filters, "checkin_date, lead_days_min")
+    df["checkin_date"] = pd.to_datetime(df["checkin_date"])
+    return df
+
+
+def cheapest_hotels(conn, city, start=None, end=None):
+    """
+    Cheapest hotel of a city per checkin date (over all lead times).
+
+    Returns:
+        pd.DataFrame: checkin_date, cheapest_name, cheapest_hotel_key, price_min
+    """
+    history = price_history(conn, city, start=start, end=end)
+    if history.empty:
+        return history
+    idx = history.groupby("checkin_date")["price_min"].idxmin()
+    return history.loc[idx, ["checkin_date", "cheapest_name", "cheapest_hotel_key", "price_min"]].reset_index(drop=True)
+
+
+def hotel_history(conn, hotel_key, start=None, end=None):
+    """
+    Price statistics and latest observed price of a hotel per checkin date and lead time bucket.
+    """
+    columns = ["checkin_date", "lead_bucket", "name", "n_observations", "n_sale", "price_min", "price_median",
+               "price_max", "latest_price", "latest_search_datetime"]
+    filters = [("hotel_key", "=", int(hotel_key)), ("checkin_date", ">=", start), ("checkin_date", "<=", end)]
+    df = _read(conn, "hotel_price_aggregates", columns, filters, "checkin_date, lead_days_min")
+    df["checkin_date"] = pd.to_datetime(df["checkin_date"])
+    return df
+
+
+def sale_frequency(conn, city, start=None, end=None):
+    """
+    Share of observations on sale per lead time bucket.
+    """
+    filters = [("city", "=", city), ("checkin_date", ">=", start), ("checkin_date", "<=", end)]
+    df = _read(conn, "price_aggregates", ["lead_bucket", "lead_days_min", "n_observations", "n_sale"], filters, "lead_days_min")
+    df = df.groupby(["lead_days_min", "lead_bucket"], as_index=False)[["n_observations", "n_sale"]].sum()
+    df["sale_share"] = df["n_sale"] / df["n_observations"]
+    return df.drop(columns="lead_days_min")
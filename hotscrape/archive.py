@@ -0,0 +1,96 @@
+import os
+import gzip
+import hashlib
+import logging
+import tempfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger("hotels-scraper.archive.archive")
+
+CODEC_EXTENSIONS = {"zstd": "zst", "gzip": "gz"}
+
+
+def compress(data, codec):
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("The zstd codec requires the `zstandard` package")
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def decompress(data, codec):
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("The zstd codec requires the `zstandard` package")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "gzip":
+        return gzip.decompress(data)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+class PageArchive(object):
+
+    """
+    Content-addressed store of compressed raw result pages.
+
+    Pages are keyed by the SHA-256 of their (uncompressed) html and stored as
+    `<root>/<hash[:2]>/<hash>.<ext>`, so identical pages are only stored once.
+
+    Args:
+        root (str): Archive directory
+        codec (str, optional): "zstd" or "gzip". Defaults to "zstd" if the `zstandard` package is installed, else "gzip".
+    """
+
+    def __init__(self, root, codec=None):
+        self.root = root
+        self.codec = codec or ("zstd" if zstandard is not None else "gzip")
+        if self.codec not in CODEC_EXTENSIONS:
+            raise ValueError(f"Unknown codec: {self.codec}")
+
+    def path(self, digest, codec=None):
+        ext = CODEC_EXTENSIONS[codec or self.codec]
+        return os.path.join(self.root, digest[:2], f"{digest}.{ext}")
+
+    def put(self, page):
+        """
+        Stores a page.
+
+        Args:
+            page (str): Raw html
+
+        Returns:
+            tuple: (content hash, codec)
+        """
+        data = page.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so readers never see partial blobs
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    file.write(compress(data, self.codec))
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            logger.info(f"Archived page {digest} ({len(data)} bytes)")
+        return digest, self.codec
+
+    def get(self, digest, codec=None):
+        """
+        Returns the raw html of an archived page.
+        """
+        codec = codec or self.codec
+        with open(self.path(digest, codec), "rb") as file:
+            return decompress(file.read(), codec).decode("utf-8")
+
+    def __contains__(self, digest):
+        return any(os.path.exists(self.path(digest, codec)) for codec in CODEC_EXTENSIONS)
@@ -0,0 +1,171 @@
+"""
+Offline benchmark of the scraping stages against a local stand-in site.
+
+    python -m hotscrape.bench --page tests/data/hotels_page.html --baseline benchmarks/baseline.json
+
+Times `Scraper.run` (only with --browser, requires geckodriver), `get_attributes`, `parse` and
+`sql.to_sql` on a page with `--listings` listings, and compares the medians with a stored
+baseline. Exits with status 1 if any stage is slower than the baseline by more than `--tolerance`.
+
+Absolute timings depend on the machine, so stages are compared relative to a fixed reference
+workload timed in the same run (`relative`: stage seconds / reference seconds). The committed
+baseline is only a rough guide on other machines; regenerate it locally with --save-baseline
+before comparing changes.
+
+The stand-in cycles the cards of the recorded page, which includes a fully booked hotel without
+a price. `parse` drops those, so fewer rows than listings are stored (200 of 300 by default).
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+import pandas as pd
+from . import sql
+from . parser import parse
+from . scraper import HotelsScraper
+from . standin import StandInSite
+from . utils import load_schema
+
+STAGES = ("scrape", "get_attributes", "parse", "to_sql")
+
+SEARCH = {
+    "destination": {"city": "Las Vegas", "state": "Nevada", "country": "United States of America"},
+    "checkin_datetime": "2020-06-30",
+}
+
+
+def reference_workload():
+    """
+    Fixed pure Python workload, its duration tracks the speed of the machine and interpreter.
+    """
+    return sum(i * i % 7 for i in range(300000))
+
+
+def time_call(func, repeat):
+    """
+    Calls `func` `repeat` times. Returns (median seconds, result of the last call).
+    """
+    timings = []
+    res = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), res
+
+
+def run_benchmark(page, schema, listings=300, repeat=5, browser=False, loader_delay=0.05):
+    """
+    Runs all stages and returns a results dictionary with the median seconds per stage (`stages`)
+    and relative to the reference workload (`relative`).
+    """
+    site = StandInSite(page, total=listings, page_size=50, loader_delay=loader_delay)
+    timings = {}
+    with site.serve() as server:
+        scraper = HotelsScraper()
+        scraper.base_url = server.url
+        if browser:
+            try:
+                timings["scrape"], _ = time_call(lambda: scraper.run(dict(SEARCH)), repeat)
+            finally:
+                scraper.close()
+
+        full_page = site.render_page(all_listings=True)
+        timings["get_attributes"], attributes = time_call(lambda: scraper.get_attributes(full_page), repeat)
+        timings["parse"], _ = time_call(lambda: parse(pd.DataFrame(attributes)), repeat)
+
+        search_dict = scraper.ensure_search_format(dict(SEARCH))
+        df_search, df_attributes = scraper.get_dfs(search_dict, attributes)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # Only the writes are timed: a run creates its database and reflects its tables once
+            conns = [sql.create_database(os.path.join(tmp, f"bench_{i}"), schema) for i in range(repeat)]
+            for conn in conns:
+                sql.get_table("search", conn)
+                sql.get_table("hotels", conn)
+            pending = iter(conns)
+
+            def write():
+                conn = next(pending)
+                sql.to_sql(df_search, "search", conn)
+                sql.to_sql(df_attributes, "hotels", conn)
+            timings["to_sql"], _ = time_call(write, repeat)
+            for conn in conns:
+                conn.close()
+
+    reference, _ = time_call(reference_workload, repeat)
+    return {
+        "listings": len(attributes["name"]),
+        "rows": len(df_attributes),
+        "repeat": repeat,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "reference": reference,
+        "stages": timings,
+        "relative": {stage: seconds / reference for stage, seconds in timings.items()},
+    }
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Returns a list of (stage, relative time, baseline relative time) for stages slower than the
+    baseline by more than `tolerance`, both relative to the reference workload of their own run.
+    """
+    regressions = []
+    for stage, ratio in results["relative"].items():
+        reference = baseline.get("relative", {}).get(stage)
+        if reference and ratio > reference * (1 + tolerance):
+            regressions.append((stage, ratio, reference))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline hotscrape benchmark")
+    parser.add_argument("--page", default="tests/data/hotels_page.html", help="Recorded results page")
+    parser.add_argument("-s", "--schema", default="db_schema.yml", help="Database schema file")
+    parser.add_argument("--listings", type=int, default=300, help="Number of listings served by the stand-in")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions per stage")
+    parser.add_argument("--browser", action="store_true", help="Also time Scraper.run with a real browser")
+    parser.add_argument("--baseline", default="benchmarks/baseline.json", help="Baseline results file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown relative to the baseline")
+    args = parser.parse_args(argv)
+
+    with open(args.page) as file:
+        page = file.read()
+    results = run_benchmark(page, load_schema(args.schema), listings=args.listings, repeat=args.repeat, browser=args.browser)
+
+    print(f"[~] Benchmark ({results['listings']} listings, {results['rows']} rows with a price, median of {results['repeat']}):")
+    print(f"\t{'reference':<15} {results['reference'] * 1000:10.2f} ms")
+    for stage in STAGES:
+        if stage in results["stages"]:
+            print(f"\t{stage:<15} {results['stages'][stage] * 1000:10.2f} ms {results['relative'][stage]:8.2f}x reference")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=4)
+        print(f"[~] Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"[!] No baseline at {args.baseline}")
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if "relative" not in baseline:
+        print(f"[!] Baseline {args.baseline} has no relative timings, regenerate it with --save-baseline")
+        return 0
+    regressions = compare(results, baseline, tolerance=args.tolerance)
+    for stage, ratio, reference in regressions:
+        print(f"[!] Regression in {stage}: {ratio:.2f}x vs {reference:.2f}x reference in the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+import socket
+import select
+import logging
+import threading
+import http.client
+from fnmatch import fnmatch
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from . driver_pool import create_driver
+
+logger = logging.getLogger("hotels-scraper.blocking.blocking")
+
+# Domains (matched with their subdomains) and URL patterns the results page does not need
+DEFAULT_BLOCKLIST = (
+    # Ads and analytics
+    "doubleclick.net", "googlesyndication.com", "googleadservices.com", "googletagmanager.com",
+    "googletagservices.com", "google-analytics.com", "analytics.google.com", "facebook.net", "facebook.com",
+    "connect.facebook.net", "criteo.com", "criteo.net", "adnxs.com", "taboola.com", "outbrain.com",
+    "hotjar.com", "bat.bing.com", "scorecardresearch.com", "quantserve.com", "demdex.net", "omtrdc.net",
+    "adsrvr.org", "rubiconproject.com", "pubmatic.com", "optimizely.com", "newrelic.com", "nr-data.net",
+    "akstat.io", "go-mpulse.net", "cquotient.com", "tiqcdn.com", "tealiumiq.com", "clicktale.net",
+    # Maps and fonts
+    "maps.googleapis.com", "maps.gstatic.com", "fonts.googleapis.com", "fonts.gstatic.com", "use.typekit.net",
+    # Images, fonts and media (plain http only, https requests only expose their host)
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.svg", "*.ico", "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.mp4", "*.webm",
+)
+
+# Firefox preferences of the lean profile: no images, web fonts, media, prefetching or background traffic
+LEAN_PREFERENCES = {
+    "permissions.default.image": 2,
+    "gfx.downloadable_fonts.enabled": False,
+    "browser.display.use_document_fonts": 0,
+    "media.autoplay.default": 5,
+    "media.peerconnection.enabled": False,
+    "network.prefetch-next": False,
+    "network.dns.disablePrefetch": True,
+    "network.http.speculative-parallel-limit": 0,
+    "network.predictor.enabled": False,
+    "browser.safebrowsing.malware.enabled": False,
+    "browser.safebrowsing.phishing.enabled": False,
+    "browser.safebrowsing.downloads.enabled": False,
+    "toolkit.telemetry.enabled": False,
+    "datareporting.healthreport.uploadEnabled": False,
+    "datareporting.policy.dataSubmissionEnabled": False,
+    "app.update.enabled": False,
+    "extensions.update.enabled": False,
+    "browser.newtabpage.enabled": False,
+    "browser.startup.homepage": "about:blank",
+}
+
+
+def load_blocklist(path):
+    """
+    Reads a blocklist file: one domain or URL pattern per line, `#` starts a comment.
+    """
+    with open(path) as file:
+        lines = (line.split("#", 1)[0].strip() for line in file)
+        return tuple(line for line in lines if line)
+
+
+class Blocklist(object):
+
+    """
+    Matches requests against blocklist entries.
+
+    Entries without wildcards are domains and also match their subdomains. Entries with wildcards
+    are shell-style patterns matched against the full URL (https requests made through a proxy
+    tunnel only expose their host, so they are matched as `https://<host>/`).
+    """
+
+    def __init__(self, entries=DEFAULT_BLOCKLIST):
+        self.domains = tuple(entry.lower() for entry in entries if "*" not in entry and "?" not in entry)
+        self.patterns = tuple(entry.lower() for entry in entries if "*" in entry or "?" in entry)
+
+    def is_blocked(self, host, url=None):
+        host = (host or "").lower()
+        if any(host == domain or host.endswith("." + domain) for domain in self.domains):
+            return True
+        url = (url or f"https://{host}/").lower()
+        return any(fnmatch(url, pattern) or fnmatch(urlsplit(url).path, pattern) for pattern in self.patterns)
+
+
+class BlockingProxy(object):
+
+    """
+    Local HTTP(S) proxy that refuses blocklisted requests and counts the traffic of allowed ones.
+
+    https requests are tunnelled (CONNECT) without being decrypted, so they are filtered by host only.
+    Traffic is therefore counted in connections: one per plain http request, one per tunnel (which
+    carries any number of https requests).
+
+    Args:
+        blocklist (iterable, optional): Blocklist entries, see `Blocklist`. Defaults to `DEFAULT_BLOCKLIST`.
+        host (str, optional): Interface to listen on. Defaults to "127.0.0.1".
+        port (int, optional): Port to listen on, 0 picks a free port. Defaults to 0.
+        timeout (float, optional): Socket timeout in seconds for upstream connections. Defaults to 30.
+    """
+
+    def __init__(self, blocklist=DEFAULT_BLOCKLIST, host="127.0.0.1", port=0, timeout=30):
+        self.blocklist = Blocklist(blocklist)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.blocked = 0
+        self.bytes = 0
+        self.httpd = ThreadingHTTPServer((host, port), self.handler())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="hotscrape-proxy", daemon=True)
+        self.thread.start()
+
+    @property
+    def address(self):
+        return self.httpd.server_address[:2]
+
+    def _count(self, blocked=False, n_bytes=0):
+        with self._lock:
+            self.connections += 1
+            self.blocked += int(blocked)
+            self.bytes += n_bytes
+
+    def _add_bytes(self, n_bytes):
+        with self._lock:
+            self.bytes += n_bytes
+
+    def stats(self):
+        """
+        Returns the totals so far: connections handled (plain requests and tunnels), connections
+        blocked and bytes received from upstream.
+        """
+        with self._lock:
+            return {"connections": self.connections, "blocked": self.blocked, "bytes": self.bytes}
+
+    def handler(self):
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_CONNECT(self):
+                host, _, port = self.path.rpartition(":")
+                if proxy.blocklist.is_blocked(host):
+                    proxy._count(blocked=True)
+                    self.send_error(403, "Blocked")
+                    return
+                try:
+                    upstream = socket.create_connection((host, int(port)), timeout=proxy.timeout)
+                except OSError as error:
+                    proxy._count()
+                    self.send_error(502, str(error))
+                    return
+                proxy._count()
+                self.send_response(200, "Connection Established")
+                self.end_headers()
+                self.close_connection = True
+                self._tunnel(upstream)
+
+            def _tunnel(self, upstream):
+                sockets = [self.connection, upstream]
+                try:
+                    while True:
+                        readable, _, errored = select.select(sockets, [], sockets, proxy.timeout)
+                        if errored or not readable:
+                            return
+                        for sock in readable:
+                            data = sock.recv(65536)
+                            if not data:
+                                return
+                            if sock is upstream:
+                                proxy._add_bytes(len(data))
+                                self.connection.sendall(data)
+                            else:
+                                upstream.sendall(data)
+                except OSError:
+                    return
+                finally:
+                    upstream.close()
+
+            def _forward(self):
+                url = urlsplit(self.path)
+                if proxy.blocklist.is_blocked(url.hostname, self.path):
+                    proxy._count(blocked=True)
+                    self.send_error(403, "Blocked")
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else None
+                headers = {key: val for key, val in self.headers.items()
+                           if key.lower() not in ("proxy-connection", "connection", "keep-alive")}
+                path = url.path + (f"?{url.query}" if url.query else "")
+                conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=proxy.timeout)
+                try:
+                    conn.request(self.command, path or "/", body=body, headers=headers)
+                    res = conn.getresponse()
+                    data = res.read()
+                except OSError as error:
+                    proxy._count()
+                    self.send_error(502, str(error))
+                    return
+                finally:
+                    conn.close()
+                proxy._count(n_bytes=len(data))
+                self.send_response(res.status, res.reason)
+                for key, val in res.getheaders():
+                    if key.lower() not in ("connection", "keep-alive", "transfer-encoding", "content-length"):
+                        self.send_header(key, val)
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                if self.command != "HEAD":
+                    self.wfile.write(data)
+
+            do_GET = do_POST = do_HEAD = do_PUT = do_DELETE = do_OPTIONS = _forward
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LeanDriverFactory(object):
+
+    """
+    `DriverPool` driver factory starting browsers with the lean profile.
+
+    Every browser gets the `LEAN_PREFERENCES` and, unless `proxy` is False, its own `BlockingProxy`
+    (available as `driver.blocking_proxy`, closed when the browser quits) so that traffic can be
+    attributed per search.
+
+    Args:
+        blocklist (iterable, optional): Blocklist entries. Defaults to `DEFAULT_BLOCKLIST`.
+        proxy (bool, optional): Route the browser through a blocking proxy. Defaults to True.
+        preferences (dict, optional): Extra Firefox preferences, applied on top of `LEAN_PREFERENCES`.
+        headless (bool, optional): Defaults to True.
+    """
+
+    def __init__(self, blocklist=DEFAULT_BLOCKLIST, proxy=True, preferences=None, headless=True):
+        self.blocklist = tuple(blocklist)
+        self.proxy = proxy
+        self.preferences = dict(LEAN_PREFERENCES, **(preferences or {}))
+        self.headless = headless
+
+    def __call__(self):
+        proxy = BlockingProxy(self.blocklist) if self.proxy else None
+        try:
+            driver = create_driver(headless=self.headless, preferences=self.preferences,
+                                   proxy=proxy.address if proxy is not None else None)
+        except Exception:
+            if proxy is not None:
+                proxy.close()
+            raise
+        driver.blocking_proxy = proxy
+        if proxy is not None:
+            quit = driver.quit
+
+            def quit_and_close():
+                try:
+                    quit()
+                finally:
+                    proxy.close()
+            driver.quit = quit_and_close
+        return driver
@@ -0,0 +1,165 @@
+import json
+import uuid
+import hashlib
+import logging
+from datetime import datetime, timedelta
+import pandas as pd
+
+logger = logging.getLogger("hotels-scraper.checkpoint.checkpoint")
+
+# Search parameters that identify a search, besides destination, checkin date and nights
+FILTER_KEYS = ("price_min", "price_max", "price_multiplier", "star_rating_min", "star_rating_max",
+               "guest_rating_min", "guest_rating_max", "distance_centre", "rooms", "adults", "children", "currency")
+
+
+def _normalize(val):
+    if val is None or (isinstance(val, float) and pd.isna(val)):
+        return None
+    if isinstance(val, str):
+        return val.strip().lower()
+    if isinstance(val, float) and val.is_integer():
+        return int(val)
+    if hasattr(val, "item"):
+        # numpy scalars
+        return _normalize(val.item())
+    return val
+
+
+def search_key(search):
+    """
+    Stable key of a search: destination, checkin date, number of nights and filters.
+
+    Accepts a search dictionary (`Search.to_dict`) or a flat search record (e.g. a row of the
+    `search` table), so keys computed before scraping match keys computed from the results.
+    """
+    destination = search.get("destination") or search
+    checkin = pd.to_datetime(search.get("checkin_datetime"))
+    checkout = pd.to_datetime(search.get("checkout_datetime")) if search.get("checkout_datetime") is not None else None
+    nights = (checkout.normalize() - checkin.normalize()).days if checkout is not None else 1
+    params = {
+        "city": _normalize(destination.get("city")),
+        "state": _normalize(destination.get("state")),
+        "country": _normalize(destination.get("country")),
+        "checkin": checkin.strftime("%Y-%m-%d"),
+        "nights": nights,
+    }
+    params.update({key: _normalize(search.get(key)) for key in FILTER_KEYS})
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def config_hash(search_list):
+    """
+    Hash of the search config sections, identifies runs of the same search plan.
+    """
+    return hashlib.sha1(json.dumps(search_list, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class RunCheckpoint(object):
+
+    """
+    Tracks the searches completed in a run (`runs` and `checkpoints` tables) so that an
+    interrupted run can be resumed without repeating finished searches.
+
+    The run's `started_at` timestamp anchors the search plan dates (see `Search.generate`),
+    so a resumed run regenerates exactly the same checkin dates.
+    """
+
+    def __init__(self, conn, run_id, started_at=None):
+        self.conn = conn
+        self.run_id = run_id
+        self.started_at = started_at
+
+    @classmethod
+    def start(cls, conn, search_list, resume=False, run_id=None, window=timedelta(days=1)):
+        """
+        Starts a new run, or resumes one.
+
+        Args:
+            conn (Connection): Database connection
+            search_list (list): Search config sections
+            resume (bool, optional): Resume the latest run of the same config started within `window`. Defaults to False.
+            run_id (str, optional): Resume (or create) this specific run.
+            window (timedelta, optional): How far back a resumable run may have started. Defaults to one day.
+        """
+        digest = config_hash(search_list)
+        row = None
+        if run_id is not None:
+            row = conn.execute("SELECT id, started_at FROM runs WHERE id = ?", run_id).fetchone()
+        elif resume:
+            since = datetime.now() - window
+            row = conn.execute("SELECT id, started_at FROM runs WHERE config_hash = ? AND started_at >= ? "
+                               "ORDER BY started_at DESC LIMIT 1", digest, since).fetchone()
+
+        if row is not None:
+            checkpoint = cls(conn, row[0], pd.to_datetime(row[1]).to_pydatetime())
+            conn.execute("UPDATE runs SET status = 'running', finished_at = NULL WHERE id = ?", checkpoint.run_id)
+            msg = f"[~] Resuming run {checkpoint.run_id} ({len(checkpoint.completed())} searches already completed)"
+        else:
+            started_at = datetime.now()
+            run_id = run_id or f"{digest[:8]}-{started_at:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+            conn.execute("INSERT INTO runs (id, config_hash, started_at, status) VALUES (?, ?, ?, 'running')",
+                         run_id, digest, started_at)
+            checkpoint = cls(conn, run_id, started_at)
+            msg = f"[~] Starting run {run_id}"
+        logger.info(msg)
+        print(msg)
+        return checkpoint
+
+    def completed(self):
+        """
+        Returns the set of search keys completed in this run.
+        """
+        rows = self.conn.execute("SELECT search_key FROM checkpoints WHERE run_id = ? AND status = 'done'", self.run_id)
+        return {row[0] for row in rows}
+
+    def partial(self):
+        """
+        Returns {search key: listing offset to resume from} of the incomplete searches in this run.
+        """
+        # Includes partial searches whose retry failed (e.g. timed out) before loading anything
+        rows = self.conn.execute("SELECT search_key, result_offset FROM checkpoints "
+                                 "WHERE run_id = ? AND status != 'done' AND result_offset IS NOT NULL", self.run_id)
+        return {row[0]: row[1] or 0 for row in rows}
+
+    def pending(self, searches):
+        """
+        Filters out the searches already completed in this run. Incomplete searches get the
+        `result_offset` to continue from, so only their missing results are fetched. The
+        checkpoints are read immediately, the returned iterator does not touch the database.
+        """
+        done = self.completed()
+        partial = self.partial()
+
+        def resume(search):
+            offset = partial.get(search_key(search))
+            return dict(search, result_offset=offset) if offset else search
+
+        return (resume(search) for search in searches if search_key(search) not in done)
+
+    def mark(self, search, search_id=None, status="done", result_offset=None):
+        """
+        Records the state of a search (a search dictionary or a flat `search` record).
+        """
+        key = search_key(search)
+        checkpoint_id = hashlib.sha1(f"{self.run_id}:{key}".encode("utf-8")).hexdigest()
+        self.conn.execute("INSERT OR REPLACE INTO checkpoints (id, run_id, search_key, search_id, status, result_offset, updated_at) "
+                          "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          checkpoint_id, self.run_id, key, None if search_id is None else int(search_id), status,
+                          result_offset, datetime.now())
+
+    def mark_results(self, df_search):
+        """
+        Marks the searches in a `search` DataFrame (indexed by search id) as done, or as partial
+        (with the offset of the first missing listing) when not all of their results were loaded.
+        """
+        for search_id, row in df_search.iterrows():
+            record = row.to_dict()
+            complete = record.get("complete")
+            if complete is None or pd.isna(complete) or complete:
+                self.mark(record, search_id=search_id)
+            else:
+                offset = int(_normalize(record.get("result_offset")) or 0) + int(_normalize(record.get("n_listings")) or 0)
+                self.mark(record, search_id=search_id, status="partial", result_offset=offset)
+
+    def finish(self, status="finished"):
+        self.conn.execute("UPDATE runs SET status = ?, finished_at = ? WHERE id = ?", status, datetime.now(), self.run_id)
@@ -0,0 +1,276 @@
+import logging
+import pandas as pd
+from . import sql
+from . checkpoint import _normalize
+from . normalize import VIEW_NAME, OBSERVATION_COLUMNS, SCHEMA_MODES, _hash, hotel_keys, observation_keys, store_hotels, \
+    delete_hotels, create_view
+
+logger = logging.getLogger("hotels-scraper.delta.delta")
+
+# Observed values compared against the last stored observation
+TRACKED_COLUMNS = ("price", "price_sale", "rating", "num_reviews")
+
+# Search parameters that identify the offer a price was observed for, besides destination and hotel
+SLOT_COLUMNS = ("checkin_datetime", "checkout_datetime", "rooms", "adults", "children", "currency")
+
+# Views presenting every observation, stored or marked unchanged, with the columns of the base table
+DELTA_VIEWS = {"wide": "hotels_expanded", "normalized": "hotel_observations_expanded"}
+
+_HOTELS_COLUMNS = "address, amenities, details, landmarks, name, num_reviews, price, price_sale, rating, " \
+                  "rating_sentiment, review_box, star_rating, price_metadata, distance_centre"
+_OBSERVATION_COLUMNS = "hotel_key, name, address, amenities, details, landmarks, review_box, star_rating, " \
+                       "distance_centre, price, price_sale, price_metadata, rating, rating_sentiment, num_reviews"
+
+DELTA_VIEW_SQL = {
+    "wide": f"""CREATE VIEW {DELTA_VIEWS["wide"]} AS
+SELECT id, search_id, {_HOTELS_COLUMNS} FROM hotels
+UNION ALL
+SELECT h.id, m.search_id, {", ".join(f"h.{col.strip()}" for col in _HOTELS_COLUMNS.split(","))}
+FROM seen_unchanged m JOIN hotels h ON h.id = m.observation_id""",
+    "normalized": f"""CREATE VIEW {DELTA_VIEWS["normalized"]} AS
+SELECT id, search_id, {_OBSERVATION_COLUMNS} FROM {VIEW_NAME}
+UNION ALL
+SELECT v.id, m.search_id, {", ".join(f"v.{col.strip()}" for col in _OBSERVATION_COLUMNS.split(","))}
+FROM seen_unchanged m JOIN {VIEW_NAME} v ON v.id = m.observation_id""",
+}
+
+
+def create_delta_view(conn, schema_mode="wide"):
+    if schema_mode == "normalized":
+        create_view(conn)
+    conn.execute(f"DROP VIEW IF EXISTS {DELTA_VIEWS[schema_mode]}")
+    conn.execute(DELTA_VIEW_SQL[schema_mode])
+
+
+def observation_table(schema_mode="wide", delta=False):
+    """
+    Returns the table (or view) to read complete hotel observations from.
+    """
+    if delta:
+        return DELTA_VIEWS[schema_mode]
+    return "hotels" if schema_mode == "wide" else VIEW_NAME
+
+
+def _markers(search_ids, observation_ids):
+    """
+    Returns `seen_unchanged` rows, indexed by id.
+    """
+    df = pd.DataFrame({"search_id": search_ids, "observation_id": observation_ids})
+    df["id"] = _hash(df)
+    return df.drop_duplicates(subset=["id"]).set_index("id")
+
+
+def _observation_ids(df_attributes, schema_mode="wide"):
+    """
+    Returns the hotel keys and observation ids of parsed hotels, in the layout of `schema_mode`.
+    """
+    df = df_attributes.reset_index(drop=True)
+    df["hotel_key"] = hotel_keys(df)
+    if schema_mode == "wide":
+        return df["hotel_key"], pd.Series(df_attributes.index)
+    return df["hotel_key"], observation_keys(df.reindex(columns=OBSERVATION_COLUMNS))
+
+
+def replace_observations(conn, search_id, df_attributes, schema_mode="wide"):
+    """
+    Replaces the hotel observations of a search (e.g. re-parsed from its archived page) and keeps
+    the `seen_unchanged` markers consistent, so that the `DELTA_VIEWS` do not lose or repeat rows:
+
+        markers of the search itself are deleted, all of its observations are stored now
+        markers of later searches are pointed at the new observation of the same hotel, or
+        deleted if the hotel is no longer found on the page
+
+    Must run inside a transaction of the caller, so that nothing is replaced if a write fails.
+
+    Returns:
+        tuple: (inserted, skipped) number of hotel observations
+    """
+    search_id = int(search_id)
+    if schema_mode == "wide":
+        query = "SELECT m.search_id, h.name, h.address FROM seen_unchanged m JOIN hotels h ON h.id = m.observation_id " \
+                "WHERE h.search_id = ?"
+        df_later = pd.DataFrame.from_records(conn.execute(query, search_id).fetchall(), columns=["search_id", "name", "address"])
+        later_keys = hotel_keys(df_later) if not df_later.empty else pd.Series(dtype=int)
+        table = "hotels"
+    else:
+        query = "SELECT m.search_id, h.hotel_key FROM seen_unchanged m JOIN price_observation h ON h.id = m.observation_id " \
+                "WHERE h.search_id = ?"
+        df_later = pd.DataFrame.from_records(conn.execute(query, search_id).fetchall(), columns=["search_id", "hotel_key"])
+        later_keys = df_later["hotel_key"]
+        table = "price_observation"
+
+    conn.execute(f"DELETE FROM seen_unchanged WHERE observation_id IN (SELECT id FROM {table} WHERE search_id = ?)", search_id)
+    conn.execute("DELETE FROM seen_unchanged WHERE search_id = ?", search_id)
+    delete_hotels(conn, search_id, schema_mode=schema_mode)
+    if df_attributes.empty:
+        inserted, skipped = 0, 0
+        new_ids = {}
+    else:
+        inserted, skipped = store_hotels(df_attributes, conn, schema_mode=schema_mode)
+        keys, obs_ids = _observation_ids(df_attributes, schema_mode)
+        new_ids = dict(zip(keys.astype(int), obs_ids.astype(int)))
+
+    remapped = [(int(later), new_ids[int(key)]) for later, key in zip(df_later["search_id"], later_keys) if int(key) in new_ids]
+    if remapped:
+        sql.to_sql(_markers(*zip(*remapped)), "seen_unchanged", conn)
+    if len(remapped) < len(df_later):
+        logger.warning(f"{len(df_later) - len(remapped)} unchanged observations of later searches dropped with search {search_id}")
+    return inserted, skipped
+
+
+def copy_markers(conn, new_ids, low, high):
+    """
+    Adds `seen_unchanged` markers for observations that got a new id in another layout (see
+    `migrate`), for the markers whose observation id is in [`low`, `high`]. The existing markers
+    are kept, so the delta views of both layouts stay complete.
+
+    Args:
+        conn (Connection): Database connection
+        new_ids (dict): {observation id: new observation id}
+        low (int): Lowest observation id to look up
+        high (int): Highest observation id to look up
+
+    Returns:
+        int: Number of markers added
+    """
+    rows = conn.execute("SELECT search_id, observation_id FROM seen_unchanged WHERE observation_id BETWEEN ? AND ?",
+                        int(low), int(high)).fetchall()
+    copied = [(search_id, new_ids[obs_id]) for search_id, obs_id in rows if obs_id in new_ids]
+    if not copied:
+        return 0
+    inserted, _ = sql.to_sql(_markers(*zip(*copied)), "seen_unchanged", conn)
+    return inserted
+
+
+def _slot(params):
+    """
+    Normalizes the search parameters of a slot, so that searches and stored rows give the same key.
+    """
+    checkin, checkout = params[:2]
+    return (pd.Timestamp(checkin).strftime("%Y-%m-%d"), pd.Timestamp(checkout).strftime("%Y-%m-%d")) + \
+        tuple(_normalize(val) for val in params[2:])
+
+
+def _values(df):
+    """
+    Returns the tracked values of every row as tuples (missing values become None).
+    """
+    values = df.reindex(columns=TRACKED_COLUMNS)
+    return [tuple(None if pd.isna(val) else float(val) for val in row) for row in values.itertuples(index=False)]
+
+
+class DeltaStore(object):
+
+    """
+    Stores only the hotel observations that changed since the last stored observation of the same
+    hotel and offer (checkin, checkout, rooms, guests and currency).
+
+    Unchanged observations are recorded in `seen_unchanged` as (search id, id of the stored
+    observation still valid), which is all that is needed to rebuild them: the views in
+    `DELTA_VIEWS` present the stored and the unchanged observations together, with the columns
+    of the base table.
+
+    The last observations are held in an in-memory index, loaded from the database the first time
+    a destination is stored. Searches should therefore be stored in the order they were scraped.
+
+    Args:
+        conn (Connection): Database connection (of the thread writing the searches)
+        schema_mode (str, optional): Layout of the hotel tables, "wide" or "normalized". Defaults to "wide".
+    """
+
+    def __init__(self, conn, schema_mode="wide"):
+        if schema_mode not in SCHEMA_MODES:
+            raise ValueError(f"Unknown schema mode: {schema_mode} (choose from {SCHEMA_MODES})")
+        self.conn = conn
+        self.schema_mode = schema_mode
+        # (city, state, country) -> {(hotel key, slot...): (observation id, search id, tracked values)}
+        self.index = {}
+
+    def load(self, city, state, country):
+        """
+        Reads the latest stored observation of every hotel and offer of a destination.
+        """
+        slot_columns = ", ".join(f"s.{col}" for col in SLOT_COLUMNS)
+        tracked = ", ".join(f"h.{col}" for col in TRACKED_COLUMNS)
+        if self.schema_mode == "wide":
+            query = f"SELECT h.id, h.search_id, h.name, h.address, {tracked}, {slot_columns} " \
+                    f"FROM hotels h JOIN search s ON s.id = h.search_id "
+        else:
+            query = f"SELECT h.id, h.search_id, h.hotel_key, {tracked}, {slot_columns} " \
+                    f"FROM price_observation h JOIN search s ON s.id = h.search_id "
+        query += "WHERE s.city = ? AND s.state = ? AND s.country = ? ORDER BY s.search_datetime, s.id"
+        rows = self.conn.execute(query, city, state, country).fetchall()
+        columns = ["id", "search_id"] + (["name", "address"] if self.schema_mode == "wide" else ["hotel_key"]) + \
+            list(TRACKED_COLUMNS) + list(SLOT_COLUMNS)
+        df = pd.DataFrame.from_records(rows, columns=columns)
+
+        index = {}
+        if not df.empty:
+            keys = hotel_keys(df) if self.schema_mode == "wide" else df["hotel_key"]
+            slots = df[list(SLOT_COLUMNS)].itertuples(index=False)
+            # Later searches overwrite earlier ones
+            for key, slot, obs_id, search_id, values in zip(keys, slots, df["id"], df["search_id"], _values(df)):
+                index[(int(key),) + _slot(slot)] = (int(obs_id), int(search_id), values)
+
+        msg = f"[~] Loaded {len(index)} last observations of {city}"
+        logger.info(msg)
+        print(msg)
+        return index
+
+    def _destination_index(self, search):
+        destination = tuple(search[key] for key in ("city", "state", "country"))
+        if destination not in self.index:
+            self.index[destination] = self.load(*destination)
+        return self.index[destination]
+
+    def store(self, df_search, df_attributes):
+        """
+        Stores the changed observations of a search and marks the others as seen unchanged.
+
+        Args:
+            df_search (pd.DataFrame): `search` DataFrame of a single search
+            df_attributes (pd.DataFrame): Its parsed hotels, as returned by `Scraper.get_attributes_df`
+
+        Returns:
+            tuple: (inserted, skipped, unchanged) number of hotel observations
+        """
+        if df_attributes.empty:
+            return 0, 0, 0
+        search = df_search.iloc[0]
+        search_id = int(df_search.index[0])
+        index = self._destination_index(search)
+        slot = _slot(tuple(search[col] for col in SLOT_COLUMNS))
+
+        df = df_attributes.reset_index(drop=True)
+        df["hotel_key"], obs_ids = _observation_ids(df_attributes, self.schema_mode)
+
+        changed = []
+        unchanged = []
+        updates = {}
+        for pos, (key, obs_id, values) in enumerate(zip(df["hotel_key"], obs_ids, _values(df))):
+            slot_key = (int(key),) + slot
+            last = updates.get(slot_key) or index.get(slot_key)
+            if last is None or last[2] != values:
+                changed.append(pos)
+                updates[slot_key] = (int(obs_id), search_id, values)
+            elif last[1] != search_id:
+                unchanged.append(last[0])
+            # else: stored with this search already (e.g. merged again)
+
+        inserted, skipped = 0, 0
+        if changed:
+            inserted, skipped = store_hotels(df_attributes.iloc[changed], self.conn, schema_mode=self.schema_mode)
+            if inserted + skipped == 0:
+                # Not written, the index must keep pointing at stored observations
+                logger.error(f"Could not store the changed observations of search {search_id}")
+                updates = {}
+
+        if unchanged:
+            sql.to_sql(_markers([search_id] * len(unchanged), unchanged), "seen_unchanged", self.conn)
+        # Only once everything was written, a write failing inside a batch raises before this
+        index.update(updates)
+
+        msg = f"[~] {len(changed)} changed and {len(unchanged)} unchanged observations"
+        logger.info(msg)
+        print(msg)
+        return inserted, skipped, len(unchanged)
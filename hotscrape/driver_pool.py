@@ -0,0 +1,340 @@
+import os
+import time
+import signal
+import logging
+import threading
+from queue import Empty
+from collections import deque
+from contextlib import contextmanager
+from selenium.webdriver import Firefox
+from selenium.webdriver.firefox.options import Options
+from selenium.common.exceptions import WebDriverException
+
+logger = logging.getLogger("hotels-scraper.driver_pool.driver_pool")
+
+
+def create_driver(headless=True, window_size=(1920, 1080), preferences=None, proxy=None):
+    """
+    Starts a new private (and by default headless) Firefox instance.
+
+    Args:
+        headless (bool, optional): Defaults to True.
+        window_size (tuple, optional): Defaults to (1920, 1080).
+        preferences (dict, optional): Additional Firefox preferences (see `blocking.LEAN_PREFERENCES`)
+        proxy (tuple, optional): (host, port) of an HTTP proxy to route all traffic through
+    """
+    options = Options()
+    options.add_argument("--private")
+    if headless:
+        options.add_argument("--headless")
+    # Nothing should survive between two searches on the same browser
+    options.set_preference("browser.cache.disk.enable", False)
+    options.set_preference("browser.cache.offline.enable", False)
+    for name, value in (preferences or {}).items():
+        options.set_preference(name, value)
+    if proxy is not None:
+        host, port = proxy
+        options.set_preference("network.proxy.type", 1)
+        for scheme in ("http", "ssl"):
+            options.set_preference(f"network.proxy.{scheme}", host)
+            options.set_preference(f"network.proxy.{scheme}_port", int(port))
+        options.set_preference("network.proxy.no_proxies_on", "")
+        # Firefox bypasses proxies for localhost unless told otherwise
+        options.set_preference("network.proxy.allow_hijacking_localhost", True)
+    driver = Firefox(executable_path="geckodriver", options=options)
+    driver.set_window_size(*window_size)
+    return driver
+
+
+def _process_tree(pid):
+    """
+    Returns the ids of a process and all of its descendants using /proc (children first).
+    Returns None if the information is unavailable (e.g. not on Linux).
+    """
+    children = {}
+    try:
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as file:
+                    # The process name can contain spaces, the ppid is the second field after it
+                    ppid = int(file.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    except OSError:
+        return None
+
+    pids = []
+    stack = [pid]
+    while stack:
+        cur = stack.pop()
+        pids.append(cur)
+        stack.extend(children.get(cur, []))
+    return pids[::-1]
+
+
+def _process_tree_rss_kb(pid):
+    """
+    Sums the resident set size (in kB) of a process and all of its children using /proc.
+    Returns None if the information is unavailable (e.g. not on Linux).
+    """
+    pids = _process_tree(pid)
+    if pids is None:
+        return None
+
+    total = 0
+    for cur in pids:
+        try:
+            with open(f"/proc/{cur}/status") as file:
+                for line in file:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+                        break
+        except OSError:
+            if cur == pid:
+                return None
+    return total
+
+
+def driver_rss_mb(driver):
+    """
+    Returns the resident memory (in MB) of the browser behind `driver`, including its content processes.
+    Returns None if it cannot be determined.
+    """
+    try:
+        pid = driver.capabilities.get("moz:processID")
+    except Exception:
+        return None
+    if not pid:
+        return None
+    rss = _process_tree_rss_kb(int(pid))
+    return None if rss is None else rss / 1024.
+
+
+def _pids(driver):
+    pids = []
+    try:
+        pid = driver.capabilities.get("moz:processID")
+    except Exception:
+        pid = None
+    if pid:
+        pids += _process_tree(int(pid)) or [int(pid)]
+    # geckodriver itself
+    process = getattr(getattr(driver, "service", None), "process", None)
+    if process is not None and process.pid not in pids:
+        pids.append(process.pid)
+    return pids
+
+
+def kill_driver(driver):
+    """
+    Kills the browser behind `driver` (all of its processes and geckodriver) without talking to it,
+    so that it works on a browser that no longer responds. Pending WebDriver calls fail immediately.
+    """
+    for pid in _pids(driver):
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+class PooledDriver(object):
+    """
+    Book-keeping wrapper around a webdriver owned by a `DriverPool`.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.created = time.time()
+
+
+class DriverPool(object):
+
+    """
+    Pool of warm browser instances that are borrowed for a search and returned afterwards.
+
+    Browsers are health checked when borrowed, have their cookies and storage reset when returned,
+    and are recycled (quit and replaced) after `max_pages` searches or when their memory
+    footprint exceeds `max_rss_mb`.
+
+    Args:
+        size (int, optional): Maximum number of concurrent browsers. Defaults to 1.
+        max_pages (int, optional): Recycle a browser after this many searches. Defaults to 50.
+        max_rss_mb (float, optional): Recycle a browser when its RSS exceeds this many MB. Defaults to 1500.
+        driver_factory (callable, optional): Callable returning a new webdriver. Defaults to `create_driver`.
+    """
+
+    def __init__(self, size=1, max_pages=50, max_rss_mb=1500, driver_factory=create_driver):
+        if size < 1:
+            raise ValueError("Driver pool size must be >= 1")
+        self.size = size
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.driver_factory = driver_factory
+        self._idle = deque()
+        self._lock = threading.Lock()
+        # Notified whenever a browser is returned or quit, waiting searches may then take or start one
+        self._available = threading.Condition(self._lock)
+        self._n_drivers = 0
+        self._closed = False
+
+    def _spawn(self):
+        msg = "[~] Starting new browser ..."
+        logger.info(msg)
+        print(msg)
+        try:
+            return PooledDriver(self.driver_factory())
+        except Exception:
+            with self._available:
+                self._n_drivers -= 1
+                self._available.notify()
+            raise
+
+    def _discard(self, pooled):
+        with self._available:
+            self._n_drivers -= 1
+            self._available.notify()
+        try:
+            pooled.driver.quit()
+        except Exception as error:
+            logger.error(error)
+            # An unresponsive browser would otherwise be left running
+            kill_driver(pooled.driver)
+
+    @staticmethod
+    def is_healthy(driver):
+        """
+        Checks that the browser still responds to commands.
+        """
+        try:
+            return driver.execute_script("return 1;") == 1
+        except WebDriverException:
+            return False
+        except Exception:
+            return False
+
+    def needs_recycle(self, pooled):
+        if self.max_pages and pooled.pages >= self.max_pages:
+            logger.info(f"Recycling browser after {pooled.pages} pages")
+            return True
+        if self.max_rss_mb:
+            rss = driver_rss_mb(pooled.driver)
+            if rss is not None and rss >= self.max_rss_mb:
+                logger.info(f"Recycling browser using {rss:.0f} MB RSS")
+                return True
+        return False
+
+    @staticmethod
+    def reset(driver):
+        """
+        Clears cookies and web storage so that no state leaks into the next search.
+        """
+        try:
+            driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+        except Exception:
+            # No storage on e.g. about:blank
+            pass
+        driver.delete_all_cookies()
+        driver.get("about:blank")
+
+    def acquire(self, timeout=None):
+        """
+        Borrows a healthy browser from the pool, starting a new one if the pool is not yet full.
+        Blocks (up to `timeout` seconds) while all browsers are in use.
+
+        Raises:
+            queue.Empty: No browser became available within `timeout` seconds
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._available:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("Driver pool is closed")
+                    if self._idle:
+                        pooled = self._idle.popleft()
+                        break
+                    if self._n_drivers < self.size:
+                        # Also when a browser was quit while waiting, its slot is free again
+                        self._n_drivers += 1
+                        pooled = None
+                        break
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise Empty()
+                    self._available.wait(remaining)
+            if pooled is None:
+                return self._spawn()
+
+            if self.is_healthy(pooled.driver):
+                return pooled
+            logger.warning("Discarding unresponsive browser")
+            self._discard(pooled)
+
+    def release(self, pooled, broken=False, handover=None):
+        """
+        Returns a borrowed browser to the pool. Broken, worn-out or bloated browsers are quit instead.
+
+        Args:
+            pooled (PooledDriver): Borrowed browser
+            broken (bool, optional): Quit the browser instead of reusing it. Defaults to False.
+            handover (callable, optional): Called after the reset, right before the browser becomes
+                available to other searches. The browser is quit instead if it returns False
+                (e.g. `_Watch.disarm` of a search whose deadline expired during the reset).
+        """
+        pooled.pages += 1
+        if broken or self._closed or self.needs_recycle(pooled):
+            self._discard(pooled)
+            return
+        try:
+            self.reset(pooled.driver)
+        except Exception as error:
+            logger.error(error)
+            self._discard(pooled)
+            return
+        if handover is not None and not handover():
+            self._discard(pooled)
+            return
+        with self._available:
+            if not self._closed:
+                self._idle.append(pooled)
+                self._available.notify()
+                return
+        # Closed during the reset
+        self._discard(pooled)
+
+    @contextmanager
+    def driver(self, timeout=None):
+        """
+        Context manager borrowing a webdriver from the pool for the duration of the block.
+        """
+        pooled = self.acquire(timeout=timeout)
+        broken = False
+        try:
+            yield pooled.driver
+        except Exception:
+            broken = not self.is_healthy(pooled.driver)
+            raise
+        finally:
+            self.release(pooled, broken=broken)
+
+    def close(self):
+        """
+        Quits all idle browsers. Browsers still borrowed are quit when returned.
+        """
+        with self._available:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            # Waiting searches fail instead of waiting for browsers that are never returned
+            self._available.notify_all()
+        for pooled in idle:
+            self._discard(pooled)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
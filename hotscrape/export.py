@@ -0,0 +1,184 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import pandas as pd
+from urllib.parse import quote
+from . normalize import create_view
+from . delta import create_delta_view, observation_table
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+logger = logging.getLogger("hotels-scraper.export.export")
+
+# Export state, stored next to the exported dataset
+WATERMARK_FILE = "_watermark.json"
+
+# Columns of the `search` table that are not exported
+SEARCH_EXCLUDE = ("id", "page_hash", "page_codec")
+
+# Hive-style partition directories of the dataset, `city=<city>/checkin_month=<YYYY-MM>/`
+PARTITION_COLS = ("city", "checkin_month")
+
+
+def _arrow_type(dtype):
+    return {"Integer": pa.int64(), "Float": pa.float64(), "String": pa.string(), "DateTime": pa.timestamp("us")}[dtype]
+
+
+def export_columns(schema, schema_mode="wide"):
+    """
+    Columns of the joined export as (select expression, output name, schema type) tuples.
+
+    Search columns come first (`search_id` plus the search parameters), then the hotel observation
+    columns. Search columns that clash with a hotel column get a `search_` prefix.
+    """
+    if schema_mode == "wide":
+        hotel_columns = [(name, dtype) for name, dtype in schema["hotels"][1]["columns"].items() if name != "search_id"]
+    else:
+        observation = schema["price_observation"][1]["columns"]
+        hotel_columns = [("id", observation["id"])]
+        hotel_columns += list(schema["hotel"][1]["columns"].items())
+        hotel_columns += [(name, dtype) for name, dtype in observation.items() if name not in ("id", "search_id", "hotel_key")]
+    hotel_names = {name for name, _ in hotel_columns}
+
+    columns = [("s.id", "search_id", "Integer")]
+    for name, dtype in schema["search"][1]["columns"].items():
+        if name not in SEARCH_EXCLUDE:
+            columns.append((f"s.{name}", f"search_{name}" if name in hotel_names else name, dtype))
+    columns += [(f"h.{name}", name, dtype) for name, dtype in hotel_columns]
+    return columns
+
+
+def read_watermark(out_dir):
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_watermark(out_dir, watermark):
+    # Replace the file atomically, a crashed export leaves the previous watermark in place
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as file:
+        json.dump(watermark, file, indent=4)
+    os.replace(tmp_path, os.path.join(out_dir, WATERMARK_FILE))
+
+
+def to_arrow(df, columns):
+    """
+    Converts an export chunk to an Arrow table with the types declared in the database schema.
+    Partition columns are left out, their values are in the directory names.
+    """
+    for _, name, dtype in columns:
+        if dtype == "DateTime":
+            df[name] = pd.to_datetime(df[name])
+        elif dtype == "Integer":
+            df[name] = pd.to_numeric(df[name]).astype("Int64")
+        elif dtype == "Float":
+            df[name] = pd.to_numeric(df[name]).astype(float)
+    fields = [pa.field(name, _arrow_type(dtype)) for _, name, dtype in columns if name not in PARTITION_COLS]
+    return pa.Table.from_pandas(df[[field.name for field in fields]], schema=pa.schema(fields), preserve_index=False)
+
+
+def partition_dir(out_dir, city, checkin_month):
+    # Path separators and other unsafe characters are percent-encoded, as Arrow decodes them when reading
+    return os.path.join(out_dir, f"city={quote(str(city), safe=' ')}", f"checkin_month={checkin_month}")
+
+
+def write_partitions(df, columns, out_dir, basename, **kwargs):
+    """
+    Writes an export chunk as one Parquet file named `basename` per partition. Only uses
+    `pq.write_table`, so it works with every supported pyarrow version.
+
+    Returns:
+        int: Number of files written
+    """
+    df["checkin_month"] = pd.to_datetime(df["checkin_datetime"]).dt.strftime("%Y-%m")
+    n_files = 0
+    for (city, checkin_month), df_part in df.groupby(list(PARTITION_COLS), sort=False):
+        path = partition_dir(out_dir, city, checkin_month)
+        os.makedirs(path, exist_ok=True)
+        pq.write_table(to_arrow(df_part.copy(), columns), os.path.join(path, basename), **kwargs)
+        n_files += 1
+    return n_files
+
+
+def export(conn, schema, out_dir, schema_mode="wide", chunksize=200000, full=False, compression="zstd", delta=False):
+    """
+    Streams the hotel observations joined with their search into a Parquet dataset.
+
+    The dataset is partitioned by city and checkin month (`city=<city>/checkin_month=<YYYY-MM>/`),
+    and string columns are dictionary encoded. Rows are read with a single cursor, `chunksize`
+    rows at a time, so memory use does not depend on the size of the database.
+
+    Exports are incremental: the latest exported `search_datetime` is kept in `_watermark.json`
+    in `out_dir` and the next export only appends searches made after it. File names are derived
+    from the watermark the export started from, so re-running a failed export overwrites its
+    partial output instead of duplicating it. Searches still being written by a running scrape
+    may be missed, export between runs.
+
+    Args:
+        conn (Connection): Database connection
+        schema (dict): Database schema, provides the column types
+        out_dir (str): Root directory of the Parquet dataset
+        schema_mode (str, optional): Layout of the hotel tables, "wide" or "normalized". Defaults to "wide".
+        chunksize (int, optional): Rows per chunk (and at most per file). Defaults to 200000.
+        full (bool, optional): Ignore the watermark and export everything. Defaults to False.
+        compression (str, optional): Parquet compression codec. Defaults to "zstd".
+        delta (bool, optional): Hotels are stored in delta mode, export the unchanged observations as well. Defaults to False.
+
+    Returns:
+        int: Number of exported rows
+    """
+    if pa is None:
+        raise ImportError("Parquet export requires the `pyarrow` package")
+
+    os.makedirs(out_dir, exist_ok=True)
+    watermark = None if full else read_watermark(out_dir)
+    since = watermark["search_datetime"] if watermark else None
+
+    if delta:
+        create_delta_view(conn, schema_mode)
+    elif schema_mode == "normalized":
+        create_view(conn)
+    table = observation_table(schema_mode, delta=delta)
+    columns = export_columns(schema, schema_mode)
+    names = [name for _, name, _ in columns]
+    string_columns = [name for _, name, dtype in columns if dtype == "String"] + ["checkin_month"]
+
+    query = f"SELECT {', '.join(f'{expr} AS {name}' for expr, name, _ in columns)} " \
+            f"FROM search s JOIN {table} h ON h.search_id = s.id"
+    params = []
+    if since is not None:
+        query += " WHERE s.search_datetime > ?"
+        params.append(since)
+    query += " ORDER BY s.search_datetime, s.id, h.id"
+
+    msg = f"[~] Exporting searches after {since or 'the beginning'} to {out_dir} ..."
+    logger.info(msg)
+    print(msg)
+
+    tag = hashlib.sha1(str(since).encode("utf-8")).hexdigest()[:8]
+    n_rows = 0
+    latest = since
+    result = conn.execute(query, *params)
+    for chunk in iter(lambda: result.fetchmany(chunksize), []):
+        df = pd.DataFrame.from_records(chunk, columns=names)
+        # Raw column value, compared as stored by SQLite
+        latest = df["search_datetime"].iloc[-1]
+        write_partitions(df, columns, out_dir, f"part-{tag}-{n_rows // chunksize:05d}.parquet",
+                         use_dictionary=string_columns, compression=compression)
+        n_rows += len(df)
+
+    if latest != since:
+        write_watermark(out_dir, {"search_datetime": latest, "schema_mode": schema_mode})
+    msg = f"[~] Exported {n_rows} rows"
+    logger.info(msg)
+    print(msg)
+    return n_rows
@@ -0,0 +1,221 @@
+import re
+import logging
+from lxml import etree, html
+
+logger = logging.getLogger("hotels-scraper.extract.extract")
+
+REGEX_NS = {"re": "http://exslt.org/regular-expressions"}
+
+
+def _xpath_literal(string):
+    """
+    Quotes a string for use inside an XPath expression.
+    """
+    if "'" not in string:
+        return f"'{string}'"
+    if '"' not in string:
+        return f'"{string}"'
+    parts = string.split("'")
+    return "concat(" + ", \"'\", ".join(f"'{part}'" for part in parts) + ")"
+
+
+def class_matcher(class_):
+    """
+    Normalizes a BeautifulSoup style `class_` filter into a (mode, value) pair.
+
+    A single class name matches any element carrying that class ("token"), a string with spaces
+    must match the full class attribute ("exact"), and a compiled regex is searched in the class attribute ("regex").
+    """
+    if isinstance(class_, re.Pattern):
+        return "regex", class_.pattern
+    if " " in class_.strip():
+        return "exact", " ".join(class_.split())
+    return "token", class_.strip()
+
+
+def class_predicate(class_):
+    """
+    Translates a BeautifulSoup style `class_` filter into an XPath predicate.
+    """
+    mode, value = class_matcher(class_)
+    if mode == "regex":
+        return f"re:test(@class, {_xpath_literal(value)})"
+    if mode == "exact":
+        return f"normalize-space(@class) = {_xpath_literal(value)}"
+    return f"contains(concat(' ', normalize-space(@class), ' '), {_xpath_literal(f' {value} ')})"
+
+
+# Global counting the listings removed from the page by `HARVEST_JS` (read by the scroll engine)
+PRUNED_COUNTER = "__hotscrapePruned"
+
+# Class matching helpers shared by the in-browser extraction scripts
+_MATCH_JS = """
+var matches = function (el, m) {
+    var cls = el.getAttribute("class") || "";
+    if (m.mode === "regex") { return new RegExp(m.value).test(cls); }
+    cls = cls.replace(/\\s+/g, " ").trim();
+    if (m.mode === "exact") { return cls === m.value; }
+    return (" " + cls + " ").indexOf(" " + m.value + " ") >= 0;
+};
+var find = function (root, m) {
+    var els = root.getElementsByTagName(m.tag);
+    for (var i = 0; i < els.length; i++) {
+        if (matches(els[i], m)) { return els[i]; }
+    }
+    return null;
+};
+var row = function (card, spec) {
+    var values = [];
+    for (var j = 0; j < spec.fields.length; j++) {
+        var el = find(card, spec.fields[j]);
+        values.push(el === null ? null : el.textContent);
+    }
+    return values;
+};
+"""
+
+# Walks the listing cards inside the browser and returns one array of field texts per card.
+# arguments[0] is the spec built by `CardExtractor.js_spec`.
+EXTRACT_JS = "var spec = arguments[0];" + _MATCH_JS + """
+var out = [];
+var cards = document.getElementsByTagName(spec.card.tag);
+for (var i = 0; i < cards.length; i++) {
+    if (!matches(cards[i], spec.card)) { continue; }
+    out.push(row(cards[i], spec));
+}
+return out;
+"""
+
+# Like `EXTRACT_JS`, but only returns the cards appended since the previous call. Harvested cards are
+# marked and, when arguments[1] is true, emptied: the card element stays (with its height fixed, so the
+# scroll position and the site's own scripts are unaffected) but its content is freed. The listings
+# removed this way (matching the selector in arguments[2]) are added to the `PRUNED_COUNTER` global.
+HARVEST_JS = "var spec = arguments[0], prune = arguments[1], listingSelector = arguments[2];" + _MATCH_JS + """
+var out = [];
+var harvested = [];
+var cards = document.getElementsByTagName(spec.card.tag);
+for (var i = 0; i < cards.length; i++) {
+    if (!matches(cards[i], spec.card) || cards[i].hasAttribute("data-hotscrape-harvested")) { continue; }
+    out.push(row(cards[i], spec));
+    harvested.push(cards[i]);
+}
+for (var k = 0; k < harvested.length; k++) {
+    var card = harvested[k];
+    card.setAttribute("data-hotscrape-harvested", "1");
+    if (prune) {
+        window.%(counter)s = (window.%(counter)s || 0) + card.querySelectorAll(listingSelector).length;
+        card.style.height = card.offsetHeight + "px";
+        card.innerHTML = "";
+    }
+}
+return out;
+""" % {"counter": PRUNED_COUNTER}
+
+
+def element_xpath(tag, class_, relative=False):
+    return f"{'.' if relative else ''}//{tag}[{class_predicate(class_)}]"
+
+
+class CardExtractor(object):
+
+    """
+    Extracts hotel attributes from a results page in a single pass over its listing cards.
+
+    Every field is looked up inside its own card with a precompiled XPath expression, so fields
+    stay aligned per hotel even when a card lacks some of them (missing fields become None).
+
+    Args:
+        card (tuple): (tag, class) of the element wrapping one listing
+        fields (dict): Field name -> (tag, class) mapping, e.g. `HotelsScraper.feature_html_details`
+        required (str, optional): Cards without this field are skipped. Defaults to "name".
+    """
+
+    def __init__(self, card, fields, required="name"):
+        self.card = card
+        self.fields = fields
+        self.required = required
+        self._cards = etree.XPath(element_xpath(*card), namespaces=REGEX_NS)
+        self._fields = {key: etree.XPath(f"({element_xpath(*val, relative=True)})[1]", namespaces=REGEX_NS)
+                        for key, val in fields.items()}
+        self._text = etree.XPath("string()", smart_strings=False)
+
+    @staticmethod
+    def to_tree(page):
+        """
+        Accepts raw html (str/bytes) or an already parsed lxml tree.
+        """
+        if isinstance(page, (str, bytes)):
+            return html.document_fromstring(page)
+        return page
+
+    def js_spec(self):
+        """
+        Serializable description of the card and field selectors, consumed by `EXTRACT_JS`.
+        """
+        def spec(tag, class_):
+            mode, value = class_matcher(class_)
+            return {"tag": tag, "mode": mode, "value": value}
+        return {"card": spec(*self.card), "fields": [spec(*self.fields[key]) for key in self.fields]}
+
+    def extract_in_browser(self, driver):
+        """
+        Runs the extraction inside the browser with a single `execute_script` call.
+        Only the compact per-card records travel over the WebDriver connection, the page
+        source is never serialized or parsed in Python.
+
+        Returns:
+            dict: {field: [values]} dictionary, same format as `extract`
+        """
+        rows = driver.execute_script(EXTRACT_JS, self.js_spec())
+        return self.rows_to_dict(rows)
+
+    def harvest(self, driver, prune=False, listing_selector="h3.p-name"):
+        """
+        Extracts the listing cards appended to the page since the previous harvest.
+
+        Args:
+            driver (WebDriver): Browser with the results page loaded
+            prune (bool, optional): Empty the harvested cards so that the page stops growing. Defaults to False.
+            listing_selector (str, optional): Selector the scroll engine counts listings with. Defaults to "h3.p-name".
+
+        Returns:
+            list: Per-card value arrays in `fields` order (see `rows_to_dict`)
+        """
+        return driver.execute_script(HARVEST_JS, self.js_spec(), prune, listing_selector)
+
+    def rows_to_dict(self, rows):
+        """
+        Converts per-card value arrays (in `fields` order) into a {field: [values]} dictionary.
+        """
+        keys = list(self.fields)
+        attributes_dict = {key: [] for key in keys}
+        required = keys.index(self.required) if self.required else None
+        for row in rows:
+            if required is not None and not row[required]:
+                continue
+            for key, val in zip(keys, row):
+                attributes_dict[key].append(val)
+        return attributes_dict
+
+    def iter_records(self, page):
+        """
+        Yields one {field: text} dictionary per listing card.
+        """
+        for card in self._cards(self.to_tree(page)):
+            record = {}
+            for key, xpath in self._fields.items():
+                match = xpath(card)
+                record[key] = self._text(match[0]) if match else None
+            if self.required and not record.get(self.required):
+                continue
+            yield record
+
+    def extract(self, page):
+        """
+        Returns the page content as a {field: [values]} dictionary (one value per hotel).
+        """
+        attributes_dict = {key: [] for key in self.fields}
+        for record in self.iter_records(page):
+            for key in self.fields:
+                attributes_dict[key].append(record[key])
+        return attributes_dict
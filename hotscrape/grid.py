@@ -0,0 +1,173 @@
+import json
+import hashlib
+import logging
+import itertools
+from . search_parser import Search
+from . checkpoint import _normalize
+
+logger = logging.getLogger("hotels-scraper.grid.grid")
+
+# Config keys expanded into grid dimensions, besides the search span
+GRID_KEYS = ("nights", "adults", "price_bands")
+
+
+def _parse_list(val, default):
+    """
+    Parses a comma separated list of integers, e.g. "1,2,3". A single value gives a one item list.
+    """
+    if val is None or str(val).strip() in ("", "None"):
+        return [default]
+    return [int(item) for item in str(val).split(",") if item.strip()]
+
+
+def _parse_bands(val):
+    """
+    Parses price bands, e.g. "0-150,150-300,300-10000", into [(price_min, price_max), ...].
+    """
+    bands = []
+    for band in str(val).split(","):
+        if not band.strip():
+            continue
+        price_min, _, price_max = band.partition("-")
+        bands.append((int(price_min), int(price_max)))
+    return bands
+
+
+class Shard(object):
+
+    """
+    Slice `index` of `count` (0 <= index < count) of a search plan.
+
+    Searches are assigned by a hash of their grid cell (destination, filters, day of the search
+    span, nights, adults and price band), not by their position in the plan, so every process
+    computes the same disjoint slices regardless of config order or of the day it starts.
+
+    Args:
+        index (int): Slice of this process
+        count (int): Number of slices
+    """
+
+    def __init__(self, index, count):
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"Invalid shard {index}/{count}, expected 0 <= index < count")
+        self.index = index
+        self.count = count
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        Parses an "index/count" string, e.g. "0/4".
+        """
+        index, sep, count = str(spec).partition("/")
+        if not sep:
+            raise ValueError(f"Invalid shard {spec!r}, expected index/count (e.g. 0/4)")
+        return cls(int(index), int(count))
+
+    def owns(self, key):
+        """
+        Returns True if the cell `key` belongs to this shard.
+        """
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return int(digest, 16) % self.count == self.index
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+    def __repr__(self):
+        return f"Shard({self.index}, {self.count})"
+
+
+class SearchGrid(object):
+
+    """
+    Lazily expands search config sections into the cross product of their dimensions:
+    checkin date (`search_span` days), `nights`, `adults` and `price_bands`.
+
+    Dimension keys take comma separated lists (`nights = 1,2,7`, `adults = 1,2`,
+    `price_bands = 0-150,150-300,300-10000`); single values behave as before. Searches are built
+    one at a time while iterating, and only for the cells of `shard`.
+
+    Args:
+        search_list (list): Search config sections
+        start (datetime, optional): Date the search span is counted from, see `Search.generate`.
+        shard (Shard, optional): Only yield this slice of the grid. Defaults to the whole grid.
+        count_key (str, optional): Key to use for search span. Defaults to "search_span".
+    """
+
+    def __init__(self, search_list, start=None, shard=None, count_key="search_span"):
+        self.search_list = search_list if isinstance(search_list, list) else [search_list]
+        self.start = start
+        self.shard = shard
+        self.count_key = count_key
+
+    def dimensions(self, config):
+        """
+        Returns the values of each dimension of a config section: (days, nights, adults, price bands).
+        """
+        days = range(1, int(config.get(self.count_key)) + 1)
+        nights = _parse_list(config.get("nights"), 1)
+        adults = _parse_list(config.get("adults"), 2)
+        if config.get("price_bands"):
+            bands = _parse_bands(config["price_bands"])
+        else:
+            bands = [(config.get("price_min", 0), config.get("price_max", 10000))]
+        return days, nights, adults, bands
+
+    def cells(self):
+        """
+        Yields (config, day) of every grid cell, the config having a single value per dimension.
+        """
+        for section in self.search_list:
+            base = {key: val for key, val in section.items() if key not in GRID_KEYS}
+            for day, nights, adults, (price_min, price_max) in itertools.product(*self.dimensions(section)):
+                yield dict(base, nights=nights, adults=adults, price_min=price_min, price_max=price_max), day
+
+    @staticmethod
+    def cell_key(config, day):
+        """
+        Stable key of a grid cell. Relative to the search span, so it does not depend on the start date.
+        """
+        params = {key: _normalize(Search._recast(val)) for key, val in config.items() if key != "search_span"}
+        params["day"] = day
+        return json.dumps(params, sort_keys=True, default=str)
+
+    def _owned(self):
+        for config, day in self.cells():
+            if self.shard is None or self.shard.owns(self.cell_key(config, day)):
+                yield config, day
+
+    def size(self):
+        """
+        Returns the number of cells of the whole grid, without expanding it.
+        """
+        total = 0
+        for section in self.search_list:
+            n_cells = 1
+            for values in self.dimensions(section):
+                n_cells *= len(values)
+            total += n_cells
+        return total
+
+    def __len__(self):
+        """
+        Number of searches this grid yields (hashes the cell keys, no searches are built).
+        """
+        if self.shard is None:
+            return self.size()
+        return sum(1 for _ in self._owned())
+
+    def __iter__(self):
+        for config, day in self._owned():
+            yield Search(config, start=self.start, counter=day).to_dict()
+
+    def describe(self):
+        """
+        Logs and prints the plan size. Returns the number of searches this grid yields.
+        """
+        n_searches = len(self)
+        msg = f"[~] Search plan: {self.size()} searches in {len(self.search_list)} config sections"
+        if self.shard is not None:
+            msg += f", {n_searches} in shard {self.shard}"
+        logger.info(msg)
+        print(msg)
+        return n_searches
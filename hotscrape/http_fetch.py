@@ -0,0 +1,177 @@
+import logging
+import threading
+import http.client
+from queue import LifoQueue, Empty
+from urllib.parse import urljoin, urlsplit
+
+logger = logging.getLogger("hotels-scraper.http_fetch.http_fetch")
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:76.0) Gecko/20100101 Firefox/76.0",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Connection": "keep-alive",
+}
+
+# Raised when a kept-alive connection was closed by the server in the meantime, the request is retried once
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionResetError, BrokenPipeError)
+
+# Statuses followed to their `Location`
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+
+class HttpResponse(object):
+    """
+    Status, headers and decoded body of a fetched page.
+    """
+
+    def __init__(self, url, status, headers, body):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def ok(self):
+        # Redirects are followed by `HttpSession.get`, one left over is not the requested page
+        return 200 <= self.status < 300
+
+    @property
+    def text(self):
+        charset = "utf-8"
+        content_type = self.headers.get("content-type", "")
+        if "charset=" in content_type:
+            charset = content_type.split("charset=", 1)[1].split(";")[0].strip()
+        return self.body.decode(charset, errors="replace")
+
+
+class HttpSession(object):
+
+    """
+    Thread-safe HTTP client keeping a pool of keep-alive connections per host.
+
+    Threads take an idle connection of the host (or open a new one while fewer than
+    `max_connections` are open) and hand it back after reading the response, so concurrent
+    page fetches reuse a few warm connections instead of opening one per request.
+
+    Args:
+        max_connections (int, optional): Max open connections per host. Defaults to 8.
+        timeout (float, optional): Socket timeout in seconds. Defaults to 30.
+        headers (dict, optional): Request headers, added to `DEFAULT_HEADERS`.
+        max_redirects (int, optional): Redirects followed per request. Defaults to 5.
+    """
+
+    def __init__(self, max_connections=8, timeout=30, headers=None, max_redirects=5):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.headers = dict(DEFAULT_HEADERS, **(headers or {}))
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._slots = {}
+        self.requests = 0
+        self.connections = 0
+        self.bytes = 0
+
+    def _pool(self, origin):
+        with self._lock:
+            if origin not in self._idle:
+                self._idle[origin] = LifoQueue()
+                self._slots[origin] = threading.BoundedSemaphore(self.max_connections)
+            return self._idle[origin], self._slots[origin]
+
+    def _connect(self, scheme, host, port):
+        with self._lock:
+            self.connections += 1
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port or 443, timeout=self.timeout)
+        return http.client.HTTPConnection(host, port or 80, timeout=self.timeout)
+
+    def get(self, url, headers=None):
+        """
+        Fetches `url`, following up to `max_redirects` redirects. Blocks while all connections
+        to its host are busy.
+
+        Returns:
+            HttpResponse: Response (error statuses, and a redirect past the hop limit, are returned, not raised)
+
+        Raises:
+            OSError: The request failed at the connection level
+        """
+        res = self._get(url, headers)
+        for _ in range(self.max_redirects):
+            location = res.headers.get("location")
+            if res.status not in REDIRECT_STATUSES or not location:
+                break
+            res = self._get(urljoin(res.url, location), headers)
+        else:
+            if res.status in REDIRECT_STATUSES:
+                logger.warning(f"Too many redirects fetching {url}")
+        return res
+
+    def _get(self, url, headers=None):
+        parts = urlsplit(url)
+        origin = (parts.scheme, parts.hostname, parts.port)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        headers = dict(self.headers, **(headers or {}))
+        idle, slots = self._pool(origin)
+        with slots:
+            try:
+                conn, reused = idle.get_nowait(), True
+            except Empty:
+                conn, reused = self._connect(*origin), False
+            try:
+                try:
+                    res = self._request(conn, path, headers)
+                except _STALE_ERRORS:
+                    if not reused:
+                        raise
+                    conn.close()
+                    conn = self._connect(*origin)
+                    res = self._request(conn, path, headers)
+            except Exception:
+                conn.close()
+                raise
+            status, res_headers, body, keep_alive = res
+            if keep_alive:
+                idle.put(conn)
+            else:
+                conn.close()
+        with self._lock:
+            self.requests += 1
+            self.bytes += len(body)
+        return HttpResponse(url, status, res_headers, body)
+
+    @staticmethod
+    def _request(conn, path, headers):
+        conn.request("GET", path, headers=headers)
+        res = conn.getresponse()
+        body = res.read()
+        res_headers = {key.lower(): val for key, val in res.getheaders()}
+        return res.status, res_headers, body, not res.will_close
+
+    def stats(self):
+        """
+        Returns the totals so far: requests sent, connections opened and bytes received.
+        """
+        with self._lock:
+            return {"requests": self.requests, "connections": self.connections, "bytes": self.bytes}
+
+    def close(self):
+        """
+        Closes the idle connections.
+        """
+        with self._lock:
+            pools = list(self._idle.values())
+        for idle in pools:
+            while True:
+                try:
+                    idle.get_nowait().close()
+                except Empty:
+                    break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import logging
+import tempfile
+from datetime import datetime
+from contextlib import contextmanager
+import pandas as pd
+from . import sql
+
+logger = logging.getLogger("hotels-scraper.metrics.metrics")
+
+# Timed stages of a search, in execution order
+STAGES = ("acquire", "navigate", "scroll", "pages", "harvest", "page_source", "extract_js", "extract", "parse", "hash", "archive", "to_sql")
+
+# Per-search counters and gauges
+COUNTERS = ("scrolls", "listings", "html_bytes", "rows", "rows_inserted", "rows_skipped", "rss_mb",
+            "requests", "proxy_connections", "blocked_connections", "downloaded_bytes", "pages", "rows_unchanged")
+
+# Counters that are sampled values rather than running totals
+GAUGES = ("rss_mb",)
+
+
+class SearchMetrics(object):
+
+    """
+    Stage timings (seconds) and counters of a single search.
+
+    Travels with the search through the scrape, parse and write stages (and across process
+    boundaries, it only holds plain dictionaries).
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+        # Deadline that cut the search short, see `watchdog.TIMEOUT_REASONS`
+        self.timeout_reason = None
+        # Why not all results were loaded ("scroll_error", "scroll_timeout", "scroll_deadline" or "page_error")
+        self.incomplete_reason = None
+
+    @contextmanager
+    def timer(self, stage):
+        """
+        Context manager adding the duration of the block to `stage`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0) + time.perf_counter() - start
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        if value is not None:
+            self.counters[name] = value
+
+    def to_record(self):
+        """
+        Returns the metrics as a flat dictionary (`<stage>_s` timings and counters).
+        """
+        record = {f"{stage}_s": seconds for stage, seconds in self.timings.items()}
+        record.update(self.counters)
+        if self.timeout_reason is not None:
+            record["timeout_reason"] = self.timeout_reason
+        return record
+
+    @classmethod
+    def from_record(cls, record):
+        """
+        Rebuilds metrics from `to_record` output (e.g. sent over the work queue).
+        """
+        metrics = cls()
+        for key, val in record.items():
+            if key == "timeout_reason":
+                metrics.timeout_reason = val
+            elif key.endswith("_s") and key[:-2] in STAGES:
+                metrics.timings[key[:-2]] = val
+            elif val is not None:
+                metrics.counters[key] = val
+        return metrics
+
+
+class MetricsRecorder(object):
+
+    """
+    Stores per-search metrics in the `search_metrics` table and optionally exports them.
+
+    Args:
+        run_id (str, optional): Run the searches belong to
+        jsonl_path (str, optional): Append one JSON line per search to this file
+        prom_path (str, optional): Maintain a Prometheus textfile (node_exporter textfile collector)
+            with running totals at this path
+        prom_every (int, optional): Rewrite the Prometheus file every this many searches. Defaults to 10.
+    """
+
+    def __init__(self, run_id=None, jsonl_path=None, prom_path=None, prom_every=10):
+        self.run_id = run_id
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.prom_every = prom_every
+        self.n_searches = 0
+        self.stage_seconds = {}
+        self.stage_counts = {}
+        self.totals = {}
+        self.gauges = {}
+        self.timeouts = {}
+
+    def record(self, conn, search_id, metrics):
+        """
+        Records the metrics of a stored search.
+
+        Args:
+            conn (Connection): Database connection, the table is skipped if None
+            search_id (int): Id of the search in the `search` table
+            metrics (SearchMetrics): Metrics of the search
+        """
+        record = metrics.to_record()
+        row = {"run_id": self.run_id, "recorded_at": datetime.now(), "timeout_reason": metrics.timeout_reason}
+        row.update({key: val for key, val in record.items()
+                    if key in COUNTERS or (key.endswith("_s") and key[:-2] in STAGES)})
+
+        if conn is not None:
+            sql.to_sql(pd.DataFrame(row, index=pd.Index([int(search_id)], name="id")), "search_metrics", conn)
+
+        if self.jsonl_path:
+            line = dict(record, search_id=int(search_id), run_id=self.run_id, recorded_at=row["recorded_at"].isoformat())
+            with open(self.jsonl_path, "a") as file:
+                file.write(json.dumps(line) + "\n")
+
+        self.n_searches += 1
+        for stage, seconds in metrics.timings.items():
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0) + seconds
+            self.stage_counts[stage] = self.stage_counts.get(stage, 0) + 1
+        if metrics.timeout_reason is not None:
+            self.timeouts[metrics.timeout_reason] = self.timeouts.get(metrics.timeout_reason, 0) + 1
+        for name, value in metrics.counters.items():
+            if name in GAUGES:
+                self.gauges[name] = value
+            else:
+                self.totals[name] = self.totals.get(name, 0) + value
+
+        if self.prom_path and self.n_searches % self.prom_every == 0:
+            self.write_prometheus()
+
+    def prometheus_text(self):
+        """
+        Returns the running totals in the Prometheus text exposition format.
+        """
+        lines = [
+            "# HELP hotscrape_searches_total Searches stored",
+            "# TYPE hotscrape_searches_total counter",
+            f"hotscrape_searches_total {self.n_searches}",
+            "# HELP hotscrape_stage_seconds Time spent per scraping stage",
+            "# TYPE hotscrape_stage_seconds summary",
+        ]
+        for stage in sorted(self.stage_seconds):
+            lines.append(f'hotscrape_stage_seconds_sum{{stage="{stage}"}} {self.stage_seconds[stage]:.6f}')
+            lines.append(f'hotscrape_stage_seconds_count{{stage="{stage}"}} {self.stage_counts[stage]}')
+        if self.timeouts:
+            lines.append("# HELP hotscrape_timeouts_total Searches cut short by a deadline")
+            lines.append("# TYPE hotscrape_timeouts_total counter")
+        for reason in sorted(self.timeouts):
+            lines.append(f'hotscrape_timeouts_total{{reason="{reason}"}} {self.timeouts[reason]}')
+        for name in sorted(self.totals):
+            lines.append(f"# TYPE hotscrape_{name}_total counter")
+            lines.append(f"hotscrape_{name}_total {self.totals[name]}")
+        for name in sorted(self.gauges):
+            lines.append(f"# TYPE hotscrape_{name} gauge")
+            lines.append(f"hotscrape_{name} {self.gauges[name]}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self):
+        # Replace the file atomically so the collector never reads a partial file
+        directory = os.path.dirname(os.path.abspath(self.prom_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as file:
+            file.write(self.prometheus_text())
+        os.replace(tmp_path, self.prom_path)
+
+    def close(self):
+        if self.prom_path:
+            self.write_prometheus()
+        if self.n_searches:
+            summary = ", ".join(f"{stage} {self.stage_seconds[stage] / self.stage_counts[stage]:.2f} s"
+                                for stage in STAGES if stage in self.stage_seconds)
+            msg = f"[~] Mean stage times over {self.n_searches} searches: {summary}"
+            logger.info(msg)
+            print(msg)
+            if self.totals.get("proxy_connections"):
+                # Measured traffic of the lean profile, not a saving: blocked connections never download anything.
+                # Compare with a run without --lean for that
+                msg = f"[~] Browser traffic per search: {self.totals['proxy_connections'] / self.n_searches:.0f} connections " \
+                      f"({self.totals.get('blocked_connections', 0) / self.n_searches:.0f} blocked), " \
+                      f"{self.totals.get('downloaded_bytes', 0) / self.n_searches / 1024:.0f} kB downloaded"
+                logger.info(msg)
+                print(msg)
@@ -0,0 +1,118 @@
+"""
+Migrates a database from the wide `hotels` table to the normalized `hotel` / `price_observation` tables.
+
+    python -m hotscrape.migrate -d default_sql --drop --vacuum
+
+Rows are copied in chunks and upserted, so an interrupted migration can simply be run again.
+Unchanged observations of a delta-stored database (`seen_unchanged`) are marked for the
+normalized observation ids as well.
+"""
+
+import sys
+import logging
+import argparse
+import pandas as pd
+from . import sql
+from . normalize import HOTEL_COLUMNS, OBSERVATION_COLUMNS, split_hotels, create_view, hotel_keys, observation_keys
+from . delta import copy_markers
+from . utils import load_schema
+
+logger = logging.getLogger("hotels-scraper.migrate.migrate")
+
+
+# Columns of the wide `hotels` table copied to the normalized tables (`hotel_key` is computed)
+MIGRATED_COLUMNS = ("id",) + HOTEL_COLUMNS + tuple(col for col in OBSERVATION_COLUMNS if col != "hotel_key")
+
+
+def unmigrated_columns(conn):
+    """
+    Returns the columns of the `hotels` table that have no counterpart in the normalized tables.
+    """
+    return sorted(row[1] for row in conn.execute("PRAGMA table_info(hotels)") if row[1] not in MIGRATED_COLUMNS)
+
+
+def migrate(conn, chunksize=50000, drop=False, vacuum=False):
+    """
+    Copies the `hotels` table into the normalized tables.
+
+    Args:
+        conn (Connection): Database connection (created with the current schema)
+        chunksize (int, optional): Rows read per chunk. Defaults to 50000.
+        drop (bool, optional): Empty the `hotels` table after copying. Refused while it has columns
+            that are not migrated, see `unmigrated_columns`. Defaults to False.
+        vacuum (bool, optional): Run VACUUM afterwards to return the freed pages to the OS. Defaults to False.
+
+    Returns:
+        tuple: (number of hotels, number of price observations) in the normalized tables
+
+    Raises:
+        ValueError: `drop` was requested but some columns would be lost
+    """
+    if drop:
+        unmigrated = unmigrated_columns(conn)
+        if unmigrated:
+            raise ValueError(f"Refusing to empty <hotels>, columns {unmigrated} are not migrated to the normalized tables")
+
+    n_rows = conn.execute("SELECT COUNT(*) FROM hotels").scalar()
+    msg = f"[~] Migrating {n_rows} rows of <hotels> to <hotel> and <price_observation> ..."
+    logger.info(msg)
+    print(msg)
+
+    columns = list(MIGRATED_COLUMNS)
+    # Keyset pagination on the primary key keeps every chunk an index range scan
+    last_id = None
+    while True:
+        query = f"SELECT {', '.join(columns)} FROM hotels"
+        params = []
+        if last_id is not None:
+            query += " WHERE id > ?"
+            params.append(last_id)
+        query += f" ORDER BY id LIMIT {int(chunksize)}"
+        df = pd.DataFrame.from_records(conn.execute(query, *params).fetchall(), columns=columns)
+        if df.empty:
+            break
+        first_id, last_id = int(df["id"].iloc[0]), int(df["id"].iloc[-1])
+        df_hotel, df_observation = split_hotels(df.set_index("id"))
+        # Wide ids hash the whole row, normalized ones the search and hotel
+        new_ids = observation_keys(df.assign(hotel_key=hotel_keys(df)))
+        with conn.begin():
+            sql.to_sql(df_hotel, "hotel", conn)
+            sql.to_sql(df_observation, "price_observation", conn)
+            copy_markers(conn, dict(zip(df["id"].astype(int), new_ids.astype(int))), first_id, last_id)
+
+    create_view(conn)
+    n_hotels = conn.execute("SELECT COUNT(*) FROM hotel").scalar()
+    n_observations = conn.execute("SELECT COUNT(*) FROM price_observation").scalar()
+    msg = f"[~] Migrated to {n_hotels} hotels and {n_observations} price observations"
+    logger.info(msg)
+    print(msg)
+
+    if drop:
+        # The table itself stays so that the schema (and wide mode) remain valid
+        conn.execute("DELETE FROM hotels")
+    if vacuum:
+        conn.execute("VACUUM")
+    return n_hotels, n_observations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate a hotscrape database to the normalized schema")
+    parser.add_argument("-d", "--database", default="default_sql", help="Path to database (e.g. default_sql.db)")
+    parser.add_argument("-s", "--schema", default="db_schema.yml", help="Database schema file")
+    parser.add_argument("--chunksize", type=int, default=50000, help="Rows copied per chunk")
+    parser.add_argument("--drop", action="store_true", help="Delete the rows of the wide hotels table after copying")
+    parser.add_argument("--vacuum", action="store_true", help="Compact the database file afterwards")
+    args = parser.parse_args(argv)
+
+    conn = sql.create_database(args.database, load_schema(args.schema))
+    try:
+        migrate(conn, chunksize=args.chunksize, drop=args.drop, vacuum=args.vacuum)
+    except ValueError as error:
+        logger.error(error)
+        print(f"[!] {error}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
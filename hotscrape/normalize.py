@@ -0,0 +1,104 @@
+import logging
+import pandas as pd
+from . import sql
+
+logger = logging.getLogger("hotels-scraper.normalize.normalize")
+
+SCHEMA_MODES = ("wide", "normalized")
+
+# Static listing attributes, stored once per hotel in the `hotel` dimension
+HOTEL_COLUMNS = ("name", "address", "amenities", "details", "landmarks", "review_box", "star_rating", "distance_centre")
+
+# Attributes that change between searches, stored in the `price_observation` fact table
+OBSERVATION_COLUMNS = ("search_id", "hotel_key", "price", "price_sale", "price_metadata", "rating", "rating_sentiment",
+                       "num_reviews")
+
+# Read-only view presenting the normalized tables with the columns of the wide `hotels` table
+VIEW_NAME = "hotel_observations"
+VIEW_SQL = f"""CREATE VIEW {VIEW_NAME} AS
+SELECT o.id, o.search_id, o.hotel_key, h.name, h.address, h.amenities, h.details, h.landmarks, h.review_box,
+       h.star_rating, h.distance_centre, o.price, o.price_sale, o.price_metadata, o.rating, o.rating_sentiment,
+       o.num_reviews
+FROM price_observation o JOIN hotel h ON h.hotel_key = o.hotel_key"""
+
+
+def _hash(df):
+    return (pd.util.hash_pandas_object(df, index=False) % 0xffffffff).astype(int)
+
+
+def hotel_keys(df):
+    """
+    Stable hotel key, hashed from the listing's name and address.
+    """
+    return _hash(df[["name", "address"]].fillna("").astype(str))
+
+
+def observation_keys(df):
+    """
+    Observation id, hashed from `search_id` and `hotel_key` (one observation per hotel and search).
+    """
+    return _hash(df[["search_id", "hotel_key"]])
+
+
+def split_hotels(df_attributes):
+    """
+    Splits a `hotels` DataFrame into the `hotel` dimension and `price_observation` facts.
+
+    Args:
+        df_attributes (pd.DataFrame): Parsed hotels, as returned by `Scraper.get_attributes_df`
+
+    Returns:
+        tuple: (hotel DataFrame indexed by hotel_key, price_observation DataFrame indexed by id)
+    """
+    df = df_attributes.reset_index(drop=True)
+    df["hotel_key"] = hotel_keys(df)
+
+    df_hotel = df.drop_duplicates(subset=["hotel_key"]).set_index("hotel_key")
+    df_hotel = df_hotel.reindex(columns=HOTEL_COLUMNS)
+
+    df_observation = df.reindex(columns=OBSERVATION_COLUMNS)
+    df_observation["id"] = observation_keys(df_observation)
+    df_observation = df_observation.drop_duplicates(subset=["id"]).set_index("id")
+    return df_hotel, df_observation
+
+
+def create_view(conn):
+    # Recreated, so that views of older databases get the columns added since
+    conn.execute(f"DROP VIEW IF EXISTS {VIEW_NAME}")
+    conn.execute(VIEW_SQL)
+
+
+def store_hotels(df_attributes, conn, schema_mode="wide"):
+    """
+    Upserts parsed hotels in the layout of `schema_mode`.
+
+    In "wide" mode rows go to the `hotels` table. In "normalized" mode the static attributes are
+    added to the `hotel` dimension (the first stored version of a hotel is kept) and the prices
+    and ratings to `price_observation`.
+
+    Returns:
+        tuple: (inserted, skipped) number of hotel observations
+    """
+    if schema_mode == "wide":
+        return sql.to_sql(df_attributes, "hotels", conn)
+    if schema_mode != "normalized":
+        raise ValueError(f"Unknown schema mode: {schema_mode} (choose from {SCHEMA_MODES})")
+    df_hotel, df_observation = split_hotels(df_attributes)
+    nested = conn.in_transaction()
+    try:
+        with sql.begin(conn):
+            sql.to_sql(df_hotel, "hotel", conn)
+            return sql.to_sql(df_observation, "price_observation", conn)
+    except Exception:
+        # Logged by `to_sql`, raised like its errors inside a transaction of the caller
+        if nested:
+            raise
+        return 0, 0
+
+
+def delete_hotels(conn, search_id, schema_mode="wide"):
+    """
+    Deletes the hotel observations of a search.
+    """
+    table = "hotels" if schema_mode == "wide" else "price_observation"
+    conn.execute(f"DELETE FROM {table} WHERE search_id = ?", int(search_id))
@@ -1,12 +1,22 @@
 import pandas as pd
 import re
 
+# Precompiled patterns for the columnar parsers
+PRICE_PATTERN = re.compile(r"\$(\d+)(?:.*?\$(\d+))?", re.S)
+NUMBER_PATTERN = re.compile(r"([-+]?\d*\.\d+|\d+)")
+INTEGER_PATTERN = re.compile(r"(\d+)")
+MILES_PATTERN = re.compile(r"^(.*?)miles to City center", re.S)
+MILE_PATTERN = re.compile(r"^(.*?)mile to City center", re.S)
+
 def parse_price(row, sale=False):
     """
     Extract price data from `price`column
     """
 
     row = row[1]["price"]
+    # Field missing from the listing card
+    if not isinstance(row, str):
+        return None
     # Extract dollar amounts from string
     row = re.findall(r"\$\d+", row)
     if not row:
@@ -28,6 +38,9 @@ def parse_star_rating(row):
     """
 
     row = row[1]["star_rating"]
+    # Field missing from the listing card
+    if not isinstance(row, str):
+        return None
     return float(row.strip("-star"))
 
 def parse_num_reviews(row):
@@ -36,6 +49,9 @@ def parse_num_reviews(row):
     """
 
     row = row[1]["num_reviews"]
+    # Field missing from the listing card
+    if not isinstance(row, str):
+        return None
     row = re.findall(r"\d+", row)
     if row:
         return int(row[0])
@@ -48,6 +64,9 @@ def parse_rating(row, sentiment=False):
     """
 
     row = row[1]["rating"]
+    # Field missing from the listing card
+    if not isinstance(row, str):
+        return None
     if sentiment:
         row = re.sub(r"[-+]?\d*\.\d+|\d+", "", row).strip()
         if not row:
@@ -67,6 +86,9 @@ def parse_landmarks(row):
     """
 
     row = row[1]["landmarks"]
+    # Field missing from the listing card
+    if not isinstance(row, str):
+        return None
     # Extract distance to city center
     if "miles to City center" in row:
         try:
@@ -84,6 +106,54 @@ def parse_landmarks(row):
 def drop_fully_booked(df):
     return df.dropna(subset=["price", "price_sale"], how="all")
     
+def _str_column(series):
+    """
+    Returns `series` with every non-string value (missing fields) replaced by NaN.
+    """
+    return series.astype(object).where(series.map(lambda val: isinstance(val, str)))
+
+def _to_number(series):
+    return pd.to_numeric(series, errors="coerce")
+
+def parse_price_column(series):
+    """
+    Columnar version of `parse_price`. Returns a (price, price_sale) tuple of Series.
+    """
+    prices = _str_column(series).str.extract(PRICE_PATTERN)
+    return _to_number(prices[0]), _to_number(prices[1])
+
+def parse_star_rating_column(series):
+    """
+    Columnar version of `parse_star_rating`
+    """
+    return _to_number(_str_column(series).str.strip("-star")).astype(float)
+
+def parse_num_reviews_column(series):
+    """
+    Columnar version of `parse_num_reviews`
+    """
+    return _to_number(_str_column(series).str.extract(INTEGER_PATTERN)[0])
+
+def parse_rating_column(series):
+    """
+    Columnar version of `parse_rating`. Returns a (rating, rating_sentiment) tuple of Series.
+    """
+    series = _str_column(series)
+    rating = _to_number(series.str.extract(NUMBER_PATTERN)[0]).astype(float)
+    sentiment = series.str.replace(NUMBER_PATTERN, "", regex=True).str.strip()
+    sentiment = sentiment.where(sentiment.notna() & (sentiment != ""), None)
+    return rating, sentiment
+
+def parse_landmarks_column(series):
+    """
+    Columnar version of `parse_landmarks`
+    """
+    series = _str_column(series)
+    distance = series.str.extract(MILES_PATTERN)[0]
+    # "mile to City center" only applies when "miles to City center" is absent
+    distance = distance.where(distance.notna(), series.str.extract(MILE_PATTERN)[0])
+    return _to_number(distance.str.strip()).astype(float)
+
 def parse(df):
     """
     Top-level function for parsing and formatting a Pandas DataFrame containing hotels.com 
@@ -99,35 +169,15 @@ def parse(df):
     # Store `price` column data in new column
     df["price_metadata"] = df["price"]
 
-    price = []
-    price_sale = []
-    star_rating = []
-    num_reviews = []
-    rating = []
-    rating_sentiment = []
-    city_center_distance = []
-
-    # Row-level processing
+    # Column-level processing (same output as the row-level `parse_*` functions)
     # Add parsing functions as needed
-    for row in df.iterrows():
-        price.append(parse_price(row))
-        price_sale.append(parse_price(row, sale=True))
-        star_rating.append(parse_star_rating(row))
-        num_reviews.append(parse_num_reviews(row))
-        rating.append(parse_rating(row))
-        rating_sentiment.append(parse_rating(row, sentiment=True))
-        city_center_distance.append(parse_landmarks(row))
-    
-    # Update dataframe
-    df["price"] = price
-    df["price_sale"] = price_sale
-    df["star_rating"] = star_rating
-    df["num_reviews"] = num_reviews
-    df["rating"] = rating
-    df["rating_sentiment"] = rating_sentiment
-    df["distance_centre"] = city_center_distance
+    df["price"], df["price_sale"] = parse_price_column(df["price_metadata"])
+    df["star_rating"] = parse_star_rating_column(df["star_rating"])
+    df["num_reviews"] = parse_num_reviews_column(df["num_reviews"])
+    df["rating"], df["rating_sentiment"] = parse_rating_column(df["rating"])
+    df["distance_centre"] = parse_landmarks_column(df["landmarks"])
 
     # Drop fully booked hotels (not of interest)
     df = drop_fully_booked(df)
     
-    return df
\ No newline at end of file
+    return df
@@ -0,0 +1,239 @@
+import logging
+import threading
+from queue import Queue
+from concurrent.futures import ProcessPoolExecutor
+from . import sql
+from . checkpoint import RunCheckpoint
+from . metrics import SearchMetrics
+from . delta import DeltaStore
+from . aggregates import PriceAggregates
+from . store import store_results
+from . watchdog import SearchTimeout
+
+logger = logging.getLogger("hotels-scraper.pipeline.pipeline")
+
+# Marks the end of a stage's input
+_DONE = object()
+
+# Per-process scrapers used by the parse stage in process mode
+_scrapers = {}
+
+
+class _TimedOut(object):
+    """
+    Search that exceeded one of its deadlines, checkpointed by the write stage (which owns the connection).
+    """
+
+    def __init__(self, search, reason):
+        self.search = search
+        self.reason = reason
+
+
+def process_page(scraper_cls, archive, search_dict, page, metrics):
+    """
+    Parse stage entry point for worker processes. Only the post-processing part of the
+    scraper is used, so no browser is started.
+
+    Returns:
+        tuple: (df_search, df_attributes, metrics), the metrics are updated in the worker process
+    """
+    if scraper_cls not in _scrapers:
+        _scrapers[scraper_cls] = scraper_cls(archive=archive)
+    df_search, df_attributes = _scrapers[scraper_cls].process(search_dict, page, metrics=metrics)
+    return df_search, df_attributes, metrics
+
+
+class Pipeline(object):
+
+    """
+    Runs searches as three concurrent stages connected by bounded queues:
+
+        scrape (one thread per browser) -> parse (thread or process pool) -> write (single thread)
+
+    Browsers keep scraping while earlier pages are parsed and written. Full queues block the
+    upstream stage (backpressure), so memory stays bounded when parsing or writing falls behind.
+    The writer thread owns the only database connection and commits every `batch_size` searches.
+
+    Args:
+        scraper (Scraper): Scraper whose driver pool is used by the scrape stage
+        db_path (str): Path to database file (without .db extension)
+        schema (dict): Database schema
+        scrape_threads (int, optional): Number of concurrent scrape threads. Defaults to the driver pool size.
+        parse_workers (int, optional): Number of parse threads/processes. Defaults to 2.
+        use_processes (bool, optional): Parse in worker processes instead of threads. Defaults to False.
+        queue_size (int, optional): Capacity of each inter-stage queue. Defaults to 8.
+        batch_size (int, optional): Number of searches committed per transaction. Defaults to 1.
+        db_profile (str, optional): SQLite PRAGMA profile of the writer connection. Defaults to "fast".
+        run_id (str, optional): Run whose checkpoints are updated as searches are written.
+        recorder (MetricsRecorder, optional): Records the metrics of every written search (writer thread).
+        schema_mode (str, optional): Layout of the hotel tables, "wide" or "normalized". Defaults to "wide".
+        update_aggregates (bool, optional): Refresh the price aggregates after every batch (writer thread). Defaults to False.
+        delta (bool, optional): Only store the hotel observations that changed, see `DeltaStore`. Defaults to False.
+    """
+
+    def __init__(self, scraper, db_path, schema, scrape_threads=None, parse_workers=2, use_processes=False,
+                 queue_size=8, batch_size=1, db_profile="fast", run_id=None, recorder=None,
+                 schema_mode="wide", update_aggregates=False, delta=False):
+        self.scraper = scraper
+        self.db_path = db_path
+        self.schema = schema
+        self.scrape_threads = scrape_threads or (scraper.pool.size if scraper.pool is not None else 1)
+        self.parse_workers = parse_workers
+        self.use_processes = use_processes
+        self.batch_size = batch_size
+        self.db_profile = db_profile
+        self.run_id = run_id
+        self.recorder = recorder
+        self.schema_mode = schema_mode
+        self.update_aggregates = update_aggregates
+        self.delta = delta
+        self.parse_queue = Queue(maxsize=queue_size)
+        self.write_queue = Queue(maxsize=queue_size)
+        self.n_failed = 0
+        self.n_written = 0
+        self.writer_error = None
+        self._lock = threading.Lock()
+
+    def _failed(self):
+        with self._lock:
+            self.n_failed += 1
+
+    def _scrape(self, searches, searches_lock):
+        while True:
+            with searches_lock:
+                search = next(searches, None)
+            if search is None:
+                return
+            metrics = SearchMetrics()
+            try:
+                search_dict, page = self.scraper.fetch(search, metrics=metrics)
+            except SearchTimeout as error:
+                # Not marked done, a resumed run retries it
+                logger.error(f"Scraping timed out: {search} ({error.reason})")
+                self._failed()
+                self.write_queue.put(_TimedOut(search, error.reason))
+                continue
+            except Exception as error:
+                logger.error(f"Scraping failed: {search} ({error!r})")
+                self._failed()
+                continue
+            if page is None:
+                self._failed()
+                continue
+            self.parse_queue.put((search_dict, page, metrics))
+
+    def _parse(self, executor):
+        while True:
+            item = self.parse_queue.get()
+            if item is _DONE:
+                return
+            search_dict, page, metrics = item
+            try:
+                if executor is not None:
+                    item = executor.submit(process_page, type(self.scraper), self.scraper.archive,
+                                           search_dict, page, metrics).result()
+                else:
+                    item = self.scraper.process(search_dict, page, metrics=metrics) + (metrics,)
+            except Exception as error:
+                logger.error(f"Parsing failed: {search_dict} ({error!r})")
+                self._failed()
+                continue
+            self.write_queue.put(item)
+
+    def _drain(self, queue):
+        # Keeps upstream stages from blocking on a stage that died
+        while True:
+            item = queue.get()
+            if item is _DONE:
+                return
+            if not isinstance(item, _TimedOut):
+                # Timeouts were counted by the scrape stage already
+                self._failed()
+
+    def _write(self):
+        self._write_done = False
+        try:
+            self._store_all()
+        except Exception as error:
+            # Re-raised by `run`
+            logger.error(f"Writer failed ({error!r})")
+            self.writer_error = error
+            if not self._write_done:
+                self._drain(self.write_queue)
+
+    def _store_all(self):
+        # SQLite connections must be used by the thread that created them
+        conn = sql.create_database(self.db_path, self.schema, profile=self.db_profile)
+        try:
+            checkpoint = RunCheckpoint(conn, self.run_id) if self.run_id is not None else None
+            aggregates = PriceAggregates(conn, schema_mode=self.schema_mode, every=self.batch_size,
+                                         delta=self.delta) if self.update_aggregates else None
+            delta = DeltaStore(conn, schema_mode=self.schema_mode) if self.delta else None
+            with sql.TransactionBatch(conn, size=self.batch_size) as batch:
+                while True:
+                    item = self.write_queue.get()
+                    if item is _DONE:
+                        self._write_done = True
+                        break
+                    if isinstance(item, _TimedOut):
+                        if checkpoint is not None:
+                            checkpoint.mark(item.search, status=item.reason, result_offset=item.search.get("result_offset"))
+                        batch.step()
+                        continue
+                    df_search, df_attributes, metrics = item
+                    try:
+                        if store_results(df_search, df_attributes, conn, batch=batch, checkpoint=checkpoint, metrics=metrics,
+                                         recorder=self.recorder, schema_mode=self.schema_mode, aggregates=aggregates, delta=delta):
+                            self.n_written += 1
+                        else:
+                            self._failed()
+                    except Exception as error:
+                        logger.error(f"Writing failed ({error!r})")
+                        self._failed()
+            if aggregates is not None:
+                aggregates.flush()
+        finally:
+            conn.close()
+
+    def run(self, searches):
+        """
+        Scrapes, parses and stores all `searches`. Returns once every stage has drained.
+
+        Returns:
+            int: Number of searches that failed
+
+        Raises:
+            Exception: The error the write stage failed with, the searches it could not store are counted as failed
+        """
+        searches = iter(searches)
+        searches_lock = threading.Lock()
+        executor = ProcessPoolExecutor(max_workers=self.parse_workers) if self.use_processes else None
+
+        writer = threading.Thread(target=self._write, name="hotscrape-writer", daemon=True)
+        parsers = [threading.Thread(target=self._parse, args=(executor,), name=f"hotscrape-parse-{i}", daemon=True)
+                   for i in range(self.parse_workers)]
+        scrapers = [threading.Thread(target=self._scrape, args=(searches, searches_lock), name=f"hotscrape-scrape-{i}", daemon=True)
+                    for i in range(self.scrape_threads)]
+        for thread in [writer] + parsers + scrapers:
+            thread.start()
+
+        try:
+            # Shut down stage by stage so that every queued item is processed
+            for thread in scrapers:
+                thread.join()
+            for _ in parsers:
+                self.parse_queue.put(_DONE)
+            for thread in parsers:
+                thread.join()
+            self.write_queue.put(_DONE)
+            writer.join()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        msg = f"[~] Pipeline finished: {self.n_written} searches written, {self.n_failed} failed"
+        logger.info(msg)
+        print(msg)
+        if self.writer_error is not None:
+            raise self.writer_error
+        return self.n_failed
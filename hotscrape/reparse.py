@@ -0,0 +1,86 @@
+import logging
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from . scraper import SITES
+from . delta import replace_observations
+
+logger = logging.getLogger("hotels-scraper.reparse.reparse")
+
+# Searches stored before the site was recorded were all scraped from hotels.com
+DEFAULT_SITE = "hotels"
+
+# Per-process scrapers by site (post-processing only, never start a browser)
+_scrapers = {}
+
+
+def reparse_page(archive, search_id, page_hash, page_codec, site=None):
+    """
+    Re-extracts and re-parses one archived page with the adapter of the site it was fetched from.
+    Runs in a worker process.
+
+    Returns:
+        tuple: (search_id, hotels DataFrame), the DataFrame is None if the page could not be re-parsed
+    """
+    site = site or DEFAULT_SITE
+    if site not in SITES:
+        logger.error(f"Not re-parsing page {page_hash} of search {search_id}, unknown site {site!r}")
+        return search_id, None
+    if site not in _scrapers:
+        _scrapers[site] = SITES[site]()
+    scraper = _scrapers[site]
+    try:
+        page = archive.get(page_hash, page_codec)
+        res = scraper.get_attributes(page)
+        return search_id, scraper.get_attributes_df(res, search_id)
+    except Exception as error:
+        logger.error(f"Could not re-parse page {page_hash} of search {search_id} ({error!r})")
+        return search_id, None
+
+
+def reparse(conn, archive, workers=None, chunksize=8, schema_mode="wide"):
+    """
+    Rebuilds the hotel observations from the page archive, without a browser.
+
+    The hotels of every search with an archived page are replaced by the output of the
+    current extractor and parser of the site the search was scraped from (`search.site`).
+    Searches stored in delta mode get all of their observations stored, and the unchanged
+    markers of later searches follow the replaced observations (see `replace_observations`).
+    Pages are processed on a pool of worker processes.
+
+    Args:
+        conn (Connection): Database connection
+        archive (PageArchive): Archive holding the raw pages
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        chunksize (int, optional): Pages handed to a worker at a time. Defaults to 8.
+        schema_mode (str, optional): Layout of the hotel tables, "wide" or "normalized". Defaults to "wide".
+
+    Returns:
+        tuple: (number of re-parsed searches, number of failed searches)
+    """
+    rows = conn.execute("SELECT id, page_hash, page_codec, site FROM search WHERE page_hash IS NOT NULL").fetchall()
+    msg = f"[~] Re-parsing {len(rows)} archived pages ..."
+    logger.info(msg)
+    print(msg)
+
+    ids, hashes, codecs, sites = zip(*rows) if rows else ((), (), (), ())
+    n_done = n_failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for search_id, df_attributes in executor.map(reparse_page, repeat(archive), ids, hashes, codecs, sites,
+                                                     chunksize=chunksize):
+            if df_attributes is None:
+                n_failed += 1
+                continue
+            try:
+                with conn.begin():
+                    replace_observations(conn, search_id, df_attributes, schema_mode=schema_mode)
+            except Exception as error:
+                # The previous hotels of the search are kept
+                logger.error(f"Could not store the re-parsed hotels of search {search_id} ({error!r})")
+                n_failed += 1
+                continue
+            n_done += 1
+
+    msg = f"[~] Re-parsed {n_done} searches ({n_failed} failed)"
+    logger.info(msg)
+    print(msg)
+    return n_done, n_failed
@@ -0,0 +1,173 @@
+import time
+import heapq
+import random
+import logging
+import pandas as pd
+
+logger = logging.getLogger("hotels-scraper.scheduler.scheduler")
+
+
+def destination_key(search):
+    """
+    Returns the (city, state, country) tuple of a search dictionary.
+    """
+    destination = search.get("destination") or search
+    return tuple(str(destination.get(key) or "").strip().lower() for key in ("city", "state", "country"))
+
+
+class TokenBucket(object):
+
+    """
+    Token bucket rate limiter.
+
+    Args:
+        rate (float): Tokens added per minute
+        burst (int, optional): Bucket capacity, i.e. the number of requests that may be sent back to back. Defaults to 1.
+        clock (callable, optional): Monotonic clock in seconds. Defaults to `time.monotonic`.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError(f"Rate must be positive: {rate}")
+        self.rate = rate / 60
+        self.burst = max(1, burst)
+        self.clock = clock
+        self.tokens = float(self.burst)
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """
+        Returns the number of seconds until a token is available (0 if one is available now).
+        """
+        self._refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+
+class SearchScheduler(object):
+
+    """
+    Orders and paces the search plan.
+
+    Searches are emitted nearest checkin date first (shortest lead time) across all destinations,
+    instead of one destination's whole date span after the other. Every destination has its own
+    token bucket and all requests share a global one; when a destination is throttled, the most
+    urgent search of another destination goes first, so the global budget is used whenever
+    possible. Iterating blocks (sleeps) until the next search may be sent.
+
+    The plan is read lazily: at most `window` searches are held and ordered at a time, the next
+    ones are pulled as searches are emitted. Plans longer than the window are ordered within it,
+    so generators of any size (or endless ones) can be scheduled in constant memory.
+
+    Args:
+        searches (iterable): Search dictionaries (as returned by `Search.to_dict`)
+        rpm (float, optional): Global requests per minute. Unlimited if omitted.
+        destination_rpm (float, optional): Requests per minute per destination. Unlimited if omitted.
+        destination_burst (int, optional): Requests a destination may receive back to back. Defaults to 1.
+        jitter (float, optional): Max random extra delay in seconds before each search. Defaults to 0.
+        clock (callable, optional): Monotonic clock in seconds. Defaults to `time.monotonic`.
+        sleep (callable, optional): Sleep function. Defaults to `time.sleep`.
+        rng (random.Random, optional): Random generator used for the jitter.
+        window (int, optional): Max searches read ahead of the one emitted. Unbounded if None. Defaults to 10000.
+    """
+
+    def __init__(self, searches, rpm=None, destination_rpm=None, destination_burst=1, jitter=0.0,
+                 clock=time.monotonic, sleep=time.sleep, rng=None, window=10000):
+        self.rpm = rpm
+        self.destination_rpm = destination_rpm
+        self.destination_burst = destination_burst
+        self.jitter = jitter
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+        self.bucket = TokenBucket(rpm, clock=clock) if rpm else None
+        self.buckets = {}
+        self.queues = {}
+        self.waited = 0.0
+        self.window = window
+        self._searches = iter(searches)
+        self._seq = 0
+        self._exhausted = False
+        self._fill()
+
+    def _fill(self):
+        """
+        Reads searches from the plan until the window is full or the plan is exhausted.
+        """
+        while not self._exhausted and (self.window is None or len(self) < self.window):
+            try:
+                search = next(self._searches)
+            except StopIteration:
+                self._exhausted = True
+                break
+            self.add(search, self._seq)
+            self._seq += 1
+
+    def add(self, search, seq=0):
+        dest = destination_key(search)
+        # Lead time ordering: earlier checkin first, plan order breaks ties
+        checkin = pd.to_datetime(search.get("checkin_datetime"))
+        heapq.heappush(self.queues.setdefault(dest, []), (checkin, seq, search))
+        if self.destination_rpm and dest not in self.buckets:
+            self.buckets[dest] = TokenBucket(self.destination_rpm, burst=self.destination_burst, clock=self.clock)
+
+    def __len__(self):
+        """
+        Number of searches read from the plan and not emitted yet.
+        """
+        return sum(len(queue) for queue in self.queues.values())
+
+    def _delay(self, dest):
+        return self.buckets[dest].delay() if dest in self.buckets else 0
+
+    def _wait(self, seconds):
+        if seconds > 0:
+            self.sleep(seconds)
+            self.waited += seconds
+
+    def next_search(self):
+        """
+        Blocks until a search may be sent and returns it. Returns None when the plan is exhausted.
+        """
+        self._fill()
+        while self.queues:
+            if self.bucket is not None:
+                self._wait(self.bucket.delay())
+            delays = {dest: self._delay(dest) for dest in self.queues}
+            ready = [dest for dest, delay in delays.items() if delay == 0]
+            if not ready:
+                self._wait(min(delays.values()))
+                continue
+            dest = min(ready, key=lambda d: self.queues[d][0][:2])
+            _, _, search = heapq.heappop(self.queues[dest])
+            if not self.queues[dest]:
+                del self.queues[dest]
+            if self.bucket is not None:
+                self.bucket.take()
+            if dest in self.buckets:
+                self.buckets[dest].take()
+            if self.jitter:
+                self._wait(self.rng.uniform(0, self.jitter))
+            return search
+        return None
+
+    def __iter__(self):
+        planned = f"{len(self)} searches" if self._exhausted else f"searches ({self.window} at a time)"
+        msg = f"[~] Scheduling {planned} across {len(self.queues)} destinations " \
+              f"(rpm: {self.rpm or 'unlimited'}, per destination: {self.destination_rpm or 'unlimited'})"
+        logger.info(msg)
+        print(msg)
+        while True:
+            search = self.next_search()
+            if search is None:
+                break
+            yield search
+        logger.info(f"Scheduler finished, {self.waited:.1f} s spent waiting for rate limits")
@@ -1,21 +1,80 @@
 import pandas as pd
-from bs4 import BeautifulSoup
-# from requests_futures.sessions import FuturesSession
-import time
 import re
+import time
 import logging
 from datetime import datetime
-from selenium.webdriver import Firefox
+from urllib.parse import urljoin, urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from lxml import html
 from selenium.webdriver.common.by import By
-from selenium.webdriver.firefox.options import Options
+from selenium.common.exceptions import TimeoutException
 from . parser import parse
+from . driver_pool import DriverPool, driver_rss_mb
+from . scroll import ScrollEngine
+from . extract import CardExtractor, REGEX_NS, class_predicate
+from . http_fetch import HttpSession
+from . metrics import SearchMetrics
+from . watchdog import Deadlines, SearchTimeout, Watchdog
 
 logger = logging.getLogger("hotels-scraper.scraper.scraper")
 
+# Scroll stop reasons (see `ScrollEngine.scroll`) that leave results unloaded, as stored in `search.incomplete_reason`
+INCOMPLETE_REASONS = {"timeout": "scroll_timeout", "deadline": "scroll_deadline"}
+
+# Joins the results pages of a search into the single html document stored in the page archive
+PAGE_SEPARATOR = "\n<!-- hotscrape:page -->\n"
+
 
 class Scraper(object):
 
-    def get_dfs(self, search_dict, attributes_dict):
+    extraction_modes = ("html", "js", "stream")
+
+    # Name of the site adapter in `SITES`, stored with every search so that archived pages are
+    # re-parsed by the adapter that fetched them
+    site = None
+
+    def __init__(self, pool=None, extraction_mode="html", archive=None, prune=True, deadlines=None, partial=True):
+        """
+        Args:
+            pool (DriverPool, optional): Pool to borrow browsers from. If omitted the scraper
+                creates (and owns) a single-browser pool that is kept warm between searches.
+            extraction_mode (str, optional): "html" parses the page source in Python, "js" extracts
+                the listing records inside the browser, "stream" extracts the newly loaded listings
+                in the browser after every scroll. Defaults to "html".
+            archive (PageArchive, optional): Archive storing the raw html of every fetched page
+                ("html" extraction mode only).
+            prune (bool, optional): In "stream" mode, empty the harvested listing cards so that the
+                page (and browser memory) stops growing while scrolling. Defaults to True.
+            deadlines (Deadlines, optional): Navigation, scroll and total time limits of a search.
+                Defaults to `Deadlines()`.
+            partial (bool, optional): Keep the listings already loaded when scrolling fails and mark
+                the search incomplete, instead of discarding the page. Defaults to True.
+        """
+        if extraction_mode not in self.extraction_modes:
+            raise ValueError(f"Unknown extraction mode: {extraction_mode} (choose from {self.extraction_modes})")
+        self.extraction_mode = extraction_mode
+        self.archive = archive
+        self.prune = prune
+        self.partial = partial
+        self.deadlines = deadlines if deadlines is not None else Deadlines()
+        self._init_pool(pool)
+
+    def _init_pool(self, pool):
+        # Kills browsers of searches exceeding their total deadline
+        self.watchdog = Watchdog()
+        self._owns_pool = pool is None
+        self.pool = pool if pool is not None else DriverPool(size=1)
+
+    def close(self):
+        """
+        Shuts down the browser pool if it is owned by the scraper.
+        """
+        if self.watchdog is not None:
+            self.watchdog.close()
+        if self._owns_pool:
+            self.pool.close()
+
+    def get_dfs(self, search_dict, attributes_dict, metrics=None):
         """
         Takes a `search_dict` containing search parameters and a `attributes_dict` dictionary containing 
         parsed hotels.com data and creates a Pandas DataFrame from each.
@@ -24,42 +83,69 @@ class Scraper(object):
         into each respectively.
         """
 
+        metrics = metrics if metrics is not None else SearchMetrics()
+        df_search = self.get_search_df(search_dict, metrics=metrics)
+        df_attributes = self.get_attributes_df(attributes_dict, df_search.index[0], metrics=metrics)
+        return df_search, df_attributes
+
+    def get_search_df(self, search_dict, metrics=None):
+        """
+        Creates the `search` DataFrame (indexed by search id) from a `search_dict`.
+        """
+
+        metrics = metrics if metrics is not None else SearchMetrics()
+
         ### Processing `search_dict`
         # Expand `destination` field 
         tmp_dict = {key: val for key, val in search_dict["destination"].items()}
         search_dict.update(tmp_dict)
         del search_dict["destination"]
 
-        # Add search timestamp
-        search_dict["search_datetime"] = datetime.now()
+        # Add search timestamp (set by `fetch` when the page was scraped)
+        if search_dict.get("search_datetime") is None:
+            search_dict["search_datetime"] = datetime.now()
         
         # Create search dataframe
         df_search = pd.DataFrame(search_dict, index=[0])
 
         # Create primary key from hashed dataframe
-        primary_key = pd.util.hash_pandas_object(df_search, index=False)[0] % 0xffffffff
+        with metrics.timer("hash"):
+            primary_key = pd.util.hash_pandas_object(df_search, index=False)[0] % 0xffffffff
         df_search["id"] = primary_key.astype(int)
         df_search.set_index("id", drop=True, inplace=True)
+        # Not part of the hash, search ids do not change with the adapter
+        df_search["site"] = self.site
 
         # Create new, derived, fields
         df_search["days_from_search"] = (df_search["checkin_datetime"] - df_search["search_datetime"]).dt.days
         df_search["nights"] = (df_search["checkout_datetime"] - df_search["checkin_datetime"]).dt.days
+        return df_search
+
+    def get_attributes_df(self, attributes_dict, search_id, metrics=None):
+        """
+        Creates the `hotels` DataFrame (indexed by hotel observation id) from extracted page attributes.
+        """
+
+        metrics = metrics if metrics is not None else SearchMetrics()
 
         ### Processing `attributes_dict`
         # Create attributes dataframe
-        df_attributes = parse(pd.DataFrame(attributes_dict))
+        with metrics.timer("parse"):
+            df_attributes = parse(pd.DataFrame(attributes_dict))
 
         # Add primary_key to attributes dataframe
-        df_attributes["search_id"] = primary_key
+        df_attributes["search_id"] = search_id
         # Create another primary key 
-        primary_key = pd.util.hash_pandas_object(df_attributes, index=False) % 0xffffffff
+        with metrics.timer("hash"):
+            primary_key = pd.util.hash_pandas_object(df_attributes, index=False) % 0xffffffff
         df_attributes["id"] = primary_key.astype(int)
 
         # Drop rows with non-unique id's
         df_attributes.drop_duplicates(subset=["id"], inplace=True)
         df_attributes.set_index("id", drop=True, inplace=True)
+        metrics.set("rows", len(df_attributes))
 
-        return df_search, df_attributes
+        return df_attributes
 
     def ensure_search_format(self, search_dict):
         """
@@ -81,9 +167,21 @@ class Scraper(object):
             search_dict["checkout_datetime"] = search_dict.get("checkin_datetime") + pd.DateOffset(1)
         return search_dict
 
-    def run(self, search):
+    def fetch(self, search, metrics=None):
         """
-        Top-level function for running the parser. 
+        Browser stage: loads and scrolls the results page for `search`.
+
+        Args:
+            search (dict): Search dictionary
+            metrics (SearchMetrics, optional): Receives the browser stage timings and counters
+
+        Returns:
+            tuple: (search_dict, page) where page is the raw html, the extracted records
+                ("js" and "stream" extraction modes), or None if scraping failed
+
+        Raises:
+            SearchTimeout: The page did not load in time, or the search exceeded its total deadline
+                (its browser is then killed by the watchdog). The browser is replaced either way.
         """
 
         logger.info("\n\n")
@@ -91,19 +189,89 @@ class Scraper(object):
 
         search_dict = self.ensure_search_format(search)
         url = self.generate_url(**search_dict)
-        
-        soup = self.get_hotels_page(url)
-        
-        if soup:
-            res = self.get_attributes(soup, **search_dict)
-            df_search, df_attributes = self.get_dfs(search_dict, res)
+        search_dict["search_datetime"] = datetime.now()
+        metrics = metrics if metrics is not None else SearchMetrics()
+
+        # Covers returning the browser to the pool as well, resetting a hung browser can block too.
+        # The watch is disarmed by the pool once the reset is done, right before the browser can be
+        # handed to another search, whose browser it would otherwise kill
+        with self.watchdog.watch(self.deadlines.total) as watch:
+            acquired = time.perf_counter()
+            pooled = self.pool.acquire()
+            # Includes starting a browser when the pool has no idle one
+            metrics.timings["acquire"] = time.perf_counter() - acquired
+            watch.attach(pooled.driver)
+            proxy = getattr(pooled.driver, "blocking_proxy", None)
+            before = proxy.stats() if proxy is not None else None
+            broken = False
+            try:
+                page = self.get_hotels_page(url, pooled.driver, metrics=metrics)
+                # A failed scroll leaves the browser in an unknown state
+                broken = page is None or metrics.incomplete_reason == "scroll_error"
+            except SearchTimeout as error:
+                broken = True
+                metrics.timeout_reason = error.reason
+                raise
+            except Exception:
+                broken = True
+                if not watch.expired:
+                    raise
+                page = None
+            finally:
+                if proxy is not None:
+                    # Traffic of this search only, the proxy lives as long as the browser
+                    after = proxy.stats()
+                    metrics.count("proxy_connections", after["connections"] - before["connections"])
+                    metrics.count("blocked_connections", after["blocked"] - before["blocked"])
+                    metrics.count("downloaded_bytes", after["bytes"] - before["bytes"])
+                self.pool.release(pooled, broken=broken or watch.expired, handover=watch.disarm)
+
+        if watch.expired:
+            metrics.timeout_reason = "total_deadline"
+            msg = f"[!] Search exceeded its {self.deadlines.total} s deadline, browser killed: {url}"
+            logger.warning(msg)
+            print(msg)
+            raise SearchTimeout("total_deadline", msg)
+
+        # Incomplete searches are resumed from `result_offset + n_listings` (see `RunCheckpoint.pending`)
+        search_dict["result_offset"] = search_dict.get("result_offset") or 0
+        search_dict["n_listings"] = metrics.counters.get("listings")
+        search_dict["complete"] = int(metrics.incomplete_reason is None)
+        search_dict["incomplete_reason"] = metrics.incomplete_reason
+        return search_dict, page
+
+    def process(self, search_dict, page, metrics=None):
+        """
+        CPU stage: extracts and parses a fetched page into the `search` and `hotels` DataFrames.
+        Does not need a browser.
+        """
+        metrics = metrics if metrics is not None else SearchMetrics()
+        if page is not None:
+            with metrics.timer("extract"):
+                res = self.get_attributes(page, **search_dict)
+            df_search, df_attributes = self.get_dfs(search_dict, res, metrics=metrics)
+            if self.archive is not None and isinstance(page, (str, list)):
+                # Keep the raw page so that it can be re-parsed later without scraping
+                if isinstance(page, list):
+                    page = PAGE_SEPARATOR.join(page)
+                with metrics.timer("archive"):
+                    df_search["page_hash"], df_search["page_codec"] = self.archive.put(page)
             return df_search, df_attributes
         else:
             return pd.DataFrame(), pd.DataFrame()
 
+    def run(self, search, metrics=None):
+        """
+        Top-level function for running the parser. 
+        """
+        metrics = metrics if metrics is not None else SearchMetrics()
+        return self.process(*self.fetch(search, metrics=metrics), metrics=metrics)
+
 
 class HotelsScraper(Scraper):
 
+    site = "hotels"
+
     feature_html_details = {"name": ("h3", "p-name"),
                         "address": ("span", "address"),
                         # "maplink": ("a", "map-link xs-welcome-rewards"),
@@ -116,104 +284,127 @@ class HotelsScraper(Scraper):
                         "price": ("aside", re.compile("pricing resp-module.*")),
                         "star_rating": ("span", "star-rating-text")}
 
-    def get_hotels_page(self, url, max_scroll=100, max_scroll_global=35):  
+    # Element wrapping a single hotel listing
+    card_html_details = ("li", "hotel")
+
+    # Overridden to point the scraper at a local stand-in site (see `standin.py`)
+    base_url = "https://www.hotels.com"
+
+    # Query parameter of the listing index the results start at
+    offset_param = "start-index"
+
+    extractor = CardExtractor(card_html_details, feature_html_details)
+
+    scroll_engine = ScrollEngine(listing_selector="h3.p-name", loader_id="listings-loading", end_selector=".info")
+
+    def get_hotels_page(self, url, driver, max_scroll=35, metrics=None):  
 
         """
         Takes an url from Hotels.com and infinitely scrolls down to end of page until no more content can be loaded.
 
         Args:
             url (str): hotels.com URL
-            max_scroll (int, optional): Max number of webpage scrolls. Defaults to 20.
+            driver (WebDriver): Browser borrowed from the driver pool
+            max_scroll (int, optional): Max number of webpage scrolls. Defaults to 35.
+            metrics (SearchMetrics, optional): Receives the browser stage timings and counters
 
         Returns:
-            bs4: Parsed website
+            str: Html of the fully scrolled page, or a {field: [values]} dictionary in "js" and "stream" extraction modes
         """
 
-        # Open up chrome in incognito
-        # chrome_options = webdriver.ChromeOptions()
-        # chrome_options.add_argument("--incognito")
-        # driver = webdriver.Chrome()
-        
         logger.info("Opening URL\n")
-
-        options = Options()
-        options.add_argument("--private")
-        options.add_argument("--headless")
-        driver = Firefox(executable_path="geckodriver", options=options)
-        driver.set_window_size(1920,1080)
+        metrics = metrics if metrics is not None else SearchMetrics()
 
         # Nagivate to url 
-        driver.get(url)
+        if self.deadlines.navigate:
+            driver.set_page_load_timeout(self.deadlines.navigate)
+        with metrics.timer("navigate"):
+            try:
+                driver.get(url)
+            except TimeoutException:
+                msg = f"[!] Page did not load within {self.deadlines.navigate} s: {url}"
+                logger.warning(msg)
+                print(msg)
+                raise SearchTimeout("navigate_timeout", msg)
         
         msg = "[~] Start scraping ..."
         logger.info(msg)
         print(msg)
 
-        # Scroll down until the end of the page
-        scroll_count = 0
-        scroll_count_global = 0
+        rows = []
 
-        try:
-            while True:
-                # print(scroll_count)
-                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                try:
-                    if driver.find_element_by_id("listings-loading").value_of_css_property("display") == "block":
-                        scroll_count = 0
-                    else:
-                        time.sleep(0.5)
-                        scroll_count += 1
-                        scroll_count_global += 1
-                        print(f"[~] Scroll count: {scroll_count_global}")
-                except:
-                    scroll_count += 1
-                    print(f"[~] Scroll count (cont): {scroll_count_global}   {scroll_count}")
-
-                    if scroll_count >= max_scroll:
-                        msg = f"[~] Reached maximum number of page loads ({scroll_count}/{max_scroll}). Stopping ..."
-                        logger.info(msg)
-                        print(msg)
-                        break
-                    else:
-                        continue
-
-                # print(f"[~] Scroll count (outside): {scroll_count_global}   {scroll_count}")
-        
-                if any([cur_elem.is_displayed() for cur_elem in driver.find_elements_by_class_name("info")]):
-                    msg = "[~] Scraping ended"
-                    logger.info(msg)
-                    print(msg)
-                    break
-
-                if scroll_count >= max_scroll:
-                    msg = f"[~] Reached maximum number of page loads ({scroll_count}/{max_scroll}). Stopping ..."
-                    logger.info(msg)
-                    print(msg)
-                    break
-
-                if scroll_count_global >= max_scroll_global:
-                    msg = f"[~] Reached maximum number of page loads ({scroll_count_global}/{max_scroll_global}). Stopping ..."
-                    logger.info(msg)
-                    print(msg)
-                    break
+        def harvest(driver):
+            # Collects the listings loaded by the last scroll, the DOM never holds more than one batch
+            with metrics.timer("harvest"):
+                rows.extend(self.extractor.harvest(driver, prune=self.prune,
+                                                   listing_selector=self.scroll_engine.listing_selector))
 
+        # Scroll down until no more listings are loaded
+        result = None
+        try:
+            with metrics.timer("scroll"):
+                result = self.scroll_engine.scroll(driver, max_scrolls=max_scroll,
+                                                   on_batch=harvest if self.extraction_mode == "stream" else None,
+                                                   deadline=self.deadlines.scroll)
         except Exception as e:
             logger.error(e)
-            return None
+            if not self.partial:
+                return None
+            metrics.incomplete_reason = "scroll_error"
+            msg = "[!] Scrolling failed, keeping the listings loaded so far"
+            logger.warning(msg)
+            print(msg)
+
+        if result is not None:
+            if result.reason == "deadline":
+                # Soft limit, the listings loaded so far are kept
+                metrics.timeout_reason = "scroll_deadline"
+                logger.warning(f"Scroll phase hit its {self.deadlines.scroll} s deadline: {url}")
+            metrics.incomplete_reason = INCOMPLETE_REASONS.get(result.reason)
+            metrics.set("scrolls", result.scrolls)
+            metrics.set("listings", result.listings)
+            msg = f"[~] Scraping ended after {result.scrolls} scrolls ({result.listings} listings, {result.reason})"
+            logger.info(msg)
+            print(msg)
 
-        # Grabs the html of the fully scrolled-down page and parse it with BeautifulSoup  
-        # innerHTML = driver.execute_script("return document.body.innerHTML")
-        parsed_html = BeautifulSoup(driver.page_source, "lxml")
-        driver.close()
-        driver.quit()
-        return parsed_html
+        try:
+            if result is None:
+                # Listings in the DOM (or already harvested) when scrolling broke off
+                metrics.set("listings", self.scroll_engine.page_state(driver)["count"])
+            metrics.set("rss_mb", driver_rss_mb(driver))
+
+            if self.extraction_mode == "stream":
+                # Listings that arrived after the last batch callback
+                harvest(driver)
+                return self.extractor.rows_to_dict(rows)
+
+            if self.extraction_mode == "js":
+                # Extract the listings in the browser, skipping page source serialization and parsing
+                with metrics.timer("extract_js"):
+                    return self.extractor.extract_in_browser(driver)
+
+            # Grabs the html of the fully scrolled-down page, it is parsed in `get_attributes`
+            with metrics.timer("page_source"):
+                page = driver.page_source
+            metrics.set("html_bytes", len(page.encode("utf-8")))
+            return page
+        except Exception as e:
+            if result is not None:
+                raise
+            # The browser did not survive the scroll error
+            logger.error(f"Could not salvage the loaded listings ({e!r})")
+            if rows:
+                metrics.set("listings", len(rows))
+                return self.extractor.rows_to_dict(rows)
+            return None
 
     def generate_url(self, destination, checkin_datetime, checkout_datetime=None, price_min=0, price_max=10000, price_multiplier=1, 
                     star_rating_min=1, star_rating_max=5, guest_rating_min=1, guest_rating_max=9, distance_centre=None, 
-                    rooms=1, adults=2, children=0, currency="USD"):
+                    rooms=1, adults=2, children=0, currency="USD", result_offset=0):
         
         """
         Takes hotel search parameters and returns a hotels.com URL string.
+        Results start at listing `result_offset` (used to resume incomplete searches).
         """
 
         #https://www.hotels.com/search.do?resolved-location=CITY%3A1504033%3AUNKNOWN%3AUNKNOWN&f-price-currency-code=USD&f-price-multiplier=1&f-price-min=30&f-price-max=395&f-star-rating=5,4,3,2,1&f-guest-rating-min=2&f-guest-rating-max=9&f-distance=2.0&f-lid=1504033&destination-id=1504033&q-destination=Las%20Vegas,%20Nevada,%20United%20States%20of%20America&q-check-in=2020-05-13&q-check-out=2020-05-14&q-rooms=1&q-room-0-adults=2&q-room-0-children=0&sort-order=DISTANCE_FROM_LANDMARK
@@ -232,7 +423,7 @@ class HotelsScraper(Scraper):
         checkout_date = checkout_datetime.strftime("%Y-%m-%d")
 
         url = "".join([
-            "https://www.hotels.com/search.do?",
+            f"{self.base_url}/search.do?",
             f"f-price-currency-code={currency}&",
             f"f-price-multiplier={price_multiplier}&",
             f"f-price-min={price_min}&",
@@ -246,7 +437,8 @@ class HotelsScraper(Scraper):
             f"q-check-out={checkout_date}&",
             f"q-rooms={rooms}&",
             f"q-room-0-adults={adults}&",
-            f"q-room-0-children={children}"
+            f"q-room-0-children={children}",
+            f"&{self.offset_param}={int(result_offset)}" if result_offset else "",
         ])
 
         msg = f"[~] Searching url:\n\t {url}\n"
@@ -254,151 +446,292 @@ class HotelsScraper(Scraper):
         print(msg)
         return url
 
-    # def get_content_list(soup, tag, class_):
-    #     """
-    #     Takes a bs4 object and parses it based on tag and class properties. 
-    #     Returns list of parsed bs4 object contents.
-    #     """
-    #     return postprocess_soup(soup, tag, class_)
-
-    def postprocess_soup(self, soup, tag, class_):
-
-        """
-        Takes a bs4 object and parses it based on tag and class properties. 
-        Returns list of parsed bs4 object contents.
-        """
-        raw_base = soup.find_all("h3", {"class": "p-name"})
-        raw = soup.find_all(tag, {"class": class_})
-        if len(raw) != len(raw_base):
-            # Ugly hack to fill missing amenities with NaNs
-            # Ensures that each field (list) are same length even if hotel doesn't have any amenities listed
-            # NOTE: Might need to do for other fields as well
-            if class_ == "hmvt8258-amenities":
-                raw_tmp = soup.find_all("div", {"class": "additional-details resp-module"})
-                raw_list = []
-                for content in raw_tmp:
-                    flag = False
-                    for subcont in content:
-                        if class_ in subcont:
-                            flag = True
-                            break
-                    if flag:
-                        raw_list.append(subcont)
-                    else:
-                        raw_list.append(None)
-        else:
-            raw_list = [content.text for content in raw]
-        return raw_list
-            
-    def get_attributes(self, soup, **search_dict):
+    def get_attributes(self, page, **search_dict):
 
         """
-        Collects parsed hotels.com webpage data into a dictionary
+        Collects parsed hotels.com webpage data into a dictionary.
+        Walks the listing cards once, pulling every field in `feature_html_details` from each card.
+        Pages already extracted in the browser ("js" extraction mode) are passed through.
         """
-        attributes_dict = {key: self.postprocess_soup(soup, self.feature_html_details[key][0], self.feature_html_details[key][1]) for key in self.feature_html_details}
+        if isinstance(page, dict):
+            return page
+        attributes_dict = self.extractor.extract(page)
         return attributes_dict
 
-# class BookingsScraper(Scraper):
 
-#     feature_html_details = {"name": ("h3", "p-name"),
-#                         "address": ("span", "address"),
-#                         # "maplink": ("a", "map-link xs-welcome-rewards"),
-#                         "landmarks": ("ul", "property-landmarks"),
-#                         "amenities": ("ul", "hmvt8258-amenities"),
-#                         "details": ("div", "additional-details resp-module"),
-#                         "review_box": ("div", "details resp-module"),
-#                         "rating": ("strong", re.compile("guest-reviews-badge.*")),
-#                         "num_reviews": ("span","small-view"),
-#                         "price": ("aside", re.compile("pricing resp-module.*")),
-#                         "star_rating": ("span", "star-rating-text")}
 
+class HttpScraper(Scraper):
 
-#     def generate_url(self, destination, checkin_datetime, checkout_datetime=None, price_min=0, price_max=10000, price_multiplier=1, 
-#                     star_rating_min=1, star_rating_max=5, guest_rating_min=1, guest_rating_max=9, distance_centre=None, 
-#                     rooms=1, adults=2, children=0, currency="USD", dest_type="city"):
-        
-#         """
-#         Takes hotel search parameters and returns a hotels.com URL string.
-#         """
-
-#         # Concatenate star rating list into string of correct format
-#         # star_rating = "".join(map(lambda x: str(x)+",", range(star_rating_max,star_rating_min-1,-1))).rstrip(",")
-
-#         # Format destination dict
-#         destination = {key: val.replace(" ", "%20") for key, val in destination.items()}
-#         dest_field_1 = destination.get("city")
-#         # dest_field_2 = destination.get("state")
-#         # dest_field_3 = destination.get("country")
-
-#         url = "".join([
-#             "https://www.booking.com/searchresults.html?tmpl=searchresults&",
-#             f"checkin_month={checkin_date.month}&",
-#             f"checkin_monthday={checkin_date.day}&",
-#             f"checkin_year={checkin_date.year}&",
-#             f"checkout_month={checkout_date.month}&",
-#             f"checkout_monthday={checkout_date.day}&",
-#             f"checkout_year={checkout_date.year}&",
-#             "class_interval=1&",
-#             f"dest_type={dest_type}&", # dest_type=city  # if distance_centre else "",
-#             "dtdisc=0",
-#             f"group_adults={adults}&",
-#             f"group_children={children}&",
-#             f"no_rooms={rooms}&",
-#             "postcard=0&",
-#             f"raw_dest_type={dest_type}",
-#             "sb_price_type=total",
-#             "shw_aparth=0",
-#             f"ss={dest_field_1}",
-#             f"nflt=class%3D1%3Bclass%3D2%3Bclass%3D3%3Bclass%3D4%3Bclass%3D5%3Bht_id%3D204"
-#         ])
-
-#         msg = f"[~] Searching url:\n\t {url}\n"
-#         logger.info(msg)
-#         print(msg)
-#         return url
-
-#     def get_hotels_page(self, url):  
-
-#         """
-#         Takes an url from Hotels.com and infinitely scrolls down to end of page until no more content can be loaded.
-
-#         Args:
-#             url (str): hotels.com URL
-#             max_scroll (int, optional): Max number of webpage scrolls. Defaults to 20.
-
-#         Returns:
-#             bs4: Parsed website
-#         """
-
-#         session = FuturesSession()
-#         response = session.get(url)
-#         page = response.result()
-#         main_page = BeautifulSoup(page.text, "lxml")
-    
-#         urls = [href["href"] for href in main_page.select(".bui-pagination__link.sr_pagination_link")]
-#         responses = session.get(urls)
-
-#         parsed_html_list = [BeautifulSoup(response.result().text, "lxml") for response in responses]
-        
-#         return parsed_html_list
-
-#     def get_attributes(self, soup, **search_dict):
-
-#         """
-#         Collects parsed hotels.com webpage data into a dictionary
-#         """
-#         attributes_dict = {key: postprocess_soup(soup, self.feature_html_details[key][0], self.feature_html_details[key][1]) for key in self.feature_html_details}
-#         return attributes_dict
-
-
-#     feature_html_details = {"name": ("class", "sr-hotel__name"),
-#                         # "address": ("span", "address"),
-#                         # "maplink": ("a", "map-link xs-welcome-rewards"),
-#                         # "landmarks": ("ul", "property-landmarks"),
-#                         # "amenities": ("ul", "hmvt8258-amenities"),
-#                         # "details": ("div", "additional-details resp-module"),
-#                         "review_box": ("div", "details resp-module"),
-#                         "rating": ("strong", re.compile("guest-reviews-badge.*")),
-#                         "num_reviews": ("span","small-view"),
-#                         "price": ("aside", re.compile("pricing resp-module.*")),
-#                         "star_rating": ("span", "star-rating-text")}
\ No newline at end of file
+    """
+    Fetches results split over static pages with plain HTTP requests instead of a browser.
+
+    The first results page is fetched, the links of its pagination bar are collected and the
+    remaining pages are fetched concurrently over the pooled keep-alive connections of an
+    `HttpSession`. The pages go through the same `process` stage (extraction, parsing and
+    `get_dfs`) as pages scraped in a browser.
+
+    Subclasses are site adapters: they provide `generate_url`, the `extractor` of the listing
+    cards and the (tag, class) of the pagination links in `pagination_html_details`.
+    """
+
+    # Anchors linking to the other results pages
+    pagination_html_details = ("a", "pagination-link")
+
+    def __init__(self, session=None, page_workers=8, max_pages=40, **kwargs):
+        """
+        Args:
+            session (HttpSession, optional): Session to fetch with. Defaults to a new session with
+                one connection per page worker.
+            page_workers (int, optional): Number of pages fetched concurrently. Defaults to 8.
+            max_pages (int, optional): Max results pages fetched per search. Defaults to 40.
+            kwargs: See `Scraper`. Browser options are ignored, no browser is ever started.
+        """
+        super().__init__(**kwargs)
+        self.page_workers = page_workers
+        self.max_pages = max_pages
+        self.session = session if session is not None else HttpSession(max_connections=page_workers)
+        self._executor = None
+
+    def _init_pool(self, pool):
+        # No browsers: nothing to pool or to watch. A pool passed in is kept for its size only
+        # (the number of concurrent searches of a pipeline).
+        self.watchdog = None
+        self._owns_pool = False
+        self.pool = pool
+
+    @property
+    def executor(self):
+        # Created on first use, scrapers that only process pages (e.g. pipeline parse workers) never need one
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.page_workers, thread_name_prefix="hotscrape-http")
+        return self._executor
+
+    def close(self):
+        """
+        Shuts down the page fetching threads and closes the idle connections.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self.session.close()
+        super().close()
+
+    def fetch(self, search, metrics=None):
+        """
+        HTTP stage: fetches all results pages for `search`.
+
+        Args:
+            search (dict): Search dictionary
+            metrics (SearchMetrics, optional): Receives the fetch stage timings and counters
+
+        Returns:
+            tuple: (search_dict, pages) where pages is the list of page htmls, or None if the
+                first page could not be fetched
+        """
+
+        logger.info("\n\n")
+        logger.info("Scraper initiated")
+
+        search_dict = self.ensure_search_format(search)
+        url = self.generate_url(**search_dict)
+        search_dict["search_datetime"] = datetime.now()
+        metrics = metrics if metrics is not None else SearchMetrics()
+
+        before = self.session.stats()
+        pages = self.get_hotels_page(url, metrics=metrics)
+        after = self.session.stats()
+        metrics.count("requests", after["requests"] - before["requests"])
+
+        # Incomplete searches are resumed from `result_offset + n_listings`, the first page that failed
+        search_dict["result_offset"] = search_dict.get("result_offset") or 0
+        search_dict["n_listings"] = metrics.counters.get("listings")
+        search_dict["complete"] = int(metrics.incomplete_reason is None)
+        search_dict["incomplete_reason"] = metrics.incomplete_reason
+        return search_dict, pages
+
+    def _get(self, url):
+        """
+        Fetches a page, returns None (and logs) on failure.
+        """
+        try:
+            res = self.session.get(url)
+        except OSError as error:
+            logger.error(f"Could not fetch {url} ({error!r})")
+            return None
+        if not res.ok:
+            logger.error(f"Could not fetch {url} (HTTP {res.status})")
+            return None
+        return res
+
+    def _page_key(self, url):
+        """
+        Identifies a results page by its listing offset (`offset_param` of the site adapter), or else by its url.
+        """
+        param = getattr(self, "offset_param", None)
+        if param is None:
+            return url
+        values = parse_qs(urlsplit(url).query).get(param)
+        try:
+            return int(values[0]) if values else 0
+        except ValueError:
+            return url
+
+    def page_urls(self, page, url):
+        """
+        Returns the absolute urls of the other results pages linked from `page` (in page order, without `url`).
+        Pages before `url` are skipped, so a search resumed at a listing offset only fetches the missing pages.
+        """
+        tag, class_ = self.pagination_html_details
+        hrefs = html.document_fromstring(page).xpath(f"//{tag}[{class_predicate(class_)}]/@href", namespaces=REGEX_NS)
+        start = self._page_key(url)
+        seen = {start}
+        urls = []
+        for href in hrefs:
+            href = urljoin(url, href)
+            key = self._page_key(href)
+            if isinstance(start, int) and isinstance(key, int) and key < start:
+                continue
+            if key not in seen:
+                seen.add(key)
+                urls.append(href)
+        return urls
+
+    def get_hotels_page(self, url, metrics=None):
+        """
+        Fetches the first results page and then the pages it links to, concurrently.
+
+        Args:
+            url (str): Url of the first results page
+            metrics (SearchMetrics, optional): Receives the fetch stage timings and counters
+
+        Returns:
+            list: Html of every results page fetched, or None if the first page failed
+        """
+
+        metrics = metrics if metrics is not None else SearchMetrics()
+
+        with metrics.timer("navigate"):
+            first = self._get(url)
+        if first is None:
+            return None
+        pages = [first.text]
+
+        urls = self.page_urls(pages[0], url)
+        if len(urls) >= self.max_pages:
+            logger.warning(f"Only fetching {self.max_pages} of {len(urls) + 1} results pages: {url}")
+            urls = urls[:self.max_pages - 1]
+        with metrics.timer("pages"):
+            responses = list(self.executor.map(self._get, urls))
+        pages.extend(res.text for res in responses if res is not None)
+        if len(pages) < len(urls) + 1:
+            # Stored, but not complete
+            metrics.incomplete_reason = "page_error"
+            # Listings up to the first missing page were loaded, the search is resumed from there
+            start = self._page_key(url)
+            missing = self._page_key(next(page_url for page_url, res in zip(urls, responses) if res is None))
+            if isinstance(start, int) and isinstance(missing, int):
+                metrics.set("listings", missing - start)
+
+        metrics.set("pages", len(pages))
+        metrics.set("html_bytes", sum(len(page.encode("utf-8")) for page in pages))
+        msg = f"[~] Fetched {len(pages)}/{len(urls) + 1} results pages"
+        logger.info(msg)
+        print(msg)
+        return pages
+
+    def get_attributes(self, pages, **search_dict):
+        """
+        Collects the listing cards of all results pages into a single dictionary.
+        Also takes the pages joined into one document by the page archive.
+        """
+        if isinstance(pages, dict):
+            return pages
+        if isinstance(pages, str):
+            pages = pages.split(PAGE_SEPARATOR)
+        attributes_dict = {key: [] for key in self.extractor.fields}
+        for page in pages:
+            for record in self.extractor.iter_records(page):
+                for key in self.extractor.fields:
+                    attributes_dict[key].append(record[key])
+        return attributes_dict
+
+
+class BookingsScraper(HttpScraper):
+
+    """
+    Booking.com adapter: results pages are static and linked from the pagination bar.
+    """
+
+    site = "bookings"
+
+    # Same field names as `HotelsScraper`, the parser expects them
+    feature_html_details = {"name": ("span", "sr-hotel__name"),
+                        "address": ("div", "sr_card_address_line"),
+                        "landmarks": ("span", "sr_card_address_line__user_distance"),
+                        "amenities": ("div", "sr_card_room_policies__container"),
+                        "details": ("div", "room_link"),
+                        "review_box": ("div", "reviewFloater"),
+                        "rating": ("div", "bui-review-score__badge"),
+                        "num_reviews": ("div", "bui-review-score__text"),
+                        "price": ("div", "bui-price-display__value"),
+                        "star_rating": ("span", "bui-rating")}
+
+    card_html_details = ("div", "sr_item")
+
+    pagination_html_details = ("a", "sr_pagination_link")
+
+    base_url = "https://www.booking.com"
+
+    # Query parameter of the listing index the results start at
+    offset_param = "offset"
+
+    extractor = CardExtractor(card_html_details, feature_html_details)
+
+    def generate_url(self, destination, checkin_datetime, checkout_datetime=None, price_min=0, price_max=10000, price_multiplier=1,
+                    star_rating_min=1, star_rating_max=5, guest_rating_min=1, guest_rating_max=9, distance_centre=None,
+                    rooms=1, adults=2, children=0, currency="USD", result_offset=0, dest_type="city"):
+
+        """
+        Takes hotel search parameters and returns a booking.com URL string.
+        Price and guest rating filters are not applied.
+        """
+
+        # Star rating filter, e.g. class%3D1%3Bclass%3D2
+        star_rating = "%3B".join(f"class%3D{star}" for star in range(star_rating_min, star_rating_max + 1))
+
+        # Format destination dict
+        destination = {key: val.replace(" ", "%20") for key, val in destination.items()}
+        dest_field_1 = destination.get("city")
+
+        url = "".join([
+            f"{self.base_url}/searchresults.html?tmpl=searchresults&",
+            f"checkin_month={checkin_datetime.month}&",
+            f"checkin_monthday={checkin_datetime.day}&",
+            f"checkin_year={checkin_datetime.year}&",
+            f"checkout_month={checkout_datetime.month}&",
+            f"checkout_monthday={checkout_datetime.day}&",
+            f"checkout_year={checkout_datetime.year}&",
+            "class_interval=1&",
+            f"dest_type={dest_type}&",
+            "dtdisc=0&",
+            f"group_adults={adults}&",
+            f"group_children={children}&",
+            f"no_rooms={rooms}&",
+            "postcard=0&",
+            f"raw_dest_type={dest_type}&",
+            "sb_price_type=total&",
+            "shw_aparth=0&",
+            f"selected_currency={currency}&",
+            f"ss={dest_field_1}&",
+            f"nflt={star_rating}",
+            f"&{self.offset_param}={int(result_offset)}" if result_offset else "",
+        ])
+
+        msg = f"[~] Searching url:\n\t {url}\n"
+        logger.info(msg)
+        print(msg)
+        return url
+
+
+# Site adapters selectable with `main.py --site`
+SITES = {scraper_cls.site: scraper_cls for scraper_cls in (HotelsScraper, BookingsScraper)}
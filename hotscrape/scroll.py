@@ -0,0 +1,156 @@
+import time
+import logging
+from . extract import PRUNED_COUNTER
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
+
+logger = logging.getLogger("hotels-scraper.scroll.scroll")
+
+# Collects everything the scroll loop needs in a single WebDriver round trip.
+# Listings pruned by an incremental harvest still count.
+PAGE_STATE_JS = """
+var visible = function (el) {
+    return !!el && el.offsetParent !== null && window.getComputedStyle(el).display !== "none";
+};
+var loader = document.getElementById(arguments[1]);
+var ends = document.querySelectorAll(arguments[2]);
+var end = false;
+for (var i = 0; i < ends.length; i++) {
+    if (visible(ends[i])) { end = true; break; }
+}
+var pruned = window.%s || 0;
+return {count: document.querySelectorAll(arguments[0]).length + pruned, loading: visible(loader), end: end};
+""" % PRUNED_COUNTER
+
+SCROLL_JS = "window.scrollTo(0, document.body.scrollHeight);"
+
+
+class ScrollResult(object):
+    """
+    Summary of a finished scroll phase.
+    """
+
+    def __init__(self, scrolls, listings, reason):
+        self.scrolls = scrolls
+        self.listings = listings
+        self.reason = reason
+
+    def __repr__(self):
+        return f"ScrollResult(scrolls={self.scrolls}, listings={self.listings}, reason={self.reason!r})"
+
+
+class _PageChanged(object):
+    """
+    WebDriverWait condition: true as soon as the listing count grows or the end-of-results
+    marker shows up, or once the page has been idle (loader hidden, no new listings) for `idle` seconds.
+    """
+
+    def __init__(self, engine, count, idle):
+        self.engine = engine
+        self.count = count
+        self.idle = idle
+        self.idle_since = None
+        self.state = None
+
+    def __call__(self, driver):
+        self.state = self.engine.page_state(driver)
+        if self.state["count"] > self.count or self.state["end"]:
+            return True
+        if self.state["loading"]:
+            self.idle_since = None
+            return False
+        now = time.monotonic()
+        if self.idle_since is None:
+            self.idle_since = now
+        return now - self.idle_since >= self.idle
+
+
+class ScrollEngine(object):
+
+    """
+    Scrolls an infinite-scroll results page by waiting on DOM signals instead of fixed sleeps.
+
+    After every scroll the engine waits until either the number of listings grows, the end-of-results
+    marker becomes visible, or the page goes idle (loader hidden and no new listings for `idle` seconds).
+    It stops as soon as the listing count stops growing.
+
+    Args:
+        listing_selector (str, optional): CSS selector matching one element per listing. Defaults to "h3.p-name".
+        loader_id (str, optional): Id of the "loading more results" element. Defaults to "listings-loading".
+        end_selector (str, optional): CSS selector of the end-of-results marker. Defaults to ".info".
+        growth_timeout (float, optional): Max seconds to wait for new listings after a scroll. Defaults to 15.
+        idle (float, optional): Seconds without loader or new listings after which the page counts as exhausted. Defaults to 1.5.
+        poll_frequency (float, optional): Seconds between DOM polls. Defaults to 0.1.
+    """
+
+    def __init__(self, listing_selector="h3.p-name", loader_id="listings-loading", end_selector=".info",
+                 growth_timeout=15, idle=1.5, poll_frequency=0.1):
+        self.listing_selector = listing_selector
+        self.loader_id = loader_id
+        self.end_selector = end_selector
+        self.growth_timeout = growth_timeout
+        self.idle = idle
+        self.poll_frequency = poll_frequency
+
+    def page_state(self, driver):
+        return driver.execute_script(PAGE_STATE_JS, self.listing_selector, self.loader_id, self.end_selector)
+
+    def scroll(self, driver, max_scrolls=35, on_batch=None, deadline=None):
+        """
+        Scrolls `driver` until no more listings are loaded.
+
+        Args:
+            driver (WebDriver): Browser with the results page loaded
+            max_scrolls (int, optional): Max number of scrolls. Defaults to 35.
+            on_batch (callable, optional): Called with `driver` for the initial listings and after
+                every scroll that added listings (e.g. to harvest them incrementally).
+            deadline (float, optional): Max duration of the scroll phase in seconds. Scrolling stops
+                (keeping the listings loaded so far) once it is reached.
+
+        Returns:
+            ScrollResult: Number of scrolls, listings found and why scrolling stopped
+        """
+        end_time = time.monotonic() + deadline if deadline else None
+        state = self.page_state(driver)
+        count = state["count"]
+        scrolls = 0
+        reason = "max_scrolls"
+        if on_batch is not None:
+            on_batch(driver)
+
+        while scrolls < max_scrolls:
+            if state["end"]:
+                reason = "end_of_results"
+                break
+
+            timeout = self.growth_timeout
+            if end_time is not None:
+                remaining = end_time - time.monotonic()
+                if remaining <= 0:
+                    reason = "deadline"
+                    break
+                timeout = min(timeout, remaining)
+
+            driver.execute_script(SCROLL_JS)
+            scrolls += 1
+
+            condition = _PageChanged(self, count, self.idle)
+            try:
+                WebDriverWait(driver, timeout, poll_frequency=self.poll_frequency).until(condition)
+            except TimeoutException:
+                # Loader kept spinning without delivering anything
+                reason = "deadline" if timeout < self.growth_timeout else "timeout"
+                break
+            state = condition.state
+
+            if state["count"] <= count:
+                reason = "end_of_results" if state["end"] else "stable"
+                break
+            count = state["count"]
+            print(f"[~] Scroll count: {scrolls} ({count} listings)")
+            if on_batch is not None:
+                on_batch(driver)
+
+        result = ScrollResult(scrolls, count, reason)
+        logger.info(result)
+        return result
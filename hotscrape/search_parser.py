@@ -44,8 +44,6 @@ class Search():
     Class to structure the search config file content into a format required by scraper.py
     """
 
-    __counter = 0
-
     search_key_limits = {
         "checkin_datetime": None, 
         "checkout_datetime": None,
@@ -64,30 +62,23 @@ class Search():
         }
 
     @classmethod
-    def _count(cls):
-        cls.__counter += 1
-        return cls.__counter
-    @classmethod
-    def _reset_count(cls):
-        cls.__counter = 0
-
-    @classmethod
-    def generate(cls, config, count_key="search_span"):
+    def generate(cls, config, count_key="search_span", start=None):
         """
         Creates an iterator of Search instances with unique checkin/checkout dates
 
         Args:
             config (dict): Search config content
             count_key (str, optional): Key to use for search span. Defaults to "search_span".
+            start (datetime, optional): Date the search span is counted from when the config has
+                no checkin date. Defaults to now (pass a run's start time to reproduce its dates).
 
         Yields:
             Search: Unique Search instances
         """
         search_span = int(config.get(count_key))
         if search_span is not None:
-            for i in range(search_span):
-                yield cls(config)
-        cls._reset_count()
+            for counter in range(1, search_span + 1):
+                yield cls(config, start=start, counter=counter)
 
     @staticmethod
     def _recast(string):
@@ -113,12 +104,14 @@ class Search():
             if val < min or val > max:
                 raise ValueOutOfRangeError(name, val, min, max)
 
-    def __init__(self, config):
+    def __init__(self, config, start=None, counter=1):
 
-        self.counter = self._count()
+        # Position in the search span, the checkin date is offset by it
+        self.counter = counter
 
         # Search dict from config file
         self.config = config
+        self.start = start
 
         # Default search values
         self.city = None
@@ -177,7 +170,7 @@ class Search():
 
             if key == "checkin_datetime":
                 if val is None:
-                    t_start = datetime.now() + timedelta(days=self.counter)
+                    t_start = (self.start or datetime.now()) + timedelta(days=self.counter)
                 else:
                     t_start = pd.to_datetime(val) + timedelta(days=self.counter-1)
                 self.__setattr__(key, t_start)
@@ -1,8 +1,7 @@
 import yaml
 import logging
-import numpy as np
 import sqlalchemy as sqlal
-from sqlalchemy import Table, Column, Integer, String, Float, MetaData, ForeignKey, DateTime
+from sqlalchemy import Table, Column, Integer, String, Float, MetaData, ForeignKey, DateTime, Index, event
 
 logger = logging.getLogger("hotels-scraper.sql.sql")
 
@@ -31,61 +30,231 @@ class TableMaker(object):
                 res.append(sqlal.Column(name, eval(dtype), nullable=True))
         return res
     
+    def create_indexes(self, name, table, schema):
+        """
+        Adds the secondary indexes declared under `meta.indexes`. Each entry is a column name
+        or a list of column names (composite index).
+        """
+        res = []
+        for columns in schema[0]["meta"].get("indexes", []):
+            if isinstance(columns, str):
+                columns = [columns]
+            res.append(Index(f"ix_{name}_{'_'.join(columns)}", *[table.c[col] for col in columns]))
+        return res
+
     def create_table(self, name, schema):
         table = Table(name, self.metadata,
                       *self.create_columns(schema)
                      )
+        self.create_indexes(name, table, schema)
         return table
-    
-def create_connection(filename):
+
+# SQLite PRAGMA settings applied to every new connection
+PRAGMA_PROFILES = {
+    # Write-ahead logging, relaxed fsync and large page/mmap caches
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+    # SQLite defaults (rollback journal, fsync on every commit)
+    "safe": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+    },
+}
+
+def create_connection(filename, profile="fast", **pragmas):
     """
     Creates a connection to the database
+
+    Args:
+        filename (str): Database file name (without .db extension)
+        profile (str, optional): Name of a `PRAGMA_PROFILES` entry. Defaults to "fast".
+        **pragmas: Additional PRAGMA settings, overriding the profile (e.g. cache_size=-200000)
     """
+    settings = dict(PRAGMA_PROFILES[profile])
+    settings.update(pragmas)
+
     engine = sqlal.create_engine(f'sqlite:///{filename}.db')
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        # Transactions are begun by SQLAlchemy rather than implicitly by pysqlite, otherwise the
+        # first SAVEPOINT of a transaction would open (and its release commit) a transaction of its own
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for key, val in settings.items():
+            cursor.execute(f"PRAGMA {key}={val}")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def do_begin(conn):
+        conn.execute("BEGIN")
+
     connection = engine.connect()
     return connection
         
-def create_database(filename, schemas, conn=None):
+def create_database(filename, schemas, conn=None, profile="fast"):
     """
     Helper function for creating the database
     """
     tablemaker = TableMaker()
     if not conn:
-        conn = create_connection(filename)
+        conn = create_connection(filename, profile=profile)
     for name, schema in schemas.items():
         _ = tablemaker.create_table(name, schema)
         # table.create_all(connection, checkfirst=True) #Creates the table
     tablemaker.metadata.create_all(conn, checkfirst=True) # Creates the table
+
+    # Columns and indexes added to the schema after a table was created
+    inspector = sqlal.inspect(conn)
+    for table in tablemaker.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                logger.info(f"Adding column <{column.name}> to table <{table.name}>")
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+                _tables.pop((str(conn.engine.url), table.name), None)
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
     return conn
 
+def begin(conn):
+    """
+    Begins a transaction, or a SAVEPOINT when one is already in progress (e.g. a `TransactionBatch`).
+    Used as a context manager, the writes of the block are rolled back together on error without
+    rolling back the rest of the enclosing transaction.
+    """
+    if conn.in_transaction():
+        return conn.begin_nested()
+    return conn.begin()
+
+class TransactionBatch(object):
+
+    """
+    Groups the database writes of many searches into one transaction, committing
+    every `size` searches (and on exit). With `size <= 1` every upsert commits on its own.
+    """
+
+    def __init__(self, conn, size=1):
+        self.conn = conn
+        self.size = size
+        self.n_pending = 0
+        self.n_lost = 0
+        self.transaction = None
+
+    def _begin(self):
+        if self.size > 1:
+            self.transaction = self.conn.begin()
+        self.n_pending = 0
+
+    def commit(self):
+        if self.transaction is not None:
+            if self.transaction.is_active:
+                self.transaction.commit()
+            else:
+                # A failed upsert rolled back the batch
+                logger.error(f"Transaction batch was rolled back, {self.n_pending} searches lost")
+                self.n_lost += self.n_pending
+            self.transaction = None
+
+    def step(self):
+        """
+        Marks one search as written, committing once the batch is full.
+        """
+        self.n_pending += 1
+        if self.transaction is not None and not self.transaction.is_active:
+            self.commit()
+            self._begin()
+        elif self.n_pending >= self.size:
+            self.commit()
+            self._begin()
+
+    def __enter__(self):
+        self._begin()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.transaction is not None and self.transaction.is_active:
+            self.transaction.rollback()
+            self.transaction = None
+        self.commit()
+
+# Reflected tables, keyed by (engine url, table name)
+_tables = {}
+
+def get_table(table_name, conn):
+    """
+    Returns the (cached) reflected SQLAlchemy table
+    """
+    key = (str(conn.engine.url), table_name)
+    if key not in _tables:
+        _tables[key] = Table(table_name, MetaData(), autoload=True, autoload_with=conn)
+    return _tables[key]
+
+def to_records(df):
+    """
+    Converts a DataFrame (including its index) to a list of row dictionaries with
+    plain Python values and None for missing data.
+    """
+    df = df.reset_index().astype(object)
+    df = df.where(df.notna(), None)
+    return df.to_dict("records")
+
 def to_sql(df, table_name, conn):
 
     """
     Upserts new data to the database.
+
+    Rows are bulk inserted with a single `executemany` of `INSERT OR IGNORE`, so rows whose
+    primary key is already in the table are skipped. The statement has one row of parameters,
+    so the SQLite variable limit does not apply.
+
+    Errors are logged and nothing is written. Inside a transaction of the caller (e.g. a
+    `TransactionBatch`) the rows are written in a SAVEPOINT and errors are raised, so that
+    the caller knows the write failed.
+
+    Args:
+        df (pd.DataFrame): Data to upsert, indexed by primary key
+        table_name (str): Name of the database table
+        conn (Connection): Database connection
+
+    Returns:
+        tuple: (inserted, skipped) number of records
     """
 
-    ids = tuple(df.index.to_list())
-    n_rows = len(ids)
-    if n_rows == 1:
-        ids = ids[0]
-        res = conn.execute(f"SELECT id FROM {table_name} WHERE id IN ({ids})")
-    else:
-        ids = tuple(ids)
-        res = conn.execute(f"SELECT id FROM {table_name} WHERE id IN {ids}")
-    indx = np.array(res.fetchall()).flatten()
-    df = df.loc[df.index.difference(indx)]
-    if not df.empty:
-        msg = "[~] Updating records ..."
-        logger.info(msg)
-        print(msg)
-        try:
-            df.to_sql(table_name, conn, if_exists="append", index=True)
-            msg = f"[~] {df.shape[0]}/{n_rows} records upserted to table <{table_name}>"
-            logger.info(msg)
-            print(msg)
-        except Exception as error:
-            logger.error(error)
+    n_rows = df.shape[0]
+    if not n_rows:
+        return 0, 0
+
+    records = to_records(df)
+    stmt = get_table(table_name, conn).insert().prefix_with("OR IGNORE")
+
+    msg = "[~] Updating records ..."
+    logger.info(msg)
+    print(msg)
+
+    nested = conn.in_transaction()
+    try:
+        with begin(conn):
+            inserted = max(conn.execute(stmt, records).rowcount, 0)
+    except Exception as error:
+        logger.error(error)
+        if nested:
+            raise
+        return 0, 0
+
+    skipped = n_rows - inserted
+    if inserted:
+        msg = f"[~] {inserted}/{n_rows} records upserted to table <{table_name}>"
     else:
         msg = f"0/{n_rows} records upserted to <{table_name}>. (No unique records in DataFrame)"
-        logger.info(msg)
-        print(msg)
\ No newline at end of file
+    logger.info(msg)
+    print(msg)
+    return inserted, skipped
@@ -0,0 +1,213 @@
+import copy
+import time
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, urlencode
+from lxml import etree, html
+
+logger = logging.getLogger("hotels-scraper.standin.standin")
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head><title>Hotels stand-in</title></head>
+<body>
+<ol class="listings infinite-scroll-enabled">
+{cards}
+</ol>
+<div id="listings-loading" style="display: none">Loading more results</div>
+<div class="info" style="display: {end_display}">You have reached the end of the results</div>
+{pagination}
+{script}
+</body>
+</html>
+"""
+
+# Simulated infinite scroll: fetches the next batch of cards when the bottom of the page is reached
+SCROLL_SCRIPT = """<script>
+(function () {
+    var offset = %(offset)d, total = %(total)d, limit = %(limit)d, busy = false;
+    var loader = document.getElementById("listings-loading");
+    var end = document.querySelector(".info");
+    var list = document.querySelector("ol.listings");
+    window.addEventListener("scroll", function () {
+        if (busy || offset >= total) { return; }
+        if (window.innerHeight + window.scrollY < document.body.scrollHeight - 200) { return; }
+        busy = true;
+        loader.style.display = "block";
+        fetch("/listings?offset=" + offset + "&limit=" + limit).then(function (res) {
+            return res.text();
+        }).then(function (cards) {
+            list.insertAdjacentHTML("beforeend", cards);
+            offset += limit;
+            loader.style.display = "none";
+            if (offset >= total) { end.style.display = "block"; }
+            busy = false;
+        });
+    });
+})();
+</script>"""
+
+PAGINATION_LINK = """<a class="pagination-link" href="{href}">{number}</a>"""
+
+
+class StandInSite(object):
+
+    """
+    Local stand-in for the hotels.com results pages, built from a recorded results page.
+
+    The listing cards of the recorded page are cycled (with unique names and ids) to produce
+    `total` listings. `/search.do` serves the first `page_size` listings with a script that loads
+    further batches from `/listings` when scrolled to the bottom. Every batch is delayed by
+    `loader_delay` seconds while the loader is shown, and the end-of-results marker is revealed
+    once all listings are loaded. `/search.do?all=1` serves the fully scrolled page directly and
+    `/search.do?start-index=<n>` serves the results from listing `n` on.
+
+    With `paginate`, `/search.do` serves static pages of `page_size` listings instead, each linking
+    to all results pages (`start-index`) and delayed by `page_delay` seconds. Connections are kept
+    alive between requests.
+
+    Args:
+        page (str): Recorded results page html
+        total (int, optional): Number of listings to serve. Defaults to 300.
+        page_size (int, optional): Listings per scroll batch. Defaults to 50.
+        loader_delay (float, optional): Seconds before a scroll batch is delivered. Defaults to 0.3.
+        paginate (bool, optional): Serve static results pages instead of an infinite scroll. Defaults to False.
+        page_delay (float, optional): Seconds before a static results page is delivered. Defaults to 0.
+    """
+
+    def __init__(self, page, total=300, page_size=50, loader_delay=0.3, paginate=False, page_delay=0):
+        self.total = total
+        self.page_size = page_size
+        self.loader_delay = loader_delay
+        self.paginate = paginate
+        self.page_delay = page_delay
+        self.cards = self.make_cards(page, total)
+        self.requests = 0
+        # Requests being served right now, and the most served at once
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_cards(page, total):
+        tree = html.document_fromstring(page)
+        recorded = tree.xpath("//li[contains(concat(' ', normalize-space(@class), ' '), ' hotel ')]")
+        if not recorded:
+            raise ValueError("Recorded page contains no listing cards")
+        cards = []
+        for i in range(total):
+            card = copy.deepcopy(recorded[i % len(recorded)])
+            card.set("data-hotel-id", str(200000 + i))
+            for name in card.xpath(".//h3[contains(@class, 'p-name')]//a | .//h3[contains(@class, 'p-name')][not(a)]"):
+                name.text = f"{name.text_content().strip()} {i}"
+            cards.append(etree.tostring(card, encoding="unicode", method="html"))
+        return cards
+
+    def render_page(self, all_listings=False, offset=0):
+        n = self.total if all_listings else min(offset + self.page_size, self.total)
+        script = "" if all_listings else SCROLL_SCRIPT % {"offset": n, "total": self.total, "limit": self.page_size}
+        return PAGE_TEMPLATE.format(cards="\n".join(self.cards[offset:n]), script=script, pagination="",
+                                    end_display="block" if n >= self.total else "none")
+
+    def render_static_page(self, path, query, offset=0):
+        """
+        Renders one static results page, linking to all pages of the same search.
+        """
+        links = []
+        for number, start in enumerate(range(0, self.total, self.page_size), 1):
+            page_query = dict(query, **{"start-index": [str(start)]})
+            href = f"{path}?{urlencode(page_query, doseq=True)}"
+            links.append(PAGINATION_LINK.format(href=href, number=number))
+        n = min(offset + self.page_size, self.total)
+        return PAGE_TEMPLATE.format(cards="\n".join(self.cards[offset:n]), script="",
+                                    pagination=f"<nav class=\"pagination\">{''.join(links)}</nav>",
+                                    end_display="block" if n >= self.total else "none")
+
+    def render_listings(self, offset, limit):
+        return "\n".join(self.cards[offset:offset + limit])
+
+    def handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            # Keep-alive
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with site._lock:
+                    site.requests += 1
+                    site.active += 1
+                    site.max_active = max(site.max_active, site.active)
+                try:
+                    self._get()
+                finally:
+                    with site._lock:
+                        site.active -= 1
+
+            def _get(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if url.path == "/search.do" and site.paginate:
+                    time.sleep(site.page_delay)
+                    body = site.render_static_page(url.path, query, offset=int(query.get("start-index", ["0"])[0]))
+                elif url.path == "/search.do":
+                    body = site.render_page(all_listings=query.get("all") == ["1"],
+                                            offset=int(query.get("start-index", ["0"])[0]))
+                elif url.path == "/listings":
+                    time.sleep(site.loader_delay)
+                    offset = int(query.get("offset", ["0"])[0])
+                    limit = int(query.get("limit", [str(site.page_size)])[0])
+                    body = site.render_listings(offset, limit)
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+    def serve(self, host="127.0.0.1", port=0):
+        """
+        Starts the server on a background thread (port 0 picks a free port).
+
+        Returns:
+            StandInServer: Running server, use as a context manager or call `close()`
+        """
+        return StandInServer(self, host, port)
+
+
+class StandInServer(object):
+    """
+    Background HTTP server for a `StandInSite`.
+    """
+
+    def __init__(self, site, host, port):
+        self.site = site
+        self.httpd = ThreadingHTTPServer((host, port), site.handler())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
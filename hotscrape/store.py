@@ -0,0 +1,63 @@
+import logging
+from . import sql
+from . metrics import SearchMetrics
+from . normalize import store_hotels
+
+logger = logging.getLogger("hotels-scraper.store.store")
+
+
+def store_results(df_search, df_attributes, connection, batch=None, checkpoint=None, metrics=None, recorder=None, schema_mode="wide",
+                  aggregates=None, delta=None):
+    """
+    Upserts a search and its results to the database, then records its checkpoint, metrics and
+    aggregates. With a `DeltaStore`, only the hotel observations that changed are written.
+
+    Args:
+        df_search (pd.DataFrame): `search` DataFrame of a single search
+        df_attributes (pd.DataFrame): Its parsed hotels
+        connection (Connection): Database connection
+        batch (TransactionBatch, optional): Batch the writes belong to
+        checkpoint (RunCheckpoint, optional): Checkpoint of the run, the search is marked done
+        metrics (SearchMetrics, optional): Metrics of the search, updated with the rows written
+        recorder (MetricsRecorder, optional): Recorder the metrics are handed to
+        schema_mode (str, optional): Layout of the hotel tables, "wide" or "normalized". Defaults to "wide".
+        aggregates (PriceAggregates, optional): Aggregates to update with the search
+        delta (DeltaStore, optional): Store only the observations that changed
+
+    Returns:
+        bool: True if the search was stored. If a write failed, nothing of the search is stored and
+            it is not marked done in the checkpoint nor added to the aggregates.
+    """
+
+    metrics = metrics if metrics is not None else SearchMetrics()
+    try:
+        # The search and its hotels are written together, or not at all
+        with metrics.timer("to_sql"), sql.begin(connection):
+            if not df_search.empty:
+                sql.to_sql(df_search, "search", connection)
+            if not df_attributes.empty and delta is not None:
+                inserted, skipped, unchanged = delta.store(df_search, df_attributes)
+                metrics.set("rows_inserted", inserted)
+                metrics.set("rows_skipped", skipped)
+                metrics.set("rows_unchanged", unchanged)
+            elif not df_attributes.empty:
+                inserted, skipped = store_hotels(df_attributes, connection, schema_mode=schema_mode)
+                metrics.set("rows_inserted", inserted)
+                metrics.set("rows_skipped", skipped)
+    except Exception as error:
+        # Rolled back to before this search, the rest of the batch is kept
+        search_id = df_search.index[0] if not df_search.empty else None
+        msg = f"[!] Could not store search {search_id} ({error!r})"
+        logger.error(msg)
+        print(msg)
+        return False
+    if checkpoint is not None and not df_search.empty:
+        checkpoint.mark_results(df_search)
+    if recorder is not None and not df_search.empty:
+        recorder.record(connection, df_search.index[0], metrics)
+    if aggregates is not None and not df_search.empty:
+        aggregates.add(df_search)
+    if batch is not None:
+        batch.step()
+    print("\n\n")
+    return True
@@ -0,0 +1,151 @@
+import time
+import logging
+import threading
+from . driver_pool import kill_driver
+
+logger = logging.getLogger("hotels-scraper.watchdog.watchdog")
+
+# Why a search was cut short
+TIMEOUT_REASONS = ("navigate_timeout", "scroll_deadline", "total_deadline")
+
+
+class SearchTimeout(Exception):
+    """
+    Raised when a search exceeds one of its deadlines and yields no usable page.
+    """
+
+    def __init__(self, reason, msg=None):
+        super().__init__(msg or reason)
+        self.reason = reason
+
+
+class Deadlines(object):
+
+    """
+    Per-search wall-clock limits in seconds (None disables a limit).
+
+    Args:
+        navigate (float, optional): Page load timeout of the results page. Defaults to 60.
+        scroll (float, optional): Duration of the scroll phase, listings loaded so far are kept. Defaults to 240.
+        total (float, optional): Whole browser stage of a search. The watchdog kills the browser
+            once it is exceeded. Defaults to 420.
+    """
+
+    def __init__(self, navigate=60, scroll=240, total=420):
+        self.navigate = navigate
+        self.scroll = scroll
+        self.total = total
+
+    def __repr__(self):
+        return f"Deadlines(navigate={self.navigate}, scroll={self.scroll}, total={self.total})"
+
+
+class _Watch(object):
+    """
+    Deadline of one search, armed once a browser is attached.
+    """
+
+    def __init__(self, watchdog, seconds):
+        self.watchdog = watchdog
+        self.seconds = seconds
+        self.driver = None
+        self.deadline = None
+        self.expired = False
+
+    def attach(self, driver):
+        self.driver = driver
+        if self.seconds:
+            self.deadline = self.watchdog.clock() + self.seconds
+
+    def disarm(self):
+        """
+        Stops watching. Once this returns the browser is never killed, it may go back to the pool.
+
+        Returns:
+            bool: False if the deadline expired (and the browser was killed) before
+        """
+        self.watchdog._remove(self)
+        return not self.expired
+
+    def __enter__(self):
+        self.watchdog._add(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.disarm()
+
+
+class Watchdog(object):
+
+    """
+    Background thread enforcing the total deadline of searches.
+
+    A search wraps its browser stage in `watch(seconds)` and attaches its browser. When the
+    deadline passes the browser is killed (see `kill_driver`): whatever WebDriver call the search
+    is stuck in fails, and the search can report the timeout and have the browser replaced.
+
+    Args:
+        poll (float, optional): Seconds between deadline checks. Defaults to 1.
+        kill (callable, optional): Called with the driver of an expired search. Defaults to `kill_driver`.
+        clock (callable, optional): Monotonic clock. Defaults to `time.monotonic`.
+    """
+
+    def __init__(self, poll=1.0, kill=kill_driver, clock=time.monotonic):
+        self.poll = poll
+        self.kill = kill
+        self.clock = clock
+        self.kills = 0
+        self._watches = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def watch(self, seconds):
+        """
+        Context manager arming a deadline of `seconds` (None disables it) for the block.
+        """
+        return _Watch(self, seconds)
+
+    def _add(self, watch):
+        with self._lock:
+            self._watches.add(watch)
+            # Started lazily, scrapers that never search do not get a thread
+            if self._thread is None and self.poll:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="hotscrape-watchdog", daemon=True)
+                self._thread.start()
+
+    def _remove(self, watch):
+        with self._lock:
+            self._watches.discard(watch)
+
+    def check(self):
+        """
+        Kills the browsers of all expired searches. Returns the number of browsers killed.
+        """
+        now = self.clock()
+        # Killed under the lock: a watch disarmed meanwhile (its browser possibly handed to another
+        # search) is no longer in `_watches` and cannot be killed after `disarm` returned
+        with self._lock:
+            expired = [watch for watch in self._watches
+                       if watch.deadline is not None and not watch.expired and now >= watch.deadline]
+            for watch in expired:
+                watch.expired = True
+                logger.warning(f"Search exceeded its {watch.seconds} s deadline, killing its browser")
+                try:
+                    self.kill(watch.driver)
+                except Exception as error:
+                    logger.error(f"Could not kill browser ({error!r})")
+                self.kills += 1
+        return len(expired)
+
+    def _run(self):
+        while not self._stop.wait(self.poll):
+            self.check()
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
@@ -0,0 +1,333 @@
+import io
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+from datetime import datetime, timedelta
+import pandas as pd
+from . import sql
+from . checkpoint import search_key
+from . aggregates import _param
+from . metrics import SearchMetrics
+from . scheduler import TokenBucket
+
+logger = logging.getLogger("hotels-scraper.work_queue.work_queue")
+
+# Tables of the queue database, in the format of `db_schema.yml`
+QUEUE_SCHEMA = {
+    "queue_items": [
+        {"meta": {"primary_key": "id", "indexes": [["status", "seq"], "lease_expires", "lease_owner"]}},
+        {"columns": {"id": "String", "seq": "Integer", "payload": "String", "status": "String", "attempts": "Integer",
+                     "lease_owner": "String", "lease_expires": "DateTime", "error": "String",
+                     "enqueued_at": "DateTime", "updated_at": "DateTime"}},
+    ],
+    "queue_results": [
+        {"meta": {"primary_key": "id", "indexes": [["merged", "created_at"]]}},
+        {"columns": {"id": "String", "item_id": "String", "worker": "String", "df_search": "String",
+                     "df_attributes": "String", "metrics": "String", "merged": "Integer", "created_at": "DateTime"}},
+    ],
+}
+
+STATUSES = ("pending", "leased", "done", "failed")
+
+
+def worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _dumps_search(search):
+    def default(val):
+        if isinstance(val, (datetime, pd.Timestamp)):
+            return pd.Timestamp(val).isoformat()
+        if hasattr(val, "item"):
+            # numpy scalars
+            return val.item()
+        raise TypeError(f"Cannot serialize {val!r}")
+    return json.dumps(search, default=default, sort_keys=True)
+
+
+def _loads_search(payload):
+    search = json.loads(payload)
+    for key in ("checkin_datetime", "checkout_datetime"):
+        if search.get(key) is not None:
+            search[key] = pd.to_datetime(search[key])
+    return search
+
+
+def _dumps_df(df):
+    return df.to_json(orient="table", date_format="iso", date_unit="us")
+
+
+def _loads_df(text):
+    df = pd.read_json(io.StringIO(text), orient="table")
+    # The table orient restores timezone-naive datetimes as UTC
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.DatetimeTZDtype):
+            df[column] = df[column].dt.tz_localize(None)
+    return df
+
+
+class WorkItem(object):
+    """
+    A claimed search. `token` identifies the lease, see `WorkQueue.claim`.
+    """
+
+    def __init__(self, id, search, attempts, token):
+        self.id = id
+        self.search = search
+        self.attempts = attempts
+        self.token = token
+
+    def __repr__(self):
+        return f"WorkItem(id={self.id!r}, attempts={self.attempts})"
+
+
+class WorkQueue(object):
+
+    """
+    Durable queue of searches in an SQLite database, shared by a coordinator, any number of
+    workers (on any host that can reach the file) and a merger.
+
+    Workers claim a search by taking a lease on it: the search stays in the queue but is invisible
+    to other workers until the lease expires (`visibility_timeout`). A worker that crashes simply
+    lets its leases expire and the searches are handed out again, up to `max_attempts` times.
+    Results are pushed back into the queue database and merged into the main database by
+    `main.py merge`, so workers do not need access to it.
+
+    Claims are single `UPDATE` statements, atomic under SQLite's database lock. The "safe" PRAGMA
+    profile (rollback journal) is used by default since WAL does not work across hosts; keep the
+    file on storage with working file locks.
+
+    Args:
+        path (str): Queue database file name (without .db extension)
+        visibility_timeout (float, optional): Lease duration in seconds. Defaults to 900.
+        max_attempts (int, optional): Claims per search before it is marked failed. Defaults to 3.
+        owner (str, optional): Worker name recorded on leases. Defaults to "<host>-<pid>".
+        profile (str, optional): SQLite PRAGMA profile. Defaults to "safe".
+    """
+
+    def __init__(self, path, visibility_timeout=900, max_attempts=3, owner=None, profile="safe"):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.owner = owner or worker_id()
+        self.conn = sql.create_database(path, QUEUE_SCHEMA, profile=profile)
+        self.conn.execute("PRAGMA busy_timeout=30000")
+
+    def close(self):
+        self.conn.close()
+
+    def enqueue(self, searches, chunksize=10000):
+        """
+        Adds searches to the queue, `chunksize` at a time. Searches already queued (same
+        `search_key`) are skipped, so the plan can be enqueued again after a crash.
+
+        Returns:
+            int: Number of searches added
+        """
+        seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM queue_items").scalar()
+        now = datetime.now()
+        inserted = 0
+        records = []
+        for search in searches:
+            seq += 1
+            records.append({"id": search_key(search), "seq": seq, "payload": _dumps_search(search), "status": "pending",
+                            "attempts": 0, "enqueued_at": now, "updated_at": now})
+            if len(records) >= chunksize:
+                inserted += self._insert(records)
+                records = []
+        if records:
+            inserted += self._insert(records)
+        return inserted
+
+    def _insert(self, records):
+        df = pd.DataFrame(records).drop_duplicates(subset=["id"]).set_index("id")
+        return sql.to_sql(df, "queue_items", self.conn)[0]
+
+    def claim(self):
+        """
+        Leases the next available search: pending, or leased with an expired lease.
+
+        Returns:
+            WorkItem: The claimed search, or None if no search is available right now
+        """
+        now = datetime.now()
+        token = f"{self.owner}:{uuid.uuid4().hex[:8]}"
+        expires = now + timedelta(seconds=self.visibility_timeout)
+        self._expire(now)
+        res = self.conn.execute(
+            "UPDATE queue_items SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? "
+            "WHERE id = (SELECT id FROM queue_items WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+            "ORDER BY seq LIMIT 1)",
+            token, _param(expires), _param(now), _param(now))
+        if not res.rowcount:
+            return None
+        row = self.conn.execute("SELECT id, payload, attempts FROM queue_items WHERE lease_owner = ?", token).fetchone()
+        if row is None:
+            return None
+        if row[2] > 1:
+            logger.warning(f"Search {row[0]} claimed again (attempt {row[2]})")
+        return WorkItem(row[0], _loads_search(row[1]), row[2], token)
+
+    def _expire(self, now):
+        # Searches whose last allowed lease expired are given up on
+        self.conn.execute("UPDATE queue_items SET status = 'failed', error = COALESCE(error, 'lease expired'), updated_at = ? "
+                          "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                          _param(now), _param(now), self.max_attempts)
+
+    def extend(self, item):
+        """
+        Renews the lease of a claimed search. Returns False if the lease was lost.
+        """
+        expires = datetime.now() + timedelta(seconds=self.visibility_timeout)
+        res = self.conn.execute("UPDATE queue_items SET lease_expires = ? WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                                _param(expires), item.id, item.token)
+        return bool(res.rowcount)
+
+    def complete(self, item, df_search, df_attributes, metrics=None, resume_from=None):
+        """
+        Pushes the results of a claimed search and releases it.
+
+        Args:
+            item (WorkItem): Claimed search
+            df_search (pd.DataFrame): `search` DataFrame
+            df_attributes (pd.DataFrame): `hotels` DataFrame
+            metrics (SearchMetrics, optional): Metrics of the search
+            resume_from (int, optional): Listing offset of the first missing result of an incomplete
+                search. The search is queued again from there instead of being marked done.
+
+        Returns:
+            bool: False if the lease was lost (expired and claimed by another worker), the results are not pushed
+        """
+        now = datetime.now()
+        result = pd.DataFrame([{"id": item.token, "item_id": item.id, "worker": self.owner, "df_search": _dumps_df(df_search),
+                                "df_attributes": _dumps_df(df_attributes),
+                                "metrics": json.dumps(metrics.to_record() if metrics is not None else {}),
+                                "merged": 0, "created_at": now}]).set_index("id")
+        with self.conn.begin():
+            # Only while the lease is held: after it expired the search may have been handed to another worker
+            if resume_from is None:
+                res = self.conn.execute("UPDATE queue_items SET status = 'done', lease_owner = NULL, lease_expires = NULL, "
+                                        "error = NULL, updated_at = ? WHERE id = ? AND lease_owner = ?",
+                                        _param(now), item.id, item.token)
+            else:
+                # Retry the rest of the results, the stored part is not fetched again. Attempts only
+                # count up while a search makes no progress.
+                progress = int(resume_from) > int(item.search.get("result_offset") or 0)
+                status = "failed" if not progress and item.attempts >= self.max_attempts else "pending"
+                payload = _dumps_search(dict(item.search, result_offset=int(resume_from)))
+                res = self.conn.execute("UPDATE queue_items SET status = ?, payload = ?, attempts = ?, lease_owner = NULL, "
+                                        "lease_expires = NULL, error = 'incomplete', updated_at = ? WHERE id = ? AND lease_owner = ?",
+                                        status, payload, 0 if progress else item.attempts, _param(now), item.id, item.token)
+            if not res.rowcount:
+                logger.warning(f"Lease on search {item.id} was lost, its results are dropped")
+                return False
+            inserted, _ = sql.to_sql(result, "queue_results", self.conn)
+            if not inserted:
+                raise RuntimeError(f"Could not push the results of search {item.id}")
+        return True
+
+    def fail(self, item, error=None):
+        """
+        Releases a claimed search that could not be scraped. It is retried until `max_attempts` is reached.
+        """
+        now = datetime.now()
+        self.conn.execute("UPDATE queue_items SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                          "lease_owner = NULL, lease_expires = NULL, error = ?, updated_at = ? WHERE id = ? AND lease_owner = ?",
+                          self.max_attempts, None if error is None else str(error)[:500], _param(now), item.id, item.token)
+
+    def stats(self):
+        """
+        Returns the number of searches per status, plus the number of unmerged results.
+        """
+        counts = {status: 0 for status in STATUSES}
+        counts.update(dict(self.conn.execute("SELECT status, COUNT(*) FROM queue_items GROUP BY status").fetchall()))
+        counts["unmerged"] = self.conn.execute("SELECT COUNT(*) FROM queue_results WHERE merged = 0").scalar()
+        return counts
+
+    def results(self, limit=100, after=None):
+        """
+        Returns up to `limit` unmerged results as (result id, df_search, df_attributes, metrics) tuples,
+        in the order they were pushed.
+
+        Args:
+            limit (int, optional): Max number of results. Defaults to 100.
+            after (str, optional): Only return results pushed after this result id (e.g. to page past
+                results that could not be merged).
+        """
+        query = "SELECT id, df_search, df_attributes, metrics FROM queue_results WHERE merged = 0 "
+        params = []
+        if after is not None:
+            query += "AND rowid > (SELECT rowid FROM queue_results WHERE id = ?) "
+            params.append(after)
+        rows = self.conn.execute(query + "ORDER BY rowid LIMIT ?", *params, int(limit)).fetchall()
+        return [(row[0], _loads_df(row[1]), _loads_df(row[2]), SearchMetrics.from_record(json.loads(row[3])))
+                for row in rows]
+
+    def mark_merged(self, result_ids, drop=True):
+        """
+        Marks results as merged. Their payload is dropped unless `drop` is False.
+        """
+        for result_id in result_ids:
+            if drop:
+                self.conn.execute("UPDATE queue_results SET merged = 1, df_search = NULL, df_attributes = NULL WHERE id = ?", result_id)
+            else:
+                self.conn.execute("UPDATE queue_results SET merged = 1 WHERE id = ?", result_id)
+
+
+
+def drain(queue, scraper, rpm=None, poll=10, wait=True, sleep=time.sleep):
+    """
+    Worker loop: claims searches, scrapes them and pushes the results until the queue is drained.
+
+    Args:
+        queue (WorkQueue): Shared queue
+        scraper (Scraper): Scraper running the searches
+        rpm (float, optional): Max searches per minute of this worker. Unlimited if omitted.
+        poll (float, optional): Seconds between claims while other workers hold all remaining searches. Defaults to 10.
+        wait (bool, optional): Keep polling while searches are leased by other workers (their leases
+            may expire and need to be taken over). Defaults to True.
+
+    Returns:
+        tuple: (number of searches completed, number of searches failed)
+    """
+    bucket = TokenBucket(rpm) if rpm else None
+    n_done = n_failed = 0
+    while True:
+        item = queue.claim()
+        if item is None:
+            stats = queue.stats()
+            if not stats["pending"] and (not wait or not stats["leased"]):
+                break
+            sleep(poll)
+            continue
+
+        if bucket is not None:
+            sleep(bucket.delay())
+            bucket.take()
+        metrics = SearchMetrics()
+        try:
+            df_search, df_attributes = scraper.run(dict(item.search), metrics=metrics)
+        except Exception as error:
+            logger.error(f"Search failed: {item} ({error!r})")
+            queue.fail(item, getattr(error, "reason", None) or repr(error))
+            n_failed += 1
+            continue
+        if df_search.empty:
+            queue.fail(item, "no results")
+            n_failed += 1
+            continue
+
+        row = df_search.iloc[0]
+        resume_from = None
+        if not row.get("complete", 1):
+            resume_from = int(row.get("result_offset") or 0) + int(row.get("n_listings") or 0)
+        if queue.complete(item, df_search, df_attributes, metrics=metrics, resume_from=resume_from):
+            n_done += 1
+
+    msg = f"[~] Worker {queue.owner} finished: {n_done} searches completed, {n_failed} failed"
+    logger.info(msg)
+    print(msg)
+    return n_done, n_failed
@@ -0,0 +1,137 @@
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.util import Finalize
+import pandas as pd
+from . scraper import HotelsScraper
+from . driver_pool import DriverPool
+from . metrics import SearchMetrics
+
+logger = logging.getLogger("hotels-scraper.workers.workers")
+
+# Per-process scraper, created by `init_worker`
+_scraper = None
+
+
+def init_worker(pool_kwargs, scraper_kwargs, scraper_cls=HotelsScraper):
+    """
+    Process pool initializer. Gives each worker process its own scraper and browser.
+    """
+    global _scraper
+    pool = DriverPool(size=1, **pool_kwargs)
+    _scraper = scraper_cls(pool=pool, **scraper_kwargs)
+    # Quit the browser when the worker process exits
+    Finalize(pool, pool.close, exitpriority=10)
+
+
+def scrape_search(search):
+    """
+    Runs a single search inside a worker process. Never raises; failed searches
+    return empty DataFrames so that one bad search cannot take the run down.
+    """
+    metrics = SearchMetrics()
+    try:
+        df_search, df_attributes = _scraper.run(search, metrics=metrics)
+    except Exception as error:
+        logger.error(f"Search failed: {search} ({error!r})")
+        return search, pd.DataFrame(), pd.DataFrame(), metrics
+    return search, df_search, df_attributes, metrics
+
+
+def run_parallel(searches, on_result, workers, pool_kwargs=None, scraper_kwargs=None, max_pending=None,
+                 scraper_cls=HotelsScraper):
+    """
+    Spreads searches across a pool of worker processes, each owning one browser.
+
+    Results are handed back to `on_result(df_search, df_attributes, metrics)` in the calling
+    process, so database writes stay in a single process.
+
+    Args:
+        searches (iterable): Search dictionaries (as returned by `Search.to_dict`)
+        on_result (callable): Called with `(df_search, df_attributes, metrics)` for every finished search.
+            Returns False (or raises) if the results could not be stored.
+        workers (int): Number of worker processes
+        pool_kwargs (dict, optional): Keyword arguments for each worker's `DriverPool`
+        scraper_kwargs (dict, optional): Keyword arguments for each worker's scraper
+        max_pending (int, optional): Max number of submitted but unfinished searches. Defaults to 2 * workers.
+        scraper_cls (type, optional): Site adapter each worker runs. Defaults to `HotelsScraper`.
+
+    Returns:
+        tuple: (number of searches that failed, number of searches scraped but not stored)
+    """
+    pool_kwargs = pool_kwargs or {}
+    scraper_kwargs = scraper_kwargs or {}
+    max_pending = max_pending or 2 * workers
+    searches = iter(searches)
+    # Searches in flight when a worker died. Any of them may have killed it, so each one is
+    # rerun alone: a search that breaks the pool while running alone is the one that failed.
+    suspects = deque()
+    n_failed = 0
+    n_not_stored = 0
+    exhausted = False
+
+    while True:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(pool_kwargs, scraper_kwargs, scraper_cls)) as executor:
+            pending = {}
+            isolated = None
+            broken = False
+            while not broken:
+                # Keep the pool fed without materializing the whole search plan
+                while isolated is None and len(pending) < max_pending:
+                    if suspects:
+                        if not pending:
+                            isolated = executor.submit(scrape_search, suspects[0])
+                            pending[isolated] = suspects.popleft()
+                        break
+                    if exhausted:
+                        break
+                    search = next(searches, None)
+                    if search is None:
+                        exhausted = True
+                        break
+                    pending[executor.submit(scrape_search, search)] = search
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    search = pending.pop(future)
+                    alone = future is isolated
+                    if alone:
+                        isolated = None
+                    try:
+                        _, df_search, df_attributes, metrics = future.result()
+                    except BrokenProcessPool:
+                        # A worker died hard (e.g. killed by the OOM killer); restart the pool
+                        broken = True
+                        if alone:
+                            n_failed += 1
+                            logger.error(f"Worker process died while running search: {search}")
+                        else:
+                            suspects.append(search)
+                        continue
+                    except Exception as error:
+                        n_failed += 1
+                        logger.error(f"Search failed: {search} ({error!r})")
+                        continue
+                    if df_search.empty:
+                        n_failed += 1
+                        continue
+                    try:
+                        stored = on_result(df_search, df_attributes, metrics)
+                        # Callbacks that report nothing (None) count as stored
+                        if stored is not None and not stored:
+                            n_not_stored += 1
+                    except Exception as error:
+                        n_not_stored += 1
+                        logger.error(f"Failed to store results for search: {search} ({error!r})")
+
+            if broken:
+                # Searches that were still in flight on the broken pool are resubmitted to a fresh pool
+                suspects.extend(pending.values())
+                msg = f"[!] Worker pool broke, restarting ({len(suspects)} searches resubmitted)"
+                logger.error(msg)
+                print(msg)
+                continue
+        return n_failed, n_not_stored
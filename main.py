@@ -3,29 +3,64 @@ import pandas as pd
 from datetime import datetime, timedelta
 import argparse
 #import hotscrape.scraper as hs
-from hotscrape.scraper import HotelsScraper
+from hotscrape.scraper import HotelsScraper, SITES
+from hotscrape.driver_pool import DriverPool
+from hotscrape.watchdog import Deadlines, SearchTimeout
+from hotscrape.blocking import DEFAULT_BLOCKLIST, LeanDriverFactory, load_blocklist
+from hotscrape.workers import run_parallel
+from hotscrape.pipeline import Pipeline
+from hotscrape.archive import PageArchive
+from hotscrape.reparse import reparse
+from hotscrape.export import export
+from hotscrape.aggregates import PriceAggregates
+from hotscrape.checkpoint import RunCheckpoint
+from hotscrape.scheduler import SearchScheduler
+from hotscrape.grid import SearchGrid, Shard
+from hotscrape.work_queue import WorkQueue, drain
+from hotscrape.metrics import SearchMetrics, MetricsRecorder
+from hotscrape.normalize import SCHEMA_MODES, create_view
+from hotscrape.delta import DeltaStore, create_delta_view
+from hotscrape.store import store_results
 from hotscrape.utils import load_schema
 import hotscrape.sql as sql
-from hotscrape.search_parser import Search, create_search_list
+from hotscrape.search_parser import create_search_list
 
 logging.basicConfig(filename='logs/run.log', format='%(asctime)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S', level=logging.INFO)
 logger = logging.getLogger('hotels-scraper.run')
 
-def run_scraper(search, connection):
+def run_scraper(search, connection, hs, batch=None, checkpoint=None, recorder=None, schema_mode="wide", aggregates=None, delta=None):
     """
     Helper function for running the scraper and sql upserts
     """
 
-    hs = HotelsScraper()
-    df_search, df_attributes = hs.run(search)
-    # Upsert search and search results to DB
-    if not df_search.empty:
-        sql.to_sql(df_search, "search", connection)
-    if not df_attributes.empty:
-        sql.to_sql(df_attributes, "hotels", connection)
-    print("\n\n")
+    metrics = SearchMetrics()
+    try:
+        df_search, df_attributes = hs.run(search, metrics=metrics)
+    except SearchTimeout as error:
+        # Not marked done, a resumed run retries it
+        if checkpoint is not None:
+            checkpoint.mark(search, status=error.reason, result_offset=search.get("result_offset"))
+        if batch is not None:
+            batch.step()
+        return
+    store_results(df_search, df_attributes, connection, batch=batch, checkpoint=checkpoint, metrics=metrics, recorder=recorder,
+                  schema_mode=schema_mode, aggregates=aggregates, delta=delta)
 
-def run(search_path, db_path, schema_path):
+def pool_options(recycle_pages=50, recycle_rss=1500, lean=False, blocklist_path=None):
+    """
+    Keyword arguments of the `DriverPool`s of a run
+    """
+    pool_kwargs = {"max_pages": recycle_pages, "max_rss_mb": recycle_rss}
+    if lean:
+        blocklist = DEFAULT_BLOCKLIST + (load_blocklist(blocklist_path) if blocklist_path else ())
+        pool_kwargs["driver_factory"] = LeanDriverFactory(blocklist)
+    return pool_kwargs
+
+def run(search_path, db_path, schema_path, pool_size=1, recycle_pages=50, recycle_rss=1500, workers=1,
+        extraction_mode="html", prune=True, db_profile="fast", batch_size=1, pipeline=False, parse_workers=2, parse_processes=False,
+        archive_path=None, resume=False, run_id=None, rpm=None, destination_rpm=None, destination_burst=1, jitter=0.0,
+        metrics_jsonl=None, metrics_prom=None, schema_mode="wide", update_aggregates=False, lean=False, blocklist_path=None,
+        deadlines=None, partial=True, shard=None, site="hotels", delta=False):
     """
     Top-level function for running the hotscrape program. 
 
@@ -33,6 +68,37 @@ def run(search_path, db_path, schema_path):
         search_path (str): Path to search config file
         db_path (str): Path to database file
         schema_path (str): Path to database schema file
+        pool_size (int, optional): Number of warm browsers kept in the driver pool. Defaults to 1.
+        recycle_pages (int, optional): Restart a browser after this many searches. Defaults to 50.
+        recycle_rss (float, optional): Restart a browser once it uses this many MB of memory. Defaults to 1500.
+        workers (int, optional): Number of worker processes, each with its own browser. Defaults to 1.
+        extraction_mode (str, optional): "html" (parse page source), "js" (extract in the browser) or "stream" (extract in the browser after every scroll). Defaults to "html".
+        prune (bool, optional): In "stream" extraction mode, empty harvested listings to keep the page small. Defaults to True.
+        db_profile (str, optional): SQLite PRAGMA profile, see `sql.PRAGMA_PROFILES`. Defaults to "fast".
+        batch_size (int, optional): Number of searches committed per database transaction. Defaults to 1.
+        pipeline (bool, optional): Run scraping, parsing and DB writes as concurrent stages. Defaults to False.
+        parse_workers (int, optional): Number of parse threads/processes in pipeline mode. Defaults to 2.
+        parse_processes (bool, optional): Parse in worker processes instead of threads in pipeline mode. Defaults to False.
+        archive_path (str, optional): Directory of the raw page archive. Pages are not archived if omitted.
+        resume (bool, optional): Resume the latest run of this config from the last day, skipping completed searches. Defaults to False.
+        run_id (str, optional): Id of the run to resume or create. Defaults to a new id.
+        rpm (float, optional): Global requests per minute. Unlimited if omitted.
+        destination_rpm (float, optional): Requests per minute per destination. Unlimited if omitted.
+        destination_burst (int, optional): Requests a destination may receive back to back. Defaults to 1.
+        jitter (float, optional): Max random extra delay in seconds before each search. Defaults to 0.
+        metrics_jsonl (str, optional): Append the per-search metrics to this JSON lines file.
+        metrics_prom (str, optional): Write running metric totals to this Prometheus textfile.
+        schema_mode (str, optional): "wide" (`hotels` table) or "normalized" (`hotel` and `price_observation` tables). Defaults to "wide".
+        update_aggregates (bool, optional): Keep the price aggregate tables up to date while scraping. Defaults to False.
+        lean (bool, optional): Start browsers with the lean profile, blocking images, fonts, ads and trackers. Defaults to False.
+        blocklist_path (str, optional): File of domains/URL patterns blocked in addition to the default blocklist (lean profile only).
+        deadlines (Deadlines, optional): Navigation, scroll phase and total time limits per search. Defaults to `Deadlines()`.
+        partial (bool, optional): Keep the listings loaded before a scroll error and mark the search incomplete (resumed
+            from the first missing listing by `--resume`) instead of discarding it. Defaults to True.
+        shard (Shard, optional): Only scrape this slice of the search grid. Defaults to the whole grid.
+        site (str, optional): Site adapter, see `scraper.SITES` ("bookings" fetches static pages over HTTP). Defaults to "hotels".
+        delta (bool, optional): Only store hotel observations whose price, sale price, rating or number of reviews
+            changed since their last stored observation, see `DeltaStore`. Defaults to False.
     """
 
     logger.info("=======================================================")
@@ -41,7 +107,11 @@ def run(search_path, db_path, schema_path):
 
     schema = load_schema(schema_path)
 
-    connection = sql.create_database(db_path, schema)
+    connection = sql.create_database(db_path, schema, profile=db_profile)
+    if schema_mode == "normalized":
+        create_view(connection)
+    if delta:
+        create_delta_view(connection, schema_mode)
 
     search_list = create_search_list(search_path)
 
@@ -50,22 +120,350 @@ def run(search_path, db_path, schema_path):
 
     logger.info(search_list)
 
-    for s_init in search_list:
-        # msg = f"Run: {s_init}"
-        # logger.info(msg)
-        # print(msg)
-        for s in Search.generate(s_init):
-            run_scraper(s.to_dict(), connection)
+    # Each shard is a run of its own, resumed separately
+    plan = search_list if shard is None else search_list + [{"shard": str(shard)}]
+    checkpoint = RunCheckpoint.start(connection, plan, resume=resume, run_id=run_id)
+    # Dates are counted from the run's start so that a resumed run regenerates the same plan
+    grid = SearchGrid(search_list, start=checkpoint.started_at, shard=shard)
+    grid.describe()
+    searches = checkpoint.pending(grid)
+    # Nearest checkin dates first, paced by the global and per-destination rate limits
+    searches = SearchScheduler(searches, rpm=rpm, destination_rpm=destination_rpm,
+                               destination_burst=destination_burst, jitter=jitter)
+    archive = PageArchive(archive_path) if archive_path else None
+    scraper_kwargs = {"extraction_mode": extraction_mode, "archive": archive, "prune": prune, "deadlines": deadlines,
+                      "partial": partial}
+    # Per-search stage timings and counters, stored in the `search_metrics` table
+    recorder = MetricsRecorder(run_id=checkpoint.run_id, jsonl_path=metrics_jsonl, prom_path=metrics_prom)
+    # Aggregates are refreshed once per committed batch of searches
+    aggregates = PriceAggregates(connection, schema_mode=schema_mode, every=batch_size, delta=delta) if update_aggregates else None
+    delta_store = DeltaStore(connection, schema_mode=schema_mode) if delta else None
+    pool_kwargs = pool_options(recycle_pages, recycle_rss, lean=lean, blocklist_path=blocklist_path)
+
+    if pipeline:
+        with DriverPool(size=pool_size, **pool_kwargs) as pool:
+            hs = SITES[site](pool=pool, **scraper_kwargs)
+            try:
+                Pipeline(hs, db_path, schema, parse_workers=parse_workers, use_processes=parse_processes,
+                         batch_size=batch_size, db_profile=db_profile, run_id=checkpoint.run_id, recorder=recorder,
+                         schema_mode=schema_mode, update_aggregates=update_aggregates, delta=delta).run(searches)
+            finally:
+                hs.close()
+    elif workers > 1:
+        with sql.TransactionBatch(connection, size=batch_size) as batch:
+            # Returns whether the results were stored
+            on_result = lambda df_search, df_attributes, metrics: store_results(df_search, df_attributes, connection, batch=batch,
+                                                                                checkpoint=checkpoint, metrics=metrics, recorder=recorder,
+                                                                                schema_mode=schema_mode, aggregates=aggregates,
+                                                                                delta=delta_store)
+            n_failed, n_not_stored = run_parallel(searches, on_result, workers, pool_kwargs=pool_kwargs,
+                                                  scraper_kwargs=scraper_kwargs, scraper_cls=SITES[site])
+        # Stored, but rolled back with their transaction batch
+        n_not_stored += batch.n_lost
+        if n_failed or n_not_stored:
+            msg = f"[!] {n_failed} searches failed, {n_not_stored} could not be stored"
+            logger.warning(msg)
+            print(msg)
+    else:
+        with DriverPool(size=pool_size, **pool_kwargs) as pool, \
+                sql.TransactionBatch(connection, size=batch_size) as batch:
+            hs = SITES[site](pool=pool, **scraper_kwargs)
+            try:
+                for search in searches:
+                    run_scraper(search, connection, hs, batch=batch, checkpoint=checkpoint, recorder=recorder, schema_mode=schema_mode,
+                                aggregates=aggregates, delta=delta_store)
+            finally:
+                hs.close()
+    if aggregates is not None:
+        aggregates.flush()
+    recorder.close()
+    checkpoint.finish()
     msg = "Run finished"
     logger.info(msg)
     print(msg)
 
+def run_reparse(db_path, schema_path, archive_path, workers=None, db_profile="fast", schema_mode="wide"):
+    """
+    Rebuilds the `hotels` table from archived pages without scraping.
+
+    Args:
+        db_path (str): Path to database file
+        schema_path (str): Path to database schema file
+        archive_path (str): Directory of the raw page archive
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        db_profile (str, optional): SQLite PRAGMA profile, see `sql.PRAGMA_PROFILES`. Defaults to "fast".
+        schema_mode (str, optional): Layout of the hotel tables to rebuild, "wide" or "normalized". Defaults to "wide".
+    """
+
+    logger.info("=======================================================")
+    logger.info("                      START REPARSE                    ")
+    logger.info("=======================================================\n")
+
+    connection = sql.create_database(db_path, load_schema(schema_path), profile=db_profile)
+    reparse(connection, PageArchive(archive_path), workers=workers, schema_mode=schema_mode)
+    msg = "Reparse finished"
+    logger.info(msg)
+    print(msg)
+
+def run_export(db_path, schema_path, export_path, schema_mode="wide", full=False, delta=False):
+    """
+    Exports the hotel observations joined with their searches to a partitioned Parquet dataset.
+
+    Args:
+        db_path (str): Path to database file
+        schema_path (str): Path to database schema file
+        export_path (str): Root directory of the Parquet dataset
+        schema_mode (str, optional): Layout of the hotel tables, "wide" or "normalized". Defaults to "wide".
+        full (bool, optional): Export everything instead of only the searches since the last export. Defaults to False.
+        delta (bool, optional): Hotels were stored with `--delta`, export the unchanged observations as well. Defaults to False.
+    """
+
+    logger.info("=======================================================")
+    logger.info("                      START EXPORT                     ")
+    logger.info("=======================================================\n")
+
+    schema = load_schema(schema_path)
+    connection = sql.create_database(db_path, schema)
+    export(connection, schema, export_path, schema_mode=schema_mode, full=full, delta=delta)
+    msg = "Export finished"
+    logger.info(msg)
+    print(msg)
+
+def run_coordinator(search_path, queue_path, shard=None):
+    """
+    Expands the search plan into the shared work queue (`main.py coordinator`).
+
+    Args:
+        search_path (str): Path to search config file
+        queue_path (str): Path to the queue database file
+        shard (Shard, optional): Only queue this slice of the search grid. Defaults to the whole grid.
+    """
+
+    logger.info("=======================================================")
+    logger.info("                   START COORDINATOR                   ")
+    logger.info("=======================================================\n")
+
+    search_list = create_search_list(search_path)
+    grid = SearchGrid(search_list, shard=shard)
+    grid.describe()
+    queue = WorkQueue(queue_path)
+    # Nearest checkin dates first, workers pace themselves
+    n_added = queue.enqueue(SearchScheduler(grid))
+    msg = f"[~] {n_added} searches queued in {queue_path} ({queue.stats()})"
+    logger.info(msg)
+    print(msg)
+    queue.close()
+
+def run_plan(search_path, shard=None):
+    """
+    Prints the size of the search plan without scraping (`main.py plan`).
+
+    Args:
+        search_path (str): Path to search config file
+        shard (Shard, optional): Also count the searches of this slice of the grid.
+    """
+
+    return SearchGrid(create_search_list(search_path), shard=shard).describe()
+
+def run_worker(queue_path, pool_size=1, recycle_pages=50, recycle_rss=1500, extraction_mode="html", prune=True,
+               archive_path=None, rpm=None, lean=False, blocklist_path=None, deadlines=None, partial=True,
+               visibility_timeout=900, max_attempts=3, site="hotels"):
+    """
+    Scrapes searches claimed from the shared work queue until it is drained (`main.py worker`).
+    Results are pushed back to the queue, see `run_merge`. Scraping options are those of `run`.
+
+    Args:
+        queue_path (str): Path to the queue database file
+        visibility_timeout (float, optional): Seconds before the search of a crashed worker is handed out again. Defaults to 900.
+        max_attempts (int, optional): Attempts per search before it is marked failed. Defaults to 3.
+        site (str, optional): Site adapter, see `scraper.SITES`. Defaults to "hotels".
+    """
+
+    logger.info("=======================================================")
+    logger.info("                      START WORKER                     ")
+    logger.info("=======================================================\n")
+
+    queue = WorkQueue(queue_path, visibility_timeout=visibility_timeout, max_attempts=max_attempts)
+    archive = PageArchive(archive_path) if archive_path else None
+    with DriverPool(size=pool_size, **pool_options(recycle_pages, recycle_rss, lean=lean, blocklist_path=blocklist_path)) as pool:
+        hs = SITES[site](pool=pool, extraction_mode=extraction_mode, archive=archive, prune=prune, deadlines=deadlines,
+                           partial=partial)
+        try:
+            drain(queue, hs, rpm=rpm)
+        finally:
+            hs.close()
+    queue.close()
+
+def run_merge(db_path, schema_path, queue_path, db_profile="fast", schema_mode="wide", update_aggregates=False,
+              metrics_jsonl=None, metrics_prom=None, chunksize=100, delta=False):
+    """
+    Merges the results pushed by workers into the database (`main.py merge`). Can be run while
+    workers are still running, and again afterwards.
+
+    Args:
+        db_path (str): Path to database file
+        schema_path (str): Path to database schema file
+        queue_path (str): Path to the queue database file
+        chunksize (int, optional): Results merged per transaction. Defaults to 100.
+        delta (bool, optional): Only store the hotel observations that changed, see `run`. Defaults to False.
+    """
+
+    logger.info("=======================================================")
+    logger.info("                      START MERGE                      ")
+    logger.info("=======================================================\n")
+
+    connection = sql.create_database(db_path, load_schema(schema_path), profile=db_profile)
+    if schema_mode == "normalized":
+        create_view(connection)
+    if delta:
+        create_delta_view(connection, schema_mode)
+    queue = WorkQueue(queue_path)
+    recorder = MetricsRecorder(run_id=f"queue:{queue_path}", jsonl_path=metrics_jsonl, prom_path=metrics_prom)
+    aggregates = PriceAggregates(connection, schema_mode=schema_mode, every=chunksize, delta=delta) if update_aggregates else None
+    delta_store = DeltaStore(connection, schema_mode=schema_mode) if delta else None
+    n_merged = n_failed = 0
+    last_id = None
+    while True:
+        results = queue.results(limit=chunksize, after=last_id)
+        if not results:
+            break
+        stored = []
+        with sql.TransactionBatch(connection, size=len(results)) as batch:
+            for result_id, df_search, df_attributes, metrics in results:
+                if store_results(df_search, df_attributes, connection, batch=batch, metrics=metrics, recorder=recorder,
+                                 schema_mode=schema_mode, aggregates=aggregates, delta=delta_store):
+                    stored.append(result_id)
+        if batch.n_lost:
+            stored = []
+        # Only after the commit: a crash in between merges the chunk again, which the upserts absorb.
+        # Results that could not be stored stay unmerged and are retried by the next merge.
+        queue.mark_merged(stored)
+        n_merged += len(stored)
+        n_failed += len(results) - len(stored)
+        last_id = results[-1][0]
+    if aggregates is not None:
+        aggregates.flush()
+    recorder.close()
+    msg = f"Merge finished: {n_merged} results merged ({queue.stats()})"
+    logger.info(msg)
+    print(msg)
+    if n_failed:
+        msg = f"[!] {n_failed} results could not be stored, they are kept for the next merge"
+        logger.warning(msg)
+        print(msg)
+    queue.close()
+
+def run_rebuild_aggregates(db_path, schema_path, schema_mode="wide", delta=False):
+    """
+    Recomputes all price aggregate tables from the stored searches.
+    """
+
+    connection = sql.create_database(db_path, load_schema(schema_path))
+    if delta:
+        create_delta_view(connection, schema_mode)
+    PriceAggregates(connection, schema_mode=schema_mode, delta=delta).rebuild()
+    msg = "Aggregates rebuilt"
+    logger.info(msg)
+    print(msg)
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description='Process some integers.')
+    parser.add_argument("command", nargs="?", default="run", choices=("run", "coordinator", "worker", "merge", "plan"),
+                        help="run: scrape the search plan into the database; coordinator: queue the search plan in --queue; "
+                             "worker: scrape searches from --queue; merge: store the results in --queue in the database; "
+                             "plan: print the size of the search plan")
+    parser.add_argument("-q", "--queue", default="default_queue", help="Path to the shared work queue database (e.g. default_queue.db)")
+    parser.add_argument("--visibility-timeout", type=float, default=900,
+                        help="Seconds before a search claimed by a crashed worker is handed out again")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Attempts per queued search before it is marked failed")
+    parser.add_argument("--shard", type=Shard.parse, default=None,
+                        help="Only run slice i of N of the search grid (e.g. 0/4), searches are assigned by a stable hash")
+    parser.add_argument("--site", default="hotels", choices=list(SITES),
+                        help="Site to scrape (hotels: browser with infinite scroll, bookings: static result pages over HTTP)")
     parser.add_argument("-i", "--input", default="default_search.ini", help="Config file to use for search (e.g. default.ini)")
     parser.add_argument("-d", "--database", default="default_sql", help="Path to database (e.g. default_sql.db)")
     parser.add_argument("-s", "--schema", default="db_schema.yml", help="Database schema file (e.g. db_schema.db)")
+    parser.add_argument("--pool-size", type=int, default=1, help="Number of warm browsers kept in the driver pool")
+    parser.add_argument("--recycle-pages", type=int, default=50, help="Restart a browser after this many searches")
+    parser.add_argument("--recycle-rss", type=float, default=1500, help="Restart a browser once it uses this many MB of memory")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Number of worker processes, each running its own browser")
+    parser.add_argument("--extraction", default="html", choices=HotelsScraper.extraction_modes,
+                        help="Extract listings from the page source (html), inside the browser (js) or inside the browser after every scroll (stream)")
+    parser.add_argument("--keep-harvested", action="store_true",
+                        help="In stream mode, keep harvested listings in the page instead of emptying them")
+    parser.add_argument("--db-profile", default="fast", choices=list(sql.PRAGMA_PROFILES),
+                        help="SQLite PRAGMA profile (fast: WAL + large caches, safe: SQLite defaults)")
+    parser.add_argument("--batch-size", type=int, default=1, help="Number of searches committed per database transaction")
+    parser.add_argument("--pipeline", action="store_true", help="Run scraping, parsing and DB writes as concurrent stages")
+    parser.add_argument("--parse-workers", type=int, default=2, help="Number of parse threads/processes in pipeline mode")
+    parser.add_argument("--parse-processes", action="store_true", help="Parse in worker processes instead of threads in pipeline mode")
+    parser.add_argument("-a", "--archive", default=None, help="Directory for the compressed raw page archive")
+    parser.add_argument("--reparse", action="store_true", help="Rebuild the hotels table from the page archive (no scraping)")
+    parser.add_argument("--resume", action="store_true", help="Resume the latest run of this config, skipping completed searches")
+    parser.add_argument("--run-id", default=None, help="Id of the run to resume or create")
+    parser.add_argument("--rpm", type=float, default=None, help="Global budget of searches per minute")
+    parser.add_argument("--dest-rpm", type=float, default=None, help="Searches per minute per destination")
+    parser.add_argument("--dest-burst", type=int, default=1, help="Searches a destination may receive back to back")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Max random delay in seconds added before each search")
+    parser.add_argument("--metrics-jsonl", default=None, help="Append per-search stage timings and counters to this JSON lines file")
+    parser.add_argument("--metrics-prom", default=None, help="Write running metric totals to this Prometheus textfile")
+    parser.add_argument("--export", default=None, help="Export the database to a partitioned Parquet dataset in this directory (no scraping)")
+    parser.add_argument("--export-full", action="store_true", help="Export everything instead of only the searches since the last export")
+    parser.add_argument("--aggregates", action="store_true", help="Keep the price aggregate tables up to date while scraping")
+    parser.add_argument("--rebuild-aggregates", action="store_true", help="Recompute the price aggregate tables (no scraping)")
+    parser.add_argument("--lean", action="store_true",
+                        help="Start browsers with a lean profile that blocks images, fonts, ads and trackers. "
+                             "Reports the connections blocked and the bytes downloaded per search (not the bytes saved)")
+    parser.add_argument("--blocklist", default=None, help="File of extra domains/URL patterns to block with --lean")
+    parser.add_argument("--nav-timeout", type=float, default=60, help="Seconds the results page may take to load (0 disables)")
+    parser.add_argument("--scroll-deadline", type=float, default=240,
+                        help="Max seconds of scrolling per search, listings loaded so far are kept (0 disables)")
+    parser.add_argument("--search-deadline", type=float, default=420,
+                        help="Max seconds per search in the browser, stuck browsers are killed and replaced (0 disables)")
+    parser.add_argument("--discard-partial", action="store_true",
+                        help="Discard searches whose scrolling failed instead of storing the listings loaded so far")
+    parser.add_argument("--schema-mode", default="wide", choices=SCHEMA_MODES,
+                        help="Store hotels in the wide hotels table or in the normalized hotel/price_observation tables")
+    parser.add_argument("--delta", action="store_true",
+                        help="Only store hotel observations that changed since their last stored observation, "
+                             "unchanged ones are recorded in the seen_unchanged table")
     args = parser.parse_args()
+    if args.pipeline and args.workers > 1:
+        parser.error("--pipeline and --workers are mutually exclusive")
+    if args.reparse and not args.archive:
+        parser.error("--reparse requires --archive")
+
+    deadlines = Deadlines(navigate=args.nav_timeout or None, scroll=args.scroll_deadline or None,
+                          total=args.search_deadline or None)
 
-    run(args.input, args.database, args.schema)
\ No newline at end of file
+    if args.command == "plan":
+        run_plan(args.input, shard=args.shard)
+    elif args.command == "coordinator":
+        run_coordinator(args.input, args.queue, shard=args.shard)
+    elif args.command == "worker":
+        run_worker(args.queue, pool_size=args.pool_size, recycle_pages=args.recycle_pages, recycle_rss=args.recycle_rss,
+                   extraction_mode=args.extraction, prune=not args.keep_harvested, archive_path=args.archive, rpm=args.rpm,
+                   lean=args.lean, blocklist_path=args.blocklist, deadlines=deadlines, partial=not args.discard_partial,
+                   visibility_timeout=args.visibility_timeout, max_attempts=args.max_attempts, site=args.site)
+    elif args.command == "merge":
+        run_merge(args.database, args.schema, args.queue, db_profile=args.db_profile, schema_mode=args.schema_mode,
+                  update_aggregates=args.aggregates, metrics_jsonl=args.metrics_jsonl, metrics_prom=args.metrics_prom,
+                  delta=args.delta)
+    elif args.rebuild_aggregates:
+        run_rebuild_aggregates(args.database, args.schema, schema_mode=args.schema_mode, delta=args.delta)
+    elif args.export:
+        run_export(args.database, args.schema, args.export, schema_mode=args.schema_mode, full=args.export_full, delta=args.delta)
+    elif args.reparse:
+        run_reparse(args.database, args.schema, args.archive, workers=args.workers if args.workers > 1 else None,
+                    db_profile=args.db_profile, schema_mode=args.schema_mode)
+    else:
+        run(args.input, args.database, args.schema, pool_size=args.pool_size,
+            recycle_pages=args.recycle_pages, recycle_rss=args.recycle_rss, workers=args.workers,
+            extraction_mode=args.extraction, prune=not args.keep_harvested, db_profile=args.db_profile, batch_size=args.batch_size,
+            pipeline=args.pipeline, parse_workers=args.parse_workers, parse_processes=args.parse_processes,
+            archive_path=args.archive, resume=args.resume, run_id=args.run_id, rpm=args.rpm,
+            destination_rpm=args.dest_rpm, destination_burst=args.dest_burst, jitter=args.jitter,
+            metrics_jsonl=args.metrics_jsonl, metrics_prom=args.metrics_prom, schema_mode=args.schema_mode,
+            update_aggregates=args.aggregates, lean=args.lean, blocklist_path=args.blocklist,
+            deadlines=deadlines, partial=not args.discard_partial, shard=args.shard, site=args.site, delta=args.delta)
\ No newline at end of file
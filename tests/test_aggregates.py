@@ -0,0 +1,88 @@
+from datetime import datetime
+import pandas as pd
+from hotscrape import sql
+from hotscrape.aggregates import PriceAggregates, lead_bucket, price_history, cheapest_hotels, hotel_history, sale_frequency
+from hotscrape.normalize import store_hotels, create_view
+from hotscrape.store import store_results
+from tests.test_base import *
+
+
+class TestAggregates(TestBase):
+
+    def store(self, conn, aggregates, checkin, searched, schema_mode="wide"):
+        search_dict = dict(self.search_dict, checkin_datetime=checkin, search_datetime=pd.to_datetime(searched))
+        df_search, df_attributes = self.get_dfs(search_dict)
+        sql.to_sql(df_search, "search", conn)
+        store_hotels(df_attributes, conn, schema_mode=schema_mode)
+        aggregates.add(df_search)
+        return df_attributes
+
+    def test_lead_bucket(self):
+        labels, lower = lead_bucket(pd.Series([0, 1, 2, 10, 200, -1]))
+        assert list(labels) == ["0-0", "1-2", "1-2", "7-13", "180+", "0-0"]
+        assert list(lower) == [0, 1, 1, 7, 180, 0]
+
+    def test_aggregates(self, tmp_path):
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        aggregates = PriceAggregates(conn, every=2)
+        self.store(conn, aggregates, "2020-07-10", "2020-07-01 10:00")
+        # Not flushed yet
+        assert conn.execute("SELECT COUNT(*) FROM price_aggregates").scalar() == 0
+        self.store(conn, aggregates, "2020-07-10", "2020-07-02 10:00")
+        df_attributes = self.store(conn, aggregates, "2020-07-10", "2020-07-09 10:00")
+        aggregates.flush()
+
+        paid = df_attributes["price_sale"].where(df_attributes["price_sale"].notna(), df_attributes["price"])
+        history = price_history(conn, "Las Vegas")
+        assert list(history["lead_bucket"]) == ["0-0", "7-13"]
+        week = history.set_index("lead_bucket").loc["7-13"]
+        assert week["n_observations"] == 2 * len(paid)
+        assert week["n_sale"] == 2 * df_attributes["price_sale"].notna().sum()
+        assert week["price_min"] == paid.min() and week["price_max"] == paid.max()
+        assert week["price_median"] == paid.median()
+
+        cheapest = cheapest_hotels(conn, "Las Vegas", start=datetime(2020, 7, 10), end=datetime(2020, 7, 10))
+        assert list(cheapest["cheapest_name"]) == [df_attributes.loc[paid.idxmin(), "name"]]
+
+        hotel = hotel_history(conn, cheapest["cheapest_hotel_key"][0])
+        assert list(hotel["n_observations"]) == [1, 2]
+        assert list(hotel["latest_price"]) == [paid.min()] * 2
+
+        sales = sale_frequency(conn, "Las Vegas")
+        assert list(sales["lead_bucket"]) == ["0-0", "7-13"]
+
+        # Rebuilding from scratch gives the same result
+        aggregates.rebuild()
+        pd.testing.assert_frame_equal(price_history(conn, "Las Vegas"), history)
+
+    def test_normalized(self, tmp_path):
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        aggregates = PriceAggregates(conn, schema_mode="normalized")
+        create_view(conn)
+        df_attributes = self.store(conn, aggregates, "2020-07-10", "2020-07-01 10:00", schema_mode="normalized")
+        history = price_history(conn, "Las Vegas")
+        assert history["n_observations"].sum() == len(df_attributes)
+
+    def test_failed_refresh_in_batch(self, tmp_path):
+
+        # The refresh of the second checkin date fails, the searches of the batch are still stored
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        aggregates = PriceAggregates(conn)
+        compute = aggregates.compute
+
+        def failing_compute(df, city, state, country, checkin_date):
+            df_city, df_hotel = compute(df, city, state, country, checkin_date)
+            if checkin_date.day == 2:
+                df_hotel["name"] = object()
+            return df_city, df_hotel
+
+        aggregates.compute = failing_compute
+        with sql.TransactionBatch(conn, size=3) as batch:
+            for day in (1, 2, 3):
+                df_search, df_attributes = self.get_dfs(dict(self.search_dict, checkin_datetime=f"2020-07-0{day}"))
+                assert store_results(df_search, df_attributes, conn, batch=batch, aggregates=aggregates)
+        assert batch.n_lost == 0
+        assert conn.execute("SELECT COUNT(*) FROM search").scalar() == 3
+        assert conn.execute("SELECT COUNT(*) FROM hotels").scalar() == 3 * len(df_attributes)
+        days = [row[0] for row in conn.execute("SELECT DISTINCT date(checkin_date) FROM price_aggregates ORDER BY 1")]
+        assert days == ["2020-07-01", "2020-07-03"]
@@ -0,0 +1,85 @@
+import pandas as pd
+from hotscrape import sql
+from hotscrape.archive import PageArchive
+from hotscrape.reparse import reparse
+from hotscrape.delta import DeltaStore, create_delta_view
+from tests.test_base import *
+
+
+class TestArchive(TestBase):
+
+    def test_roundtrip(self, tmp_path):
+        archive = PageArchive(str(tmp_path), codec="gzip")
+        digest, codec = archive.put(self.page_html)
+        assert archive.put(self.page_html) == (digest, codec)
+        assert digest in archive
+        assert archive.get(digest, codec) == self.page_html
+
+    def test_reparse(self, tmp_path):
+        archive = PageArchive(str(tmp_path / "pages"), codec="gzip")
+        scraper = hs.HotelsScraper(pool=object(), archive=archive)
+        search_dict = scraper.ensure_search_format(dict(self.search_dict))
+        df_search, df_attributes = scraper.process(search_dict, self.page_html)
+        assert df_search["page_hash"].iloc[0] in archive
+
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        sql.to_sql(df_search, "search", conn)
+        # Simulate hotels written by an older parser version
+        df_old = df_attributes.copy()
+        df_old.index = df_old.index + 1
+        df_old["price"] = None
+        sql.to_sql(df_old, "hotels", conn)
+
+        assert reparse(conn, archive, workers=1) == (1, 0)
+        ids = sorted(row[0] for row in conn.execute("SELECT id FROM hotels"))
+        assert ids == sorted(df_attributes.index)
+        assert conn.execute("SELECT COUNT(*) FROM hotels WHERE price IS NULL").scalar() == 0
+
+    def test_reparse_bookings(self, tmp_path):
+        card = '<div class="sr_item"><span class="sr-hotel__name">{}</span>' \
+               '<div class="sr_card_address_line">Las Vegas Blvd</div><div class="bui-price-display__value">$239</div></div>'
+        pages = [f"<html><body>{card.format(name)}</body></html>" for name in ("Bellagio", "Aria")]
+        archive = PageArchive(str(tmp_path / "pages"))
+        scraper = hs.BookingsScraper(archive=archive)
+        search_dict = scraper.ensure_search_format(dict(self.search_dict))
+        df_search, df_attributes = scraper.process(search_dict, pages)
+        assert df_search["site"].iloc[0] == "bookings"
+
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        sql.to_sql(df_search, "search", conn)
+        sql.to_sql(df_attributes, "hotels", conn)
+
+        # Re-parsed with the bookings adapter, the hotels of the search are kept
+        assert reparse(conn, archive, workers=1) == (1, 0)
+        names = sorted(row[0] for row in conn.execute("SELECT name FROM hotels"))
+        assert names == ["Aria", "Bellagio"]
+
+    def test_reparse_delta(self, tmp_path):
+        archive = PageArchive(str(tmp_path / "pages"), codec="gzip")
+        scraper = hs.HotelsScraper(pool=object(), archive=archive)
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        create_delta_view(conn)
+        delta = DeltaStore(conn)
+        parsed = []
+        for day, archived in ((1, True), (2, False)):
+            search_dict = scraper.ensure_search_format(dict(self.search_dict))
+            search_dict["search_datetime"] = pd.to_datetime(f"2020-06-2{day} 10:00")
+            df_search, df_attributes = scraper.process(search_dict, self.page_html)
+            if not archived:
+                df_search["page_hash"] = None
+            # Stored by an older parser version, the second search only as unchanged markers
+            df_old = df_attributes.copy()
+            df_old.index = df_old.index + 1
+            sql.to_sql(df_search, "search", conn)
+            delta.store(df_search, df_old)
+            parsed.append(df_attributes)
+        n_hotels = len(parsed[0])
+        assert conn.execute("SELECT COUNT(*) FROM seen_unchanged").scalar() == n_hotels
+
+        assert reparse(conn, archive, workers=1) == (1, 0)
+        rows = conn.execute("SELECT search_id, id FROM hotels_expanded").fetchall()
+        assert len(rows) == 2 * n_hotels
+        # The markers of the second search point at the re-parsed observations of the first
+        for df_attributes in parsed:
+            search_id = df_attributes["search_id"].iloc[0]
+            assert sorted(obs_id for sid, obs_id in rows if sid == search_id) == sorted(parsed[0].index)
@@ -1,3 +1,4 @@
+import os
 import yaml
 import hotscrape.scraper as hs
 from hotscrape.parser import parse
@@ -26,4 +27,18 @@ class TestBase():
     with open(f"{schema_path}/db_schema.yml") as file:
         # The FullLoader parameter handles the conversion from YAML
         # scalar values to Python the dictionary format
-        schema = yaml.load(file, Loader=yaml.FullLoader)
\ No newline at end of file
+        schema = yaml.load(file, Loader=yaml.FullLoader)
+
+    data_path = os.path.join(os.path.dirname(__file__), "data")
+    with open(os.path.join(data_path, "hotels_page.html")) as file:
+        # Synthetic, handwritten results page with 3 hotel cards in the hotels.com markup
+        page_html = file.read()
+
+    def get_dfs(self, search_dict=None):
+        """
+        Runs the fixture page through the scraper post-processing (no browser needed)
+        """
+        scraper = hs.HotelsScraper(pool=object())
+        search_dict = scraper.ensure_search_format(dict(search_dict or self.search_dict))
+        res = scraper.get_attributes(self.page_html, **search_dict)
+        return scraper.get_dfs(search_dict, res)
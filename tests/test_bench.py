@@ -0,0 +1,17 @@
+from hotscrape import bench
+from tests.test_base import *
+
+
+class TestBench(TestBase):
+
+    def test_run_benchmark(self):
+        results = bench.run_benchmark(self.page_html, self.schema, listings=20, repeat=1)
+        assert results["listings"] == 20
+        # Every third card of the fixture page is fully booked and dropped
+        assert results["rows"] == 14
+        assert set(results["stages"]) == set(results["relative"]) == {"get_attributes", "parse", "to_sql"}
+
+    def test_compare(self):
+        results = {"relative": {"parse": 1.3, "to_sql": 1.0}}
+        baseline = {"relative": {"parse": 1.0, "to_sql": 1.0, "get_attributes": 1.0}}
+        assert bench.compare(results, baseline, tolerance=0.25) == [("parse", 1.3, 1.0)]
@@ -0,0 +1,78 @@
+import http.client
+from hotscrape.blocking import Blocklist, BlockingProxy, load_blocklist
+from hotscrape.standin import StandInSite
+from tests.test_base import TestBase
+
+
+class TestBlocklist():
+
+    def test_domains(self):
+        blocklist = Blocklist(["doubleclick.net", "*.png"])
+        assert blocklist.is_blocked("doubleclick.net")
+        assert blocklist.is_blocked("stats.g.doubleclick.net")
+        assert not blocklist.is_blocked("notdoubleclick.net")
+        assert not blocklist.is_blocked("hotels.com")
+
+    def test_patterns(self):
+        blocklist = Blocklist(["*.png", "*/ads/*"])
+        assert blocklist.is_blocked("hotels.com", "http://hotels.com/img/logo.png")
+        assert blocklist.is_blocked("hotels.com", "http://hotels.com/ads/banner.js")
+        assert not blocklist.is_blocked("hotels.com", "http://hotels.com/search.do?q=png")
+        # Tunnelled requests only expose their host
+        assert not blocklist.is_blocked("hotels.com")
+
+    def test_load(self, tmp_path):
+        path = tmp_path / "blocklist.txt"
+        path.write_text("# trackers\nexample-ads.com\n\n*.gif  # images\n")
+        assert load_blocklist(path) == ("example-ads.com", "*.gif")
+
+
+class TestBlockingProxy(TestBase):
+
+    def test_forward_and_block(self):
+        site = StandInSite(self.page_html, total=7, page_size=3, loader_delay=0)
+        with site.serve() as server, BlockingProxy(["*/listings*"]) as proxy:
+            conn = http.client.HTTPConnection(*proxy.address)
+            conn.request("GET", f"{server.url}/search.do?q-destination=x")
+            res = conn.getresponse()
+            body = res.read()
+            assert res.status == 200
+            assert b"Bellagio 0" in body
+
+            conn = http.client.HTTPConnection(*proxy.address)
+            conn.request("GET", f"{server.url}/listings?offset=3&limit=3")
+            res = conn.getresponse()
+            res.read()
+            assert res.status == 403
+
+            assert proxy.stats() == {"connections": 2, "blocked": 1, "bytes": len(body)}
+        assert site.requests == 1
+
+    def test_tunnel(self):
+        site = StandInSite(self.page_html, total=7, page_size=3, loader_delay=0)
+        with site.serve() as server, BlockingProxy(["blocked.invalid"]) as proxy:
+            host, port = server.httpd.server_address[:2]
+            conn = http.client.HTTPConnection(*proxy.address)
+            conn.set_tunnel(host, port)
+            conn.request("GET", "/listings?offset=0&limit=3")
+            res = conn.getresponse()
+            body = res.read()
+            assert res.status == 200
+            assert b"Bellagio 0" in body
+            conn.close()
+
+            conn = http.client.HTTPConnection(*proxy.address)
+            conn.set_tunnel("ads.blocked.invalid", 443)
+            try:
+                conn.request("GET", "/")
+                refused = False
+            except OSError as error:
+                refused = "403" in str(error)
+            assert refused
+
+            stats = proxy.stats()
+            # Tunnels, not the requests sent through them
+            assert stats["connections"] == 2
+            assert stats["blocked"] == 1
+            # Response headers and body of the tunnelled request
+            assert stats["bytes"] > len(body)
@@ -0,0 +1,59 @@
+from hotscrape import sql
+from hotscrape.checkpoint import RunCheckpoint, search_key
+from hotscrape.search_parser import Search
+from tests.test_base import *
+
+
+class TestCheckpoint(TestBase):
+
+    config = {"city": "Las Vegas", "state": "Nevada", "country": "United States of America",
+              "checkin_datetime": "None", "price_min": "0", "price_max": "10000", "adults": "2",
+              "currency": "USD", "search_span": "3"}
+
+    def test_search_key(self):
+        search = next(Search.generate(self.config))
+        search_dict = search.to_dict()
+        key = search_key(search_dict)
+        # Same key for the flat record stored in the `search` table
+        df_search, _ = self.get_dfs(dict(search_dict))
+        assert search_key(df_search.iloc[0].to_dict()) == key
+        assert search_key(dict(search_dict, adults=3)) != key
+
+    def test_resume(self, tmp_path):
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        search_list = [self.config]
+
+        checkpoint = RunCheckpoint.start(conn, search_list)
+        searches = [s.to_dict() for s in Search.generate(self.config, start=checkpoint.started_at)]
+        df_search, _ = self.get_dfs(dict(searches[0]))
+        checkpoint.mark_results(df_search)
+
+        resumed = RunCheckpoint.start(conn, search_list, resume=True)
+        assert resumed.run_id == checkpoint.run_id
+        assert resumed.started_at == checkpoint.started_at
+        searches = [s.to_dict() for s in Search.generate(self.config, start=resumed.started_at)]
+        pending = list(resumed.pending(searches))
+        assert [s["checkin_datetime"] for s in pending] == [s["checkin_datetime"] for s in searches[1:]]
+
+        # Without --resume a new run starts from scratch
+        fresh = RunCheckpoint.start(conn, search_list)
+        assert fresh.run_id != checkpoint.run_id
+        assert len(list(fresh.pending(searches))) == 3
+
+    def test_partial(self, tmp_path):
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        search_list = [self.config]
+
+        checkpoint = RunCheckpoint.start(conn, search_list)
+        searches = [s.to_dict() for s in Search.generate(self.config, start=checkpoint.started_at)]
+        df_search, _ = self.get_dfs(dict(searches[0], result_offset=40, n_listings=25, complete=0,
+                                         incomplete_reason="scroll_error"))
+        checkpoint.mark_results(df_search)
+
+        resumed = RunCheckpoint.start(conn, search_list, resume=True)
+        searches = [s.to_dict() for s in Search.generate(self.config, start=resumed.started_at)]
+        pending = list(resumed.pending(searches))
+        # Incomplete searches are retried from the first missing listing
+        assert len(pending) == 3
+        assert pending[0]["result_offset"] == 65
+        assert "result_offset" not in pending[1]
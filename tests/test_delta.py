@@ -0,0 +1,106 @@
+import pandas as pd
+import pytest
+from hotscrape import sql
+from hotscrape.aggregates import PriceAggregates, price_history
+from hotscrape.delta import DeltaStore, create_delta_view, observation_table
+from hotscrape.normalize import store_hotels
+from hotscrape.migrate import migrate
+from tests.test_base import *
+
+
+class TestDelta(TestBase):
+
+    def search(self, searched, checkin="2020-07-10", price_change=None):
+        search_dict = dict(self.search_dict, checkin_datetime=checkin, search_datetime=pd.to_datetime(searched))
+        df_search, df_attributes = self.get_dfs(search_dict)
+        if price_change is not None:
+            # The first listing changed its price
+            df_attributes.iloc[0, df_attributes.columns.get_loc("price")] += price_change
+        return df_search, df_attributes
+
+    def store(self, conn, delta, df_search, df_attributes):
+        sql.to_sql(df_search, "search", conn)
+        return delta.store(df_search, df_attributes)
+
+    @pytest.mark.parametrize("schema_mode", ["wide", "normalized"])
+    def test_changed_only(self, tmp_path, schema_mode):
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        create_delta_view(conn, schema_mode)
+        table = "hotels" if schema_mode == "wide" else "price_observation"
+        delta = DeltaStore(conn, schema_mode=schema_mode)
+
+        df_search, df_attributes = self.search("2020-07-01 10:00")
+        n_hotels = len(df_attributes)
+        assert self.store(conn, delta, df_search, df_attributes) == (n_hotels, 0, 0)
+
+        # Same prices the next day: markers only
+        df_search, df_attributes = self.search("2020-07-02 10:00")
+        assert self.store(conn, delta, df_search, df_attributes) == (0, 0, n_hotels)
+
+        # One price changed
+        df_search, df_attributes = self.search("2020-07-03 10:00", price_change=10)
+        assert self.store(conn, delta, df_search, df_attributes) == (1, 0, n_hotels - 1)
+        # Storing the same search again (e.g. merged twice) adds nothing
+        assert delta.store(df_search, df_attributes) == (0, 0, n_hotels - 1)
+
+        # Another checkin date is another offer
+        df_search, df_attributes = self.search("2020-07-03 10:00", checkin="2020-07-11")
+        assert self.store(conn, delta, df_search, df_attributes) == (n_hotels, 0, 0)
+
+        assert conn.execute(f"SELECT COUNT(*) FROM {table}").scalar() == 2 * n_hotels + 1
+        assert conn.execute("SELECT COUNT(*) FROM seen_unchanged").scalar() == 2 * n_hotels - 1
+
+        # The view rebuilds every observation with the values seen by its search
+        view = observation_table(schema_mode, delta=True)
+        rows = conn.execute(f"SELECT search_id, name, price FROM {view} ORDER BY search_id, name").fetchall()
+        assert len(rows) == 4 * n_hotels
+        expected = self.search("2020-07-03 10:00", price_change=10)[1]
+        stored = pd.DataFrame.from_records(
+            [row for row in rows if row[0] == expected["search_id"].iloc[0]], columns=["search_id", "name", "price"])
+        assert sorted(stored["price"].dropna()) == sorted(expected["price"].dropna())
+
+    def test_index_loaded(self, tmp_path):
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        df_search, df_attributes = self.search("2020-07-01 10:00")
+        self.store(conn, DeltaStore(conn), df_search, df_attributes)
+
+        # A new run rebuilds the index from the database
+        delta = DeltaStore(conn)
+        df_search, df_attributes = self.search("2020-07-02 10:00", price_change=5)
+        assert self.store(conn, delta, df_search, df_attributes) == (1, 0, len(df_attributes) - 1)
+        assert len(delta.index[("Las Vegas", "Nevada", "United States of America")]) == len(df_attributes)
+
+    def test_aggregates(self, tmp_path):
+        # Aggregates over the delta view match those of a full store
+        results = {}
+        for delta_mode in (False, True):
+            conn = sql.create_database(str(tmp_path / f"test_sql_{delta_mode}"), self.schema)
+            create_delta_view(conn)
+            aggregates = PriceAggregates(conn, delta=delta_mode)
+            delta = DeltaStore(conn)
+            for day, change in (("2020-07-01", None), ("2020-07-02", None), ("2020-07-09", 20)):
+                df_search, df_attributes = self.search(f"{day} 10:00", price_change=change)
+                sql.to_sql(df_search, "search", conn)
+                if delta_mode:
+                    delta.store(df_search, df_attributes)
+                else:
+                    store_hotels(df_attributes, conn)
+                aggregates.add(df_search)
+            results[delta_mode] = price_history(conn, "Las Vegas")
+        pd.testing.assert_frame_equal(results[True], results[False])
+
+    def test_migrate(self, tmp_path):
+        # The normalized delta view of a migrated database has the observations of the wide one
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        delta = DeltaStore(conn)
+        for day, change in (("2020-07-01", None), ("2020-07-02", None), ("2020-07-03", 10)):
+            self.store(conn, delta, *self.search(f"{day} 10:00", price_change=change))
+        create_delta_view(conn, "wide")
+        query = "SELECT search_id, name, price FROM {} ORDER BY search_id, name"
+        wide = conn.execute(query.format(observation_table("wide", delta=True))).fetchall()
+
+        migrate(conn, chunksize=2)
+        create_delta_view(conn, "normalized")
+        assert conn.execute(query.format(observation_table("normalized", delta=True))).fetchall() == wide
+        # The wide view is unchanged
+        assert conn.execute(query.format(observation_table("wide", delta=True))).fetchall() == wide
@@ -0,0 +1,77 @@
+import threading
+from hotscrape.driver_pool import DriverPool
+
+
+class FakeDriver():
+
+    def __init__(self):
+        self.alive = True
+        self.quit_called = False
+        self.cookies_cleared = 0
+        self.capabilities = {}
+
+    def execute_script(self, script):
+        if not self.alive:
+            raise RuntimeError("dead")
+        return 1
+
+    def delete_all_cookies(self):
+        self.cookies_cleared += 1
+
+    def get(self, url):
+        pass
+
+    def quit(self):
+        self.quit_called = True
+
+
+class TestDriverPool():
+
+    def test_reuse_and_reset(self):
+        pool = DriverPool(size=1, max_pages=10, driver_factory=FakeDriver)
+        with pool.driver() as d1:
+            pass
+        with pool.driver() as d2:
+            pass
+        assert d1 is d2
+        assert d1.cookies_cleared == 2
+        pool.close()
+        assert d1.quit_called
+
+    def test_recycle_after_max_pages(self):
+        pool = DriverPool(size=1, max_pages=2, driver_factory=FakeDriver)
+        drivers = []
+        for _ in range(3):
+            with pool.driver() as d:
+                drivers.append(d)
+        assert drivers[0] is drivers[1]
+        assert drivers[2] is not drivers[0]
+        assert drivers[0].quit_called
+        pool.close()
+
+    def test_unhealthy_driver_replaced(self):
+        pool = DriverPool(size=1, driver_factory=FakeDriver)
+        with pool.driver() as d1:
+            pass
+        d1.alive = False
+        with pool.driver() as d2:
+            pass
+        assert d2 is not d1
+        assert d1.quit_called
+        pool.close()
+
+    def test_waiter_woken_by_discard(self):
+        # A search waiting for the only browser starts a new one once that browser is quit
+        pool = DriverPool(size=1, driver_factory=FakeDriver)
+        pooled = pool.acquire()
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+        waiter.start()
+        waiter.join(0.1)
+        assert not acquired
+        pool.release(pooled, broken=True)
+        waiter.join(5)
+        assert len(acquired) == 1 and acquired[0] is not pooled
+        assert pooled.driver.quit_called
+        pool.release(acquired[0])
+        pool.close()
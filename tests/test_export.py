@@ -0,0 +1,58 @@
+import os
+import json
+import pytest
+from hotscrape import sql
+from hotscrape.export import export, WATERMARK_FILE
+from hotscrape.normalize import store_hotels
+from tests.test_base import *
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+class TestExport(TestBase):
+
+    def store(self, conn, city, day, schema_mode="wide"):
+        search_dict = dict(self.search_dict, checkin_datetime=day,
+                           destination=dict(self.search_dict["destination"], city=city))
+        df_search, df_attributes = self.get_dfs(search_dict)
+        sql.to_sql(df_search, "search", conn)
+        store_hotels(df_attributes, conn, schema_mode=schema_mode)
+        return len(df_attributes)
+
+    def test_export(self, tmp_path):
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        out_dir = str(tmp_path / "export")
+        n_rows = self.store(conn, "Las Vegas", "2020-06-30") + self.store(conn, "Reno", "2020-07-01")
+
+        assert export(conn, self.schema, out_dir, chunksize=1) == n_rows
+        assert sorted(os.listdir(os.path.join(out_dir, "city=Reno"))) == ["checkin_month=2020-07"]
+
+        table = pq.read_table(out_dir)
+        assert table.num_rows == n_rows
+        assert sorted(set(table.column("city").to_pylist())) == ["Las Vegas", "Reno"]
+        assert str(table.schema.field("price").type) == "double"
+        assert str(table.schema.field("checkin_datetime").type).startswith("timestamp")
+        assert str(table.schema.field("num_reviews").type) == "int64"
+        assert "search_distance_centre" in table.schema.names
+
+        # String columns are dictionary encoded
+        path = os.path.join(out_dir, "city=Reno", "checkin_month=2020-07")
+        metadata = pq.ParquetFile(os.path.join(path, os.listdir(path)[0])).metadata
+        names = [metadata.schema.column(i).name for i in range(metadata.num_columns)]
+        assert "RLE_DICTIONARY" in metadata.row_group(0).column(names.index("name")).encodings
+
+        # Incremental export only appends searches made after the watermark
+        assert export(conn, self.schema, out_dir) == 0
+        n_new = self.store(conn, "Reno", "2020-07-02")
+        assert export(conn, self.schema, out_dir) == n_new
+        assert pq.read_table(out_dir).num_rows == n_rows + n_new
+        with open(os.path.join(out_dir, WATERMARK_FILE)) as file:
+            assert json.load(file)["search_datetime"] is not None
+
+    def test_export_normalized(self, tmp_path):
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        n_rows = self.store(conn, "Las Vegas", "2020-06-30", schema_mode="normalized")
+        out_dir = str(tmp_path / "export")
+        assert export(conn, self.schema, out_dir, schema_mode="normalized") == n_rows
+        table = pq.read_table(out_dir)
+        assert {"hotel_key", "name", "price"} <= set(table.schema.names)
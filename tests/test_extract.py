@@ -0,0 +1,83 @@
+from hotscrape.scraper import HotelsScraper
+from hotscrape.extract import class_predicate, HARVEST_JS
+from hotscrape.scroll import ScrollResult
+from tests.test_base import *
+
+
+class TestExtract(TestBase):
+
+    def test_class_predicate(self):
+        assert class_predicate("p-name") == "contains(concat(' ', normalize-space(@class), ' '), ' p-name ')"
+        assert class_predicate("details resp-module") == "normalize-space(@class) = 'details resp-module'"
+
+    def test_cards_aligned(self):
+        res = HotelsScraper.extractor.extract(self.page_html)
+        assert res["name"] == ["Bellagio", "Circus Circus", "Desert Motel"]
+        assert all(len(val) == 3 for val in res.values())
+        # Second hotel has no amenities, third no reviews
+        assert res["amenities"][0] == "Free WiFiPool"
+        assert res["amenities"][1] is None
+        assert res["amenities"][2] == "Parking"
+        assert res["rating"] == ["9.2 Wonderful", "7.4 Good", None]
+        assert res["num_reviews"][2] is None
+        assert res["price"][0] == "$289 $239"
+
+    def test_get_dfs(self):
+        hs = HotelsScraper(pool=object())
+        search_dict = hs.ensure_search_format(dict(self.search_dict))
+        res = hs.get_attributes(self.page_html, **search_dict)
+        df_search, df_attributes = hs.get_dfs(search_dict, res)
+        assert df_search.shape[0] == 1
+        # Fully booked hotel is dropped
+        assert sorted(df_attributes["name"]) == ["Bellagio", "Circus Circus"]
+        assert df_attributes["price_sale"].dropna().to_list() == [239]
+
+    def test_js_mode(self):
+        extractor = HotelsScraper.extractor
+        spec = extractor.js_spec()
+        assert spec["card"] == {"tag": "li", "mode": "token", "value": "hotel"}
+        assert spec["fields"][list(extractor.fields).index("rating")]["mode"] == "regex"
+
+        # Rows as returned by the in-browser script, a card without a name is skipped
+        expected = extractor.extract(self.page_html)
+        rows = [[expected[key][i] for key in extractor.fields] for i in range(3)]
+        rows.append([None] * len(extractor.fields))
+        assert extractor.rows_to_dict(rows) == expected
+
+        hs = HotelsScraper(pool=object(), extraction_mode="js")
+        assert hs.get_attributes(expected) is expected
+
+    def test_stream_mode(self):
+        hs = HotelsScraper(pool=object(), extraction_mode="stream")
+        # Field values in `feature_html_details` order, a card without a name is skipped
+        batches = [[["Bellagio", None, None, None, None, None, None, None, "$100", None]],
+                   [["Circus Circus", None, None, None, None, None, None, None, "$50", None], [None] * 10],
+                   []]
+
+        class FakeDriver():
+            def set_page_load_timeout(self, seconds):
+                pass
+
+            def get(self, url):
+                pass
+
+            def execute_script(self, script, *args):
+                if script == HARVEST_JS:
+                    assert args[1] is True
+                    return batches.pop(0)
+                raise AssertionError("Unexpected script")
+
+        class FakeEngine():
+            listing_selector = "h3.p-name"
+
+            def scroll(self, driver, max_scrolls=35, on_batch=None, deadline=None):
+                on_batch(driver)
+                on_batch(driver)
+                return ScrollResult(1, 2, "end_of_results")
+
+        hs.scroll_engine = FakeEngine()
+        res = hs.get_hotels_page("http://localhost", FakeDriver())
+        assert res["name"] == ["Bellagio", "Circus Circus"]
+        assert res["price"] == ["$100", "$50"]
+        # The final harvest after scrolling was done as well
+        assert batches == []
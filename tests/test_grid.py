@@ -0,0 +1,73 @@
+import threading
+import pandas as pd
+import pytest
+from datetime import datetime
+from hotscrape.grid import SearchGrid, Shard
+from hotscrape.search_parser import Search
+
+
+class TestSearchGrid():
+
+    config = {"city": "Las Vegas", "state": "Nevada", "country": "United States of America",
+              "checkin_datetime": "2020-07-01", "price_min": "0", "price_max": "10000", "adults": "1,2",
+              "nights": "1,3", "price_bands": "0-150,150-10000", "currency": "USD", "search_span": "5"}
+
+    def test_expansion(self):
+        grid = SearchGrid([self.config])
+        assert grid.size() == len(grid) == 5 * 2 * 2 * 2
+        searches = list(grid)
+        assert len(searches) == 40
+        first = searches[0]
+        assert first["checkin_datetime"] == pd.Timestamp("2020-07-01")
+        assert first["checkout_datetime"] == pd.Timestamp("2020-07-02")
+        assert (first["adults"], first["price_min"], first["price_max"]) == (1, 0, 150)
+        assert {s["checkout_datetime"] - s["checkin_datetime"] for s in searches} == {pd.Timedelta(days=1), pd.Timedelta(days=3)}
+        assert {(s["price_min"], s["price_max"]) for s in searches} == {(0, 150), (150, 10000)}
+        assert searches[-1]["checkin_datetime"] == pd.Timestamp("2020-07-05")
+
+    def test_single_values(self):
+        # Sections without lists give the same plan as Search.generate
+        config = dict(self.config, adults="2", nights="1")
+        del config["price_bands"]
+        start = datetime(2020, 6, 1)
+        expected = [s.to_dict() for s in Search.generate(config, start=start)]
+        assert list(SearchGrid([config], start=start)) == expected
+
+    def test_shards(self):
+        keys = lambda grid: [(s["checkin_datetime"], s["checkout_datetime"], s["adults"], s["price_min"]) for s in grid]
+        shards = [SearchGrid([self.config], shard=Shard(i, 3)) for i in range(3)]
+        sliced = [keys(grid) for grid in shards]
+        assert [len(grid) for grid in shards] == [len(s) for s in sliced]
+        assert sorted(sum(sliced, [])) == sorted(keys(SearchGrid([self.config])))
+        assert all(sliced)
+
+    def test_shards_stable(self):
+        # Unaffected by the start date and the order of config sections
+        config = dict(self.config, checkin_datetime="None")
+        other = dict(config, city="Reno")
+        days = lambda grid: [(s["destination"]["city"], s["adults"]) for s in grid]
+        first = SearchGrid([config, other], start=datetime(2020, 6, 1), shard=Shard(1, 4))
+        later = SearchGrid([other, config], start=datetime(2020, 6, 2), shard=Shard(1, 4))
+        assert sorted(days(first)) == sorted(days(later))
+
+    def test_parse_shard(self):
+        shard = Shard.parse("2/4")
+        assert (shard.index, shard.count) == (2, 4)
+        for spec in ("4/4", "2", "-1/4"):
+            with pytest.raises(ValueError):
+                Shard.parse(spec)
+
+    def test_concurrent_generation(self):
+        # No shared counter: plans generated in parallel threads are identical
+        results = []
+        start = datetime(2020, 6, 1)
+
+        def generate():
+            results.append([s["checkin_datetime"] for s in SearchGrid([self.config], start=start)])
+
+        threads = [threading.Thread(target=generate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert all(result == results[0] for result in results)
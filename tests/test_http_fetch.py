@@ -0,0 +1,102 @@
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from hotscrape.http_fetch import HttpSession
+from hotscrape.standin import StandInSite
+from tests.test_base import TestBase
+
+
+class TestHttpSession(TestBase):
+
+    def test_keep_alive(self):
+        site = StandInSite(self.page_html, total=7, page_size=3, paginate=True)
+        with site.serve() as server, HttpSession() as session:
+            for start in (0, 3, 6):
+                res = session.get(f"{server.url}/search.do?start-index={start}")
+                assert res.ok
+                assert f"Bellagio {start}" in res.text
+            missing = session.get(f"{server.url}/missing")
+            assert missing.status == 404 and not missing.ok
+            stats = session.stats()
+        assert stats["requests"] == 4
+        assert stats["connections"] == 1
+
+    def test_max_connections(self):
+        site = StandInSite(self.page_html, total=7, page_size=3, paginate=True, page_delay=0.05)
+        with site.serve() as server, HttpSession(max_connections=2) as session:
+            threads = [threading.Thread(target=session.get, args=(f"{server.url}/search.do",)) for _ in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            stats = session.stats()
+        assert stats["requests"] == 6
+        assert stats["connections"] == 2
+        assert site.max_active == 2
+
+    def test_stale_connection(self):
+
+        class Handler(BaseHTTPRequestHandler):
+            # Announces keep-alive, but drops every connection after the response
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"ok")
+                self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        url = "http://%s:%d/" % httpd.server_address[:2]
+        try:
+            with HttpSession() as session:
+                assert session.get(url).text == "ok"
+                # Retried on a new connection
+                assert session.get(url).text == "ok"
+                stats = session.stats()
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+        assert stats["requests"] == 2
+        assert stats["connections"] == 2
+
+    def test_redirects(self):
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if self.path == "/page":
+                    self.send_response(200)
+                    self.send_header("Content-Length", "2")
+                    self.end_headers()
+                    self.wfile.write(b"ok")
+                    return
+                self.send_response(302)
+                self.send_header("Location", "/page" if self.path == "/moved" else self.path)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        url = "http://%s:%d" % httpd.server_address[:2]
+        try:
+            with HttpSession(max_redirects=3) as session:
+                res = session.get(f"{url}/moved")
+                assert res.ok and res.text == "ok"
+                assert res.url == f"{url}/page"
+                # A redirect loop stops at the hop limit and is not a successful fetch
+                looping = session.get(f"{url}/loop")
+                assert looping.status == 302 and not looping.ok
+                stats = session.stats()
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+        assert stats["requests"] == 2 + 4
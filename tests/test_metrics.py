@@ -0,0 +1,44 @@
+import json
+from hotscrape import sql
+from hotscrape.metrics import SearchMetrics, MetricsRecorder
+from tests.test_base import *
+
+
+class TestMetrics(TestBase):
+
+    def test_search_metrics(self):
+        metrics = SearchMetrics()
+        scraper = hs.HotelsScraper(pool=object())
+        search_dict = scraper.ensure_search_format(dict(self.search_dict))
+        df_search, df_attributes = scraper.process(search_dict, self.page_html, metrics=metrics)
+        assert {"extract", "parse", "hash"} <= set(metrics.timings)
+        assert metrics.counters["rows"] == len(df_attributes)
+        assert metrics.to_record()["parse_s"] == metrics.timings["parse"]
+
+    def test_recorder(self, tmp_path):
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        recorder = MetricsRecorder(run_id="run", jsonl_path=str(tmp_path / "metrics.jsonl"),
+                                   prom_path=str(tmp_path / "metrics.prom"))
+        for search_id in (1, 2):
+            metrics = SearchMetrics()
+            metrics.timings["scroll"] = 1.5
+            metrics.set("listings", 50)
+            metrics.set("rss_mb", 400.0 + search_id)
+            metrics.count("custom")
+            recorder.record(conn, search_id, metrics)
+        recorder.close()
+
+        rows = conn.execute("SELECT id, run_id, scroll_s, listings, rss_mb FROM search_metrics ORDER BY id").fetchall()
+        assert [tuple(row) for row in rows] == [(1, "run", 1.5, 50, 401.0), (2, "run", 1.5, 50, 402.0)]
+
+        with open(tmp_path / "metrics.jsonl") as file:
+            lines = [json.loads(line) for line in file]
+        assert [line["search_id"] for line in lines] == [1, 2]
+        assert lines[0]["custom"] == 1
+
+        with open(tmp_path / "metrics.prom") as file:
+            text = file.read()
+        assert 'hotscrape_stage_seconds_sum{stage="scroll"} 3.000000' in text
+        assert "hotscrape_searches_total 2" in text
+        assert "hotscrape_listings_total 100" in text
+        assert "hotscrape_rss_mb 402.0" in text
@@ -0,0 +1,59 @@
+import pytest
+from hotscrape import sql
+from hotscrape.normalize import split_hotels, store_hotels, VIEW_NAME
+from hotscrape.migrate import migrate
+from tests.test_base import *
+
+
+class TestNormalize(TestBase):
+
+    def test_split_hotels(self):
+        _, df_attributes = self.get_dfs()
+        df_hotel, df_observation = split_hotels(df_attributes)
+        assert len(df_hotel) == len(df_observation) == len(df_attributes)
+        assert set(df_observation["hotel_key"]) == set(df_hotel.index)
+        assert "price" not in df_hotel.columns and "name" not in df_observation.columns
+
+        # The hotel key only depends on name and address
+        _, df_later = self.get_dfs(dict(self.search_dict, checkin_datetime="2020-07-01"))
+        df_hotel_later, df_observation_later = split_hotels(df_later)
+        assert list(df_hotel_later.index) == list(df_hotel.index)
+        assert not set(df_observation_later.index) & set(df_observation.index)
+
+    def test_store_hotels(self, tmp_path):
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        for day in range(1, 4):
+            df_search, df_attributes = self.get_dfs(dict(self.search_dict, checkin_datetime=f"2020-07-0{day}"))
+            sql.to_sql(df_search, "search", conn)
+            assert store_hotels(df_attributes, conn, schema_mode="normalized") == (len(df_attributes), 0)
+        assert conn.execute("SELECT COUNT(*) FROM hotel").scalar() == len(df_attributes)
+        assert conn.execute("SELECT COUNT(*) FROM price_observation").scalar() == 3 * len(df_attributes)
+        assert conn.execute("SELECT COUNT(*) FROM hotels").scalar() == 0
+
+    def test_migrate(self, tmp_path):
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        for day in range(1, 4):
+            df_search, df_attributes = self.get_dfs(dict(self.search_dict, checkin_datetime=f"2020-07-0{day}"))
+            sql.to_sql(df_search, "search", conn)
+            sql.to_sql(df_attributes, "hotels", conn)
+        columns = "search_id, name, address, price, price_metadata, rating, rating_sentiment, num_reviews"
+        wide = conn.execute(f"SELECT {columns} FROM hotels ORDER BY search_id, name").fetchall()
+
+        # Small chunks to exercise the pagination, running twice must not duplicate anything
+        assert migrate(conn, chunksize=2) == (len(df_attributes), 3 * len(df_attributes))
+        assert migrate(conn, chunksize=2, drop=True, vacuum=True) == (len(df_attributes), 3 * len(df_attributes))
+
+        normalized = conn.execute(f"SELECT {columns} FROM {VIEW_NAME} ORDER BY search_id, name").fetchall()
+        assert [tuple(row) for row in normalized] == [tuple(row) for row in wide]
+        assert conn.execute("SELECT COUNT(*) FROM hotels").scalar() == 0
+
+    def test_migrate_drop_refused(self, tmp_path):
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        df_search, df_attributes = self.get_dfs()
+        sql.to_sql(df_search, "search", conn)
+        sql.to_sql(df_attributes, "hotels", conn)
+        # A column of the wide table without a counterpart in the normalized tables
+        conn.execute("ALTER TABLE hotels ADD COLUMN badge VARCHAR")
+        with pytest.raises(ValueError, match="badge"):
+            migrate(conn, drop=True)
+        assert conn.execute("SELECT COUNT(*) FROM hotels").scalar() == len(df_attributes)
@@ -0,0 +1,44 @@
+import pandas as pd
+from hotscrape import parser
+from hotscrape.scraper import HotelsScraper
+from tests.test_base import *
+
+
+def parse_rowwise(df):
+    """
+    Reference implementation: the original row-level parsing loop
+    """
+    df["price_metadata"] = df["price"]
+    rows = list(df.iterrows())
+    df["price"] = [parser.parse_price(row) for row in rows]
+    df["price_sale"] = [parser.parse_price(row, sale=True) for row in rows]
+    df["star_rating"] = [parser.parse_star_rating(row) for row in rows]
+    df["num_reviews"] = [parser.parse_num_reviews(row) for row in rows]
+    df["rating"] = [parser.parse_rating(row) for row in rows]
+    df["rating_sentiment"] = [parser.parse_rating(row, sentiment=True) for row in rows]
+    df["distance_centre"] = [parser.parse_landmarks(row) for row in rows]
+    return parser.drop_fully_booked(df)
+
+
+class TestParser(TestBase):
+
+    attributes = {
+        "name": ["a", "b", "c", "d", "e", "f", "g"],
+        "price": ["$289 $239", "$45", "Fully booked", "\n$1,299\nWas $1,499 now $999", None, "$10", "$0 $5 $7"],
+        "star_rating": ["5-star", "3-star", "2.5-star", "4.0-star", None, "1-star", "3.5-star"],
+        "num_reviews": ["(4,512 reviews)", "(981 reviews)", "", None, "(3 reviews)", "no reviews", "(1 review)"],
+        "rating": ["9.2 Wonderful", "7.4 Good", "", None, "Exceptional 10", "-1.5", "8 Very good "],
+        "landmarks": ["0.9 miles to City center1.1 miles to Las Vegas Strip", "1 mile to City center", "Downtown",
+                      None, "Downtown 2 miles to City center", "12.5 miles to City center", " 3 mile to City centerX"],
+    }
+
+    def test_equivalence(self):
+        expected = parse_rowwise(pd.DataFrame(self.attributes))
+        result = parser.parse(pd.DataFrame(self.attributes))
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_equivalence_page(self):
+        res = HotelsScraper.extractor.extract(self.page_html)
+        expected = parse_rowwise(pd.DataFrame(res))
+        result = parser.parse(pd.DataFrame(res))
+        pd.testing.assert_frame_equal(result, expected)
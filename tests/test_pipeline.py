@@ -0,0 +1,72 @@
+import pytest
+from hotscrape import sql
+from hotscrape import pipeline
+from hotscrape.pipeline import Pipeline
+from hotscrape.checkpoint import RunCheckpoint
+from hotscrape.metrics import MetricsRecorder
+from hotscrape.watchdog import SearchTimeout
+from tests.test_base import *
+
+
+class RecordedScraper(hs.HotelsScraper):
+    """
+    Serves the fixture page instead of driving a browser
+    """
+
+    def fetch(self, search, metrics=None):
+        if search["destination"]["city"] == "Nowhere":
+            raise RuntimeError("Navigation failed")
+        if search["destination"]["city"] == "Slowtown":
+            raise SearchTimeout("total_deadline")
+        search_dict = self.ensure_search_format(search)
+        return search_dict, TestBase.page_html
+
+
+class TestPipeline(TestBase):
+
+    def searches(self):
+        for day in range(1, 6):
+            search = dict(self.search_dict, checkin_datetime=f"2020-07-0{day}")
+            if day == 3:
+                search["destination"] = dict(search["destination"], city="Nowhere")
+            yield search
+
+    def run_pipeline(self, tmp_path, **kwargs):
+        path = str(tmp_path / "test_sql")
+        n_failed = Pipeline(RecordedScraper(), path, self.schema, queue_size=1, batch_size=2, **kwargs).run(self.searches())
+        conn = sql.create_connection(path)
+        return n_failed, conn
+
+    def test_threads(self, tmp_path):
+        n_failed, conn = self.run_pipeline(tmp_path, parse_workers=2, recorder=MetricsRecorder(run_id="test"))
+        assert n_failed == 1
+        assert conn.execute("SELECT COUNT(*) FROM search").scalar() == 4
+        assert conn.execute("SELECT COUNT(*) FROM hotels").scalar() == 8
+        assert conn.execute("SELECT COUNT(*) FROM search_metrics WHERE run_id = 'test' AND rows_inserted = 2").scalar() == 4
+
+    def test_processes(self, tmp_path):
+        n_failed, conn = self.run_pipeline(tmp_path, parse_workers=2, use_processes=True)
+        assert n_failed == 1
+        assert conn.execute("SELECT COUNT(*) FROM hotels").scalar() == 8
+
+    def test_timeout_checkpointed(self, tmp_path):
+        path = str(tmp_path / "test_sql")
+        searches = list(self.searches())
+        searches[1]["destination"] = dict(searches[1]["destination"], city="Slowtown")
+        conn = sql.create_database(path, self.schema)
+        checkpoint = RunCheckpoint.start(conn, [{"city": "Las Vegas"}])
+        n_failed = Pipeline(RecordedScraper(), path, self.schema, queue_size=1, run_id=checkpoint.run_id).run(searches)
+        assert n_failed == 2
+        statuses = [row[0] for row in conn.execute("SELECT status FROM checkpoints ORDER BY status")]
+        assert statuses == ["done"] * 3 + ["total_deadline"]
+
+    def test_writer_failure(self, tmp_path, monkeypatch):
+        # The writer dies before storing anything, upstream stages still finish and the error is raised
+        def failing_delta_store(*args, **kwargs):
+            raise RuntimeError("cannot store")
+
+        monkeypatch.setattr(pipeline, "DeltaStore", failing_delta_store)
+        run = Pipeline(RecordedScraper(), str(tmp_path / "test_sql"), self.schema, queue_size=1, delta=True)
+        with pytest.raises(RuntimeError, match="cannot store"):
+            run.run(self.searches())
+        assert run.n_written == 0 and run.n_failed == 5
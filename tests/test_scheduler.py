@@ -0,0 +1,68 @@
+import random
+from hotscrape.scheduler import SearchScheduler, TokenBucket
+
+
+class FakeClock():
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def make_search(city, day):
+    return {"destination": {"city": city, "state": "", "country": ""}, "checkin_datetime": f"2020-07-{day:02d}"}
+
+
+class TestScheduler():
+
+    def test_token_bucket(self):
+        clock = FakeClock()
+        bucket = TokenBucket(60, burst=2, clock=clock)
+        bucket.take()
+        bucket.take()
+        assert bucket.delay() == 1
+        clock.sleep(0.5)
+        assert bucket.delay() == 0.5
+
+    def test_lead_time_priority(self):
+        searches = [make_search("a", day) for day in (1, 2, 3)] + [make_search("b", day) for day in (1, 2, 3)]
+        order = [(s["destination"]["city"], s["checkin_datetime"][-2:]) for s in SearchScheduler(searches)]
+        assert order == [("a", "01"), ("b", "01"), ("a", "02"), ("b", "02"), ("a", "03"), ("b", "03")]
+
+    def test_rate_limits(self):
+        clock = FakeClock()
+        emitted = []
+        searches = [make_search("a", day) for day in range(1, 5)] + [make_search("b", 10)]
+        scheduler = SearchScheduler(searches, rpm=120, destination_rpm=30, clock=clock, sleep=clock.sleep)
+        for search in scheduler:
+            emitted.append((clock.now, search["destination"]["city"]))
+        # "b" fills the gap while "a" is throttled; "a" is sent every 2 s, never faster than 0.5 s globally
+        assert emitted == [(0, "a"), (0.5, "b"), (2, "a"), (4, "a"), (6, "a")]
+
+    def test_jitter(self):
+        clock = FakeClock()
+        searches = [make_search("a", day) for day in range(1, 4)]
+        scheduler = SearchScheduler(searches, jitter=2, clock=clock, sleep=clock.sleep, rng=random.Random(0))
+        assert len(list(scheduler)) == 3
+        assert 0 < clock.now <= 6
+
+    def test_endless_plan(self):
+        read = []
+
+        def endless():
+            day = 0
+            while True:
+                read.append(day)
+                yield make_search("a" if day % 2 else "b", day % 28 + 1)
+                day += 1
+
+        searches = iter(SearchScheduler(endless(), window=5))
+        first = [next(searches) for _ in range(3)]
+        # Only the window was read ahead of the searches emitted
+        assert len(read) == 5 + 2
+        assert [s["checkin_datetime"] for s in first] == ["2020-07-01", "2020-07-02", "2020-07-03"]
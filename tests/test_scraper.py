@@ -1,14 +1,32 @@
-import pandas as pd
+import shutil
+import pytest
+from hotscrape.standin import StandInSite
+from hotscrape.driver_pool import DriverPool
+from hotscrape.archive import PageArchive
+from hotscrape.metrics import SearchMetrics
 from tests.test_base import *
 
+requires_browser = pytest.mark.skipif(shutil.which("geckodriver") is None, reason="geckodriver not installed")
+
+
 class TestScraper(TestBase):
 
+    @pytest.fixture
+    def scraper(self):
+        site = StandInSite(self.page_html, total=120, page_size=40, loader_delay=0.1)
+        with site.serve() as server:
+            scraper = hs.HotelsScraper()
+            scraper.base_url = server.url
+            yield scraper
+            scraper.close()
+
     def test_url(self):
         
-        search_dict = self.search_dict
+        search_dict = dict(self.search_dict)
+        scraper = hs.HotelsScraper()
 
-        search_dict = hs.ensure_search_format(search_dict)
-        url = hs.generate_url(**search_dict)
+        search_dict = scraper.ensure_search_format(search_dict)
+        url = scraper.generate_url(**search_dict)
         checkin = search_dict["checkin_datetime"].strftime("%Y-%m-%d")
         checkout = search_dict["checkout_datetime"].strftime("%Y-%m-%d")
 
@@ -17,33 +35,209 @@ class TestScraper(TestBase):
                 "f-star-rating=5,4,3,2,1&f-guest-rating-min=1&" \
                     "f-guest-rating-max=9&q-destination=Las%20Vegas,%20Nevada,%20United%20States%20of%20America&" \
                         f"q-check-in={checkin}&q-check-out={checkout}&q-rooms=1&q-room-0-adults=2&q-room-0-children=0"
+        # Incomplete searches resume at the first missing listing
+        assert scraper.generate_url(**search_dict, result_offset=40) == url + "&start-index=40"
 
-    def test_get_soup(self):
+    @requires_browser
+    def test_get_soup(self, scraper):
 
-        search_dict = self.search_dict
-        
-        search_dict = hs.ensure_search_format(search_dict)
-        url = hs.generate_url(**search_dict)
-        soup = hs.get_hotels_page(url, max_scroll=1)
-        assert soup.is_empty_element == False
+        search_dict = scraper.ensure_search_format(dict(self.search_dict))
+        url = scraper.generate_url(**search_dict)
+        with scraper.pool.driver() as driver:
+            page = scraper.get_hotels_page(url, driver, max_scroll=1)
+        assert page
 
-    def test_get_attributes(self):
+    @requires_browser
+    def test_get_attributes(self, scraper):
 
-        search_dict = self.search_dict
-        
-        search_dict = hs.ensure_search_format(search_dict)
-        url = hs.generate_url(**search_dict)
-        soup = hs.get_hotels_page(url, max_scroll=1)
-        res = hs.get_attributes(soup, **search_dict)
+        search_dict = scraper.ensure_search_format(dict(self.search_dict))
+        url = scraper.generate_url(**search_dict)
+        with scraper.pool.driver() as driver:
+            page = scraper.get_hotels_page(url, driver)
+        res = scraper.get_attributes(page, **search_dict)
         assert sum(len(val) for val in res.values()) == len(res) * len(res["name"])
+        # All scroll batches were loaded
+        assert len(res["name"]) == 120
+
+    @requires_browser
+    def test_stream(self, scraper):
+
+        scraper.extraction_mode = "stream"
+        search_dict = scraper.ensure_search_format(dict(self.search_dict))
+        url = scraper.generate_url(**search_dict)
+        with scraper.pool.driver() as driver:
+            res = scraper.get_hotels_page(url, driver)
+            # Harvested cards were emptied, only their placeholders remain
+            assert driver.execute_script("return document.querySelectorAll('h3.p-name').length") == 0
+        assert len(res["name"]) == 120
+        assert len(set(res["name"])) == 120
+
+    @requires_browser
+    def test_parser(self, scraper):
+
+        df_search, df_attributes = scraper.run(dict(self.search_dict))
+        assert df_search.shape[0] == 1
+        assert not df_attributes.empty
+
+
+class TestStandIn(TestBase):
+
+    def test_pages(self):
+        from urllib.request import urlopen
+
+        site = StandInSite(self.page_html, total=7, page_size=3, loader_delay=0)
+        with site.serve() as server:
+            first = urlopen(f"{server.url}/search.do?q-destination=x").read().decode()
+            rest = urlopen(f"{server.url}/listings?offset=3&limit=3").read().decode()
+            full = urlopen(f"{server.url}/search.do?all=1").read().decode()
+            resumed = urlopen(f"{server.url}/search.do?start-index=5").read().decode()
+
+        extract = hs.HotelsScraper.extractor.extract
+        assert extract(first)["name"] == ["Bellagio 0", "Circus Circus 1", "Desert Motel 2"]
+        assert "listings?offset=" in first
+        assert extract(f"<ol>{rest}</ol>")["name"] == ["Bellagio 3", "Circus Circus 4", "Desert Motel 5"]
+        assert len(extract(full)["name"]) == 7
+        assert extract(resumed)["name"] == ["Desert Motel 5", "Bellagio 6"]
+        assert site.requests == 4
+
+
+class TestPartial(TestBase):
+
+    class BrokenEngine():
+        """
+        Scroll engine failing after the first batch of listings was loaded
+        """
+        listing_selector = "h3.p-name"
+
+        def scroll(self, driver, max_scrolls=35, on_batch=None, deadline=None):
+            raise RuntimeError("connection reset")
+
+        def page_state(self, driver):
+            return {"count": 2, "loading": False, "end": False}
+
+    class FakeDriver():
+        capabilities = {}
+        page_source = TestBase.page_html
+
+        def set_page_load_timeout(self, seconds):
+            pass
+
+        def get(self, url):
+            pass
+
+        def execute_script(self, script, *args):
+            return 1
+
+        def delete_all_cookies(self):
+            pass
+
+        def quit(self):
+            pass
+
+    def test_salvage(self):
+        pool = DriverPool(size=1, driver_factory=self.FakeDriver)
+        scraper = hs.HotelsScraper(pool=pool)
+        scraper.scroll_engine = self.BrokenEngine()
+        search_dict, page = scraper.fetch(dict(self.search_dict, result_offset=40))
+        assert page == self.page_html
+        assert search_dict["complete"] == 0
+        assert search_dict["incomplete_reason"] == "scroll_error"
+        assert search_dict["result_offset"] == 40
+        assert search_dict["n_listings"] == 2
+        df_search, df_attributes = scraper.process(search_dict, page)
+        assert df_search["complete"].iloc[0] == 0
+        assert not df_attributes.empty
+        scraper.close()
+        pool.close()
+
+    def test_discard(self):
+        pool = DriverPool(size=1, driver_factory=self.FakeDriver)
+        scraper = hs.HotelsScraper(pool=pool, partial=False)
+        scraper.scroll_engine = self.BrokenEngine()
+        df_search, df_attributes = scraper.run(dict(self.search_dict))
+        assert df_search.empty and df_attributes.empty
+        scraper.close()
+        pool.close()
+
+
+class TestHttpScraper(TestBase):
+
+    class StandInScraper(hs.HttpScraper, hs.HotelsScraper):
+        """
+        Hotels.com cards and urls, fetched as static pages from the stand-in site
+        """
+
+    def test_run(self, tmp_path):
+        site = StandInSite(self.page_html, total=20, page_size=3, paginate=True, page_delay=0.05)
+        with site.serve() as server:
+            scraper = self.StandInScraper(page_workers=4, archive=PageArchive(str(tmp_path)))
+            # No browser machinery
+            assert scraper.pool is None and scraper.watchdog is None
+            scraper.base_url = server.url
+            metrics = SearchMetrics()
+            search_dict, pages = scraper.fetch(dict(self.search_dict), metrics=metrics)
+            stats = scraper.session.stats()
+            scraper.close()
+
+        assert len(pages) == 7
+        names = scraper.get_attributes(pages)["name"]
+        assert names == [f"{name} {i}" for i, name in zip(range(20), ["Bellagio", "Circus Circus", "Desert Motel"] * 7)]
+        assert search_dict["complete"] == 1
+        assert metrics.counters["pages"] == 7
+        assert metrics.counters["requests"] == site.requests == 7
+        # Pages were fetched concurrently over kept-alive connections
+        assert site.max_active > 1
+        assert stats["connections"] <= 4
+
+        df_search, df_attributes = scraper.process(search_dict, pages)
+        assert df_search.shape[0] == 1
+        assert not df_attributes.empty
+        # All pages are archived together and re-parse to the same listings
+        archived = scraper.archive.get(df_search["page_hash"].iloc[0], df_search["page_codec"].iloc[0])
+        assert scraper.get_attributes(archived)["name"] == names
 
-    def test_parser(self):
+    def test_page_error(self):
+        site = StandInSite(self.page_html, total=9, page_size=3, paginate=True)
+        with site.serve() as server:
+            scraper = self.StandInScraper(page_workers=2)
+            scraper.base_url = server.url
+            fetch = scraper._get
+            scraper._get = lambda url: None if "start-index=3" in url else fetch(url)
+            search_dict, pages = scraper.fetch(dict(self.search_dict))
+            scraper.close()
+        assert len(pages) == 2
+        assert search_dict["complete"] == 0
+        assert search_dict["incomplete_reason"] == "page_error"
+        # Resumed from the page that failed
+        assert search_dict["n_listings"] == 3
 
-        search_dict = self.search_dict
+    def test_page_key(self):
+        scraper = self.StandInScraper()
+        assert scraper._page_key("http://site/search.do?start-index=6") == 6
+        assert scraper._page_key("http://site/search.do") == 0
+        # Not an offset: identified by its url
+        assert scraper._page_key("http://site/search.do?start-index=next") == "http://site/search.do?start-index=next"
+        page = '<a class="pagination-link" href="?start-index=next">next</a><a class="pagination-link" href="?start-index=3">2</a>'
+        assert scraper.page_urls(page, "http://site/search.do?start-index=6") == ["http://site/search.do?start-index=next"]
 
-        search_dict = hs.ensure_search_format(search_dict)
-        url = hs.generate_url(**search_dict)
-        soup = hs.get_hotels_page(url, max_scroll=1)
-        res = hs.get_attributes(soup, **search_dict)
+    def test_resume(self):
+        site = StandInSite(self.page_html, total=9, page_size=3, paginate=True)
+        with site.serve() as server:
+            scraper = self.StandInScraper(page_workers=2)
+            scraper.base_url = server.url
+            search_dict, pages = scraper.fetch(dict(self.search_dict, result_offset=3))
+            scraper.close()
+        # Only the pages from the resumed offset on
+        assert scraper.get_attributes(pages)["name"][0] == "Bellagio 3"
+        assert len(pages) == 2
+        assert search_dict["result_offset"] == 3
 
-        df_search, df_attributes = hs.get_dfs(search_dict, res)
\ No newline at end of file
+    def test_bookings_url(self):
+        scraper = hs.BookingsScraper()
+        search_dict = scraper.ensure_search_format(dict(self.search_dict))
+        url = scraper.generate_url(**search_dict)
+        scraper.close()
+        assert url.startswith("https://www.booking.com/searchresults.html?")
+        assert "checkin_month=6&checkin_monthday=30&checkin_year=2020&checkout_month=7&checkout_monthday=1" in url
+        assert "ss=Las%20Vegas" in url
+        assert scraper.generate_url(**search_dict, result_offset=25) == url + "&offset=25"
@@ -0,0 +1,69 @@
+from hotscrape.scroll import ScrollEngine, SCROLL_JS
+
+
+class FakePage():
+    """
+    Simulates an infinite scroll page: every scroll loads `batch` more listings
+    (after `delay` polls with the loader shown) until `total` listings are on the page.
+    """
+
+    def __init__(self, total, batch=10, delay=2, end_marker=True):
+        self.total = total
+        self.batch = batch
+        self.delay = delay
+        self.end_marker = end_marker
+        self.count = batch
+        self.pending = None
+        self.scrolls = 0
+
+    def execute_script(self, script, *args):
+        if script == SCROLL_JS:
+            self.scrolls += 1
+            if self.count < self.total:
+                self.pending = self.delay
+            return None
+        loading = False
+        if self.pending is not None:
+            if self.pending == 0:
+                self.count = min(self.count + self.batch, self.total)
+                self.pending = None
+            else:
+                self.pending -= 1
+                loading = True
+        end = self.end_marker and self.count >= self.total
+        return {"count": self.count, "loading": loading, "end": end}
+
+
+class TestScroll():
+
+    def test_end_of_results(self):
+        page = FakePage(total=45)
+        res = ScrollEngine(poll_frequency=0.001).scroll(page)
+        assert res.listings == 45
+        assert res.reason == "end_of_results"
+        assert page.scrolls == 4
+
+    def test_stable_without_end_marker(self):
+        page = FakePage(total=30, end_marker=False)
+        res = ScrollEngine(poll_frequency=0.001, idle=0.01).scroll(page)
+        assert res.listings == 30
+        assert res.reason == "stable"
+
+    def test_on_batch(self):
+        page = FakePage(total=45)
+        counts = []
+        ScrollEngine(poll_frequency=0.001).scroll(page, on_batch=lambda driver: counts.append(driver.count))
+        assert counts == [10, 20, 30, 40, 45]
+
+    def test_max_scrolls(self):
+        page = FakePage(total=1000)
+        res = ScrollEngine(poll_frequency=0.001).scroll(page, max_scrolls=3)
+        assert res.listings == 40
+        assert res.reason == "max_scrolls"
+
+    def test_deadline(self):
+        # Every scroll takes ~0.02 s to deliver, the deadline stops the phase early
+        page = FakePage(total=1000, delay=20)
+        res = ScrollEngine(poll_frequency=0.001).scroll(page, deadline=0.05)
+        assert res.reason == "deadline"
+        assert 10 <= res.listings < 1000
@@ -1,21 +1,99 @@
 from hotscrape import sql
+from hotscrape.checkpoint import RunCheckpoint
+from hotscrape.store import store_results
 from tests.test_base import *
 
 class TestSQL(TestBase):
 
-    def test_db_upsert(self):
+    def test_db_upsert(self, tmp_path):
 
-        search_dict = self.search_dict
+        search_dict = dict(self.search_dict)
         schema = self.schema
+        scraper = hs.HotelsScraper()
 
-        search_dict_ = hs.ensure_search_format(search_dict)
-        url = hs.generate_url(**search_dict_)
-        soup = hs.get_hotels_page(url, max_scroll=1)
-        res = hs.get_attributes(soup, **search_dict_)
+        search_dict_ = scraper.ensure_search_format(search_dict)
+        res = scraper.get_attributes(self.page_html, **search_dict_)
 
-        df_search, df_attributes = hs.get_dfs(search_dict_, res)
-        conn = sql.create_database("./test_sql", schema)
+        df_search, df_attributes = scraper.get_dfs(search_dict_, res)
+        conn = sql.create_database(str(tmp_path / "test_sql"), schema)
 
         sql.to_sql(df_search, "search", conn)
         sql.to_sql(df_attributes, "hotels", conn)
 
+    def test_bulk_upsert(self, tmp_path):
+
+        df_search, df_attributes = self.get_dfs()
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+
+        assert sql.to_sql(df_search, "search", conn) == (1, 0)
+        assert sql.to_sql(df_attributes, "hotels", conn) == (2, 0)
+        # Re-inserting the same rows is a no-op
+        assert sql.to_sql(df_attributes, "hotels", conn) == (0, 2)
+        assert conn.execute("SELECT COUNT(*) FROM hotels").scalar() == 2
+        checkin = conn.execute("SELECT checkin_datetime FROM search").scalar()
+        assert checkin.startswith("2020-06-30")
+
+    def test_indexes_and_pragmas(self, tmp_path):
+
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        assert conn.execute("PRAGMA journal_mode").scalar() == "wal"
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(search)")}
+        assert "ix_search_city_checkin_datetime" in indexes
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(hotels)")}
+        assert "ix_hotels_search_id" in indexes
+
+        conn.close()
+
+        # Indexes declared later are added to existing databases
+        schema = dict(self.schema)
+        schema["hotels"] = [{"meta": dict(schema["hotels"][0]["meta"], indexes=["search_id", ["name", "address"]])},
+                            schema["hotels"][1]]
+        conn = sql.create_database(str(tmp_path / "test_sql"), schema, profile="safe")
+        assert conn.execute("PRAGMA synchronous").scalar() == 2
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(hotels)")}
+        assert "ix_hotels_name_address" in indexes
+
+    def test_transaction_batch(self, tmp_path):
+
+        df_search, df_attributes = self.get_dfs()
+        path = str(tmp_path / "test_sql")
+        conn = sql.create_database(path, self.schema)
+        reader = sql.create_connection(path)
+
+        with sql.TransactionBatch(conn, size=2) as batch:
+            sql.to_sql(df_search, "search", conn)
+            batch.step()
+            # Not committed until the batch is full
+            assert reader.execute("SELECT COUNT(*) FROM search").scalar() == 0
+            sql.to_sql(df_attributes, "hotels", conn)
+            batch.step()
+            assert reader.execute("SELECT COUNT(*) FROM hotels").scalar() == 2
+
+    def test_batch_failed_write(self, tmp_path):
+
+        # The second of three searches cannot be written, only its own writes are rolled back
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        checkpoint = RunCheckpoint.start(conn, [{"city": "Las Vegas"}])
+        stored = []
+        with sql.TransactionBatch(conn, size=3) as batch:
+            for day in (1, 2, 3):
+                df_search, df_attributes = self.get_dfs(dict(self.search_dict, checkin_datetime=f"2020-07-0{day}"))
+                if day == 2:
+                    df_attributes["amenities"] = object()
+                stored.append(store_results(df_search, df_attributes, conn, batch=batch, checkpoint=checkpoint))
+        assert stored == [True, False, True]
+        assert conn.execute("SELECT COUNT(*) FROM search").scalar() == 2
+        assert conn.execute("SELECT COUNT(*) FROM hotels").scalar() == 2 * len(df_attributes)
+        assert len(checkpoint.completed()) == 2
+
+    def test_add_missing_columns(self, tmp_path):
+
+        schema = dict(self.schema)
+        columns = {key: val for key, val in schema["search"][1]["columns"].items() if key != "page_hash"}
+        schema["search"] = [schema["search"][0], {"columns": columns}]
+        conn = sql.create_database(str(tmp_path / "test_sql"), schema)
+        conn.close()
+
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(search)")}
+        assert "page_hash" in columns
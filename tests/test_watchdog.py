@@ -0,0 +1,151 @@
+import threading
+import pytest
+from selenium.common.exceptions import TimeoutException
+from hotscrape.driver_pool import DriverPool
+from hotscrape.scraper import HotelsScraper
+from hotscrape.metrics import SearchMetrics
+from hotscrape.watchdog import Deadlines, SearchTimeout, Watchdog
+from tests.test_base import TestBase
+
+
+class FakeClock():
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class HangingDriver():
+    """
+    Browser whose page load never returns until it is killed.
+    """
+
+    def __init__(self):
+        self.killed = threading.Event()
+        self.quit_called = False
+        self.capabilities = {}
+
+    def set_page_load_timeout(self, seconds):
+        pass
+
+    def get(self, url):
+        if url != "about:blank":
+            self.killed.wait(10)
+            raise RuntimeError("browser killed")
+
+    def execute_script(self, script, *args):
+        if self.killed.is_set():
+            raise RuntimeError("browser killed")
+        return 1
+
+    def delete_all_cookies(self):
+        pass
+
+    def quit(self):
+        self.quit_called = True
+
+
+class SlowLoadingDriver(HangingDriver):
+
+    def get(self, url):
+        if url != "about:blank":
+            raise TimeoutException("page load timeout")
+
+
+class HangingResetDriver(HangingDriver):
+    """
+    Browser that loads pages but hangs when its cookies are cleared, until it is killed.
+    """
+
+    def get(self, url):
+        pass
+
+    def delete_all_cookies(self):
+        self.killed.wait(10)
+        raise RuntimeError("browser killed")
+
+
+class TestWatchdog(TestBase):
+
+    def test_check(self):
+        clock = FakeClock()
+        killed = []
+        watchdog = Watchdog(poll=None, kill=killed.append, clock=clock)
+        with watchdog.watch(10) as slow, watchdog.watch(None) as unlimited:
+            slow.attach("driver-1")
+            unlimited.attach("driver-2")
+            clock.now = 9
+            assert watchdog.check() == 0
+            clock.now = 10
+            assert watchdog.check() == 1
+            clock.now = 100
+            assert watchdog.check() == 0
+        assert killed == ["driver-1"]
+        assert slow.expired and not unlimited.expired
+
+    def test_disarm(self):
+        clock = FakeClock()
+        killed = []
+        watchdog = Watchdog(poll=None, kill=killed.append, clock=clock)
+        with watchdog.watch(10) as watch:
+            watch.attach("driver-1")
+            # Released to the pool before its deadline passed
+            watch.disarm()
+            clock.now = 10
+            assert watchdog.check() == 0
+        assert not killed and not watch.expired
+
+    def test_release_deadline(self):
+        # The reset of a returned browser hangs, the deadline still applies
+        watchdog = Watchdog(poll=0.01, kill=lambda driver: driver.killed.set())
+        pool = DriverPool(size=1, driver_factory=HangingResetDriver)
+        pooled = pool.acquire()
+        with watchdog.watch(0.1) as watch:
+            watch.attach(pooled.driver)
+            pool.release(pooled, handover=watch.disarm)
+        assert watch.expired and pooled.driver.quit_called
+        pool.close()
+        # Expired after the reset: not handed over
+        clock = FakeClock()
+        watchdog = Watchdog(poll=None, kill=lambda driver: None, clock=clock)
+        pool = DriverPool(size=1, driver_factory=HangingDriver)
+        pooled = pool.acquire()
+        with watchdog.watch(10) as watch:
+            watch.attach(pooled.driver)
+            clock.now = 10
+            watchdog.check()
+            pool.release(pooled, handover=watch.disarm)
+        assert pooled.driver.quit_called
+        watchdog.close()
+        pool.close()
+
+    def test_total_deadline(self):
+        pool = DriverPool(size=1, driver_factory=HangingDriver)
+        hs = HotelsScraper(pool=pool, deadlines=Deadlines(total=0.1))
+        hs.watchdog = Watchdog(poll=0.01, kill=lambda driver: driver.killed.set())
+        metrics = SearchMetrics()
+        with pytest.raises(SearchTimeout) as error:
+            hs.fetch(dict(self.search_dict), metrics=metrics)
+        assert error.value.reason == "total_deadline"
+        assert metrics.timeout_reason == "total_deadline"
+        # The killed browser was not returned to the pool
+        with pool.driver() as driver:
+            assert not driver.killed.is_set()
+        hs.close()
+        pool.close()
+
+    def test_navigate_timeout(self):
+        drivers = []
+        pool = DriverPool(size=1, driver_factory=lambda: drivers.append(SlowLoadingDriver()) or drivers[-1])
+        hs = HotelsScraper(pool=pool)
+        with pytest.raises(SearchTimeout) as error:
+            hs.fetch(dict(self.search_dict))
+        assert error.value.reason == "navigate_timeout"
+        # The browser is replaced rather than reused
+        assert drivers[0].quit_called
+        with pool.driver() as driver:
+            assert driver is not drivers[0]
+        hs.close()
+        pool.close()
@@ -0,0 +1,112 @@
+import pandas as pd
+from hotscrape import sql
+from hotscrape.metrics import SearchMetrics
+from hotscrape.search_parser import Search
+from hotscrape.work_queue import WorkQueue, drain, _dumps_df, _loads_df
+from tests.test_base import *
+
+
+class RecordedScraper(hs.HotelsScraper):
+    """
+    Serves the fixture page instead of driving a browser, the second search fails
+    """
+
+    def run(self, search, metrics=None):
+        if search["checkin_datetime"] == self.failing:
+            raise RuntimeError("Navigation failed")
+        search_dict = self.ensure_search_format(search)
+        search_dict["search_datetime"] = pd.Timestamp("2020-06-01 12:00:00")
+        return self.process(search_dict, TestBase.page_html, metrics=metrics)
+
+
+class TestWorkQueue(TestBase):
+
+    config = {"city": "Las Vegas", "state": "Nevada", "country": "United States of America",
+              "checkin_datetime": "2020-07-01", "search_span": "3"}
+
+    def searches(self):
+        return [s.to_dict() for s in Search.generate(self.config)]
+
+    def test_leases(self, tmp_path):
+        path = str(tmp_path / "queue")
+        queue = WorkQueue(path, owner="a")
+        assert queue.enqueue(self.searches()) == 3
+        # Enqueueing the same plan again adds nothing
+        assert queue.enqueue(self.searches()) == 0
+
+        first = queue.claim()
+        assert first.search["checkin_datetime"] == pd.Timestamp("2020-07-01")
+        other = WorkQueue(path, owner="b")
+        second = other.claim()
+        assert second.id != first.id
+
+        other.fail(second, "timeout")
+        assert queue.stats()["pending"] == 2
+        assert queue.stats()["leased"] == 1
+
+    def test_lease_expiry(self, tmp_path):
+        path = str(tmp_path / "queue")
+        crashed = WorkQueue(path, owner="crashed", visibility_timeout=-1, max_attempts=2)
+        crashed.enqueue(self.searches()[:1])
+        item = crashed.claim()
+
+        # The lease of the crashed worker expired, another worker takes over
+        worker = WorkQueue(path, owner="worker", visibility_timeout=-1, max_attempts=2)
+        retry = worker.claim()
+        assert retry.id == item.id
+        assert retry.attempts == 2
+        # A late result of the lost lease is neither recorded as a failure nor pushed
+        crashed.fail(item, "late")
+        df_search, df_attributes = self.get_dfs(dict(item.search))
+        assert crashed.complete(item, df_search, df_attributes) is False
+        assert worker.stats()["leased"] == 1
+        assert worker.stats()["unmerged"] == 0
+        # Out of attempts
+        assert worker.claim() is None
+        assert worker.stats()["failed"] == 1
+
+    def test_drain_and_results(self, tmp_path):
+        path = str(tmp_path / "queue")
+        queue = WorkQueue(path, max_attempts=1)
+        searches = self.searches()
+        queue.enqueue(searches)
+        scraper = RecordedScraper(pool=object())
+        scraper.failing = searches[1]["checkin_datetime"]
+        assert drain(queue, scraper) == (2, 1)
+        assert queue.stats() == {"pending": 0, "leased": 0, "done": 2, "failed": 1, "unmerged": 2}
+
+        results = queue.results()
+        assert len(results) == 2
+        result_id, df_search, df_attributes, metrics = results[0]
+        assert df_search["checkin_datetime"].iloc[0] == pd.Timestamp("2020-07-01")
+        assert df_search["search_datetime"].iloc[0] == pd.Timestamp("2020-06-01 12:00:00")
+        assert isinstance(metrics, SearchMetrics) and "parse" in metrics.timings
+        # Paging past a result that is not merged
+        assert [result[0] for result in queue.results(after=result_id)] == [results[1][0]]
+
+        conn = sql.create_database(str(tmp_path / "test_sql"), self.schema)
+        for _, df_search, df_attributes, _ in results:
+            sql.to_sql(df_search, "search", conn)
+            sql.to_sql(df_attributes, "hotels", conn)
+        queue.mark_merged([result[0] for result in results])
+        assert queue.stats()["unmerged"] == 0
+        assert conn.execute("SELECT COUNT(*) FROM search").scalar() == 2
+        assert conn.execute("SELECT COUNT(*) FROM hotels").scalar() == 4
+
+    def test_serialization(self):
+        # Missing values come back as NaN where the scraper has None, compare them as None
+        missing_as_none = lambda df: df.astype(object).where(df.notna(), None)
+        for df in self.get_dfs():
+            pd.testing.assert_frame_equal(missing_as_none(_loads_df(_dumps_df(df))), missing_as_none(df), check_dtype=False)
+
+    def test_incomplete_requeued(self, tmp_path):
+        queue = WorkQueue(str(tmp_path / "queue"))
+        queue.enqueue(self.searches()[:1])
+        item = queue.claim()
+        df_search, df_attributes = self.get_dfs(dict(item.search))
+        assert queue.complete(item, df_search, df_attributes, resume_from=40)
+        # The rest of the results is queued again
+        retry = queue.claim()
+        assert retry.id == item.id
+        assert retry.search["result_offset"] == 40
+        assert retry.attempts == 1
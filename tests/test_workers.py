@@ -0,0 +1,52 @@
+import os
+import pandas as pd
+from hotscrape import workers
+from hotscrape.scraper import HotelsScraper
+
+
+def fake_run(self, search, metrics=None):
+    if search["n"] == 3:
+        raise RuntimeError("Scroll error")
+    return pd.DataFrame({"n": [search["n"]]}), pd.DataFrame({"n": [search["n"]] * 2})
+
+
+def crashing_run(self, search, metrics=None):
+    if search["n"] == 3:
+        # Takes the worker process down, like the OOM killer would
+        os._exit(1)
+    return pd.DataFrame({"n": [search["n"]]}), pd.DataFrame({"n": [search["n"]] * 2})
+
+
+class TestWorkers():
+
+    def test_run_parallel(self, monkeypatch):
+        # Worker processes are forked and inherit the patched scraper
+        monkeypatch.setattr(HotelsScraper, "run", fake_run)
+        results = []
+        n_failed, n_not_stored = workers.run_parallel(({"n": i} for i in range(6)),
+                                                      lambda df_search, df_attributes, metrics: results.append(df_search["n"][0]),
+                                                      workers=2)
+        assert (n_failed, n_not_stored) == (1, 0)
+        assert sorted(results) == [0, 1, 2, 4, 5]
+
+    def test_store_failures(self, monkeypatch):
+        monkeypatch.setattr(HotelsScraper, "run", fake_run)
+
+        def on_result(df_search, df_attributes, metrics):
+            if df_search["n"][0] == 4:
+                raise RuntimeError("Database locked")
+            return df_search["n"][0] != 5
+
+        n_failed, n_not_stored = workers.run_parallel(({"n": i} for i in range(6)), on_result, workers=2)
+        # Scraping failures and store failures are counted apart
+        assert (n_failed, n_not_stored) == (1, 2)
+
+    def test_worker_crash(self, monkeypatch):
+        monkeypatch.setattr(HotelsScraper, "run", crashing_run)
+        results = []
+        n_failed, _ = workers.run_parallel(({"n": i} for i in range(8)),
+                                           lambda df_search, df_attributes, metrics: results.append(df_search["n"][0]),
+                                           workers=4)
+        # Only the search that killed its worker is lost, the others in flight are rerun
+        assert n_failed == 1
+        assert sorted(results) == [0, 1, 2, 4, 5, 6, 7]